@@ -0,0 +1,127 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+
+from sidecar import read_json, write_json
+
+
+class AnalysisCache:
+    """Two-tier cache for Gemini meal analyses: bounded in-process JSON text, then Mongo or JSON files"""
+
+    def __init__(self, collection=None, path=None, ttl=7 * 24 * 3600, max_entries=512, max_bytes=16 * 1024 * 1024):
+        self.collection = collection
+        self.path = path if collection is None else None
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.stats = {'memory_hits': 0, 'persistent_hits': 0, 'misses': 0, 'evictions': 0}
+        if self.collection is None and self.path:
+            os.makedirs(self.path, exist_ok=True)
+
+    def ensure_indexes(self):
+        """TTL index that expires persisted entries; part of `flask --app app init-db`"""
+        if self.collection is not None:
+            self.collection.create_index('created_at', expireAfterSeconds=int(self.ttl))
+
+    # ---------- in-process tier ----------
+    def _mem_get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, payload = entry
+            if expires_at < time.time():
+                self._drop(key)
+                return None
+            self._entries.move_to_end(key)
+            return payload
+
+    def _mem_put(self, key, payload, expires_at):
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (expires_at, payload)
+            self._bytes += len(payload)
+            while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+                self._drop(next(iter(self._entries)))
+                self.stats['evictions'] += 1
+
+    def _drop(self, key):
+        _, payload = self._entries.pop(key)
+        self._bytes -= len(payload)
+
+    # ---------- persistent tier ----------
+    def _file_for(self, key):
+        return os.path.join(self.path, key.replace(':', '_') + '.json')
+
+    def _store_get(self, key):
+        if self.collection is not None:
+            doc = self.collection.find_one({'_id': key})
+            if not doc:
+                return None, 0
+            created = doc['created_at']
+            if created.tzinfo is None:
+                created = created.replace(tzinfo=timezone.utc)
+            expires_at = (created + timedelta(seconds=self.ttl)).timestamp()
+            if expires_at < time.time():
+                return None, 0
+            return doc['payload'], expires_at
+        if self.path:
+            doc = read_json(self._file_for(key))
+            if doc is None or doc['expires_at'] < time.time():
+                return None, 0
+            return doc['payload'], doc['expires_at']
+        return None, 0
+
+    def _store_put(self, key, payload):
+        if self.collection is not None:
+            self.collection.replace_one(
+                {'_id': key},
+                {'_id': key, 'payload': payload, 'created_at': datetime.now(timezone.utc)},
+                upsert=True,
+            )
+        elif self.path:
+            write_json(self._file_for(key), {'payload': payload, 'expires_at': time.time() + self.ttl})
+
+    # ---------- public API ----------
+    def get(self, keys):
+        """Return the cached analysis for the first key that hits, or None"""
+        keys = [k for k in keys if k]
+        for key in keys:
+            payload = self._mem_get(key)
+            if payload is not None:
+                self.stats['memory_hits'] += 1
+                return json.loads(payload)
+        for key in keys:
+            try:
+                payload, expires_at = self._store_get(key)
+            except Exception as e:
+                print(f"Analysis cache read failed: {str(e)}")
+                break
+            if payload is not None:
+                self.stats['persistent_hits'] += 1
+                for k in keys:
+                    self._mem_put(k, payload, expires_at)
+                return json.loads(payload)
+        self.stats['misses'] += 1
+        return None
+
+    def put(self, keys, value):
+        payload = json.dumps(value)
+        expires_at = time.time() + self.ttl
+        for key in (k for k in keys if k):
+            self._mem_put(key, payload, expires_at)
+            try:
+                self._store_put(key, payload)
+            except Exception as e:
+                print(f"Analysis cache write failed: {str(e)}")
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.stats, entries=len(self._entries), bytes=self._bytes)
@@ -1,27 +1,65 @@
-from flask import Flask, request, jsonify, send_file
+from flask import Flask, Response, g, request, jsonify, send_file, stream_with_context
 from flask_cors import CORS
-import google.generativeai as genai
+import asyncio
+import click
 import os
-from PIL import Image
-import io
 import base64
+import copy
 import json
 from datetime import datetime, timedelta, timezone
 import uuid
-import csv
+import itertools
+import threading
+import queue
+import shutil
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
+from limits import parse as parse_rate, parse_many as parse_rates
 from dotenv import load_dotenv
-from pymongo import MongoClient
-from pymongo.errors import DuplicateKeyError
-from bson import ObjectId
+from pymongo import MongoClient, ReplaceOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError, WriteError
+from bson import ObjectId, encode as bson_encode
 import gridfs
+from werkzeug.exceptions import HTTPException, RequestEntityTooLarge
 from werkzeug.security import generate_password_hash, check_password_hash
 import jwt
+from analysis_cache import AnalysisCache
+from csv_store import CsvMealStore
+from insights import (INSIGHT_PERIODS, FileInsightStore, InsightScheduler, MongoInsightStore, insight_response,
+                      is_fresh, period_bounds, periods_touched, summarize_insights)
+from imaging import (CONTENT_TYPES, InvalidImageError, colour_signature, content_hash, dhash, make_rendition,
+                     preprocess_image, texture)
+from jobs import JobQueue, QueueFullError
+from model_gate import Coalescer, ModelBusyError, ModelGate
+from meal_io import IMPORT_FORMATS, gzip_chunks, meal_from_row, ndjson_lines, read_rows
+from meal_schema import (NUTRITION_PROJECTION, SCHEMA_VERSION, decode_meal, encode_meal, extra_micronutrient_stages,
+                         insights_document, merge_micronutrients, needs_insights, slot_accumulators, total_expression)
+from metrics import (ANALYSIS_EVENTS, MODEL_QUEUE_SECONDS, RATE_LIMITED, REQUEST_SECONDS, Gauge, MongoTimingListener,
+                     record_timing, registry, server_timing_header, timed)
+from phash_index import FilePhashIndex, MongoPhashIndex
+from nutrition_schema import NutritionInfo, RESPONSE_SCHEMA, fallback_nutrition, parse_nutrition_response, scan_partial
+from providers import make_provider
+import ratelimit_storage  # noqa: F401  registers file:// limiter storage
+from response_cache import FileBackend, MemoryBackend, MongoBackend, ResponseCache
+from rollups import (NUTRITION_TOTAL_KEYS, SERIES_BUCKETS, SERIES_METRICS, FileRollupStore, MongoRollupStore,
+                     bucket_starts, build_rollups, series_from_daily, totals_from_rollups)
+from token_cache import ClaimsCache
 
 # Load environment variables from .env file FIRST
 load_dotenv()
 
+
+def is_truthy(value):
+    """'1' / 'true' / 'yes' (any case): how boolean env settings and query flags are spelled"""
+    return value.lower() in ('1', 'true', 'yes')
+
+
+def env_flag(name, default=''):
+    return is_truthy(os.getenv(name, default))
+
 app = Flask(__name__)
 # CORS: allow local dev and deployed frontend (Vercel)
 allowed_origins = [
@@ -37,44 +75,127 @@ CORS(
     methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"],
 )
 
-# Configure Gemini API
-genai.configure(api_key=os.getenv('GEMINI_API_KEY'))
-model = genai.GenerativeModel('gemini-1.5-flash')
+# Model backend: Gemini by default, MODEL_PROVIDER=fake for a local deterministic stand-in
+model = make_provider()
 
 # In-memory storage for demo (use a database in production)
 nutrition_data = {}
 user_meals = {}
 
-MEALS_CSV = os.path.join(os.path.dirname(__file__), 'meals.csv')
+# Local files (CSV store, caches, sidecars) live here; override for benchmarks or a mounted disk
+DATA_DIR = os.getenv('DATA_DIR', os.path.dirname(__file__))
+MEALS_CSV = os.path.join(DATA_DIR, 'meals.csv')
+csv_store = CsvMealStore(MEALS_CSV)
 
 # Database & Auth configuration
 MONGO_URI = os.getenv('MONGO_URI')
 MONGO_DB_NAME = os.getenv('MONGO_DB_NAME', 'ahaar')
 JWT_SECRET = os.getenv('JWT_SECRET', 'dev-secret')
 
-mongo_client = MongoClient(MONGO_URI) if MONGO_URI else None
+# Pool size and timeouts. connect=False: no server round trip at import, the pool
+# opens on the first query (also keeps forked workers from sharing sockets).
+# Indexes are created by `flask --app app init-db`, not at startup (except the unique email index,
+# which signup creates on first use if init-db has not run).
+MONGO_OPTIONS = {
+    'maxPoolSize': int(os.getenv('MONGO_MAX_POOL_SIZE', 100)),
+    'minPoolSize': int(os.getenv('MONGO_MIN_POOL_SIZE', 0)),
+    'serverSelectionTimeoutMS': int(os.getenv('MONGO_SERVER_SELECTION_TIMEOUT_MS', 5000)),
+    'connectTimeoutMS': int(os.getenv('MONGO_CONNECT_TIMEOUT_MS', 5000)),
+    # 0 = no socket timeout (pymongo default); set it to bound slow queries
+    'socketTimeoutMS': int(os.getenv('MONGO_SOCKET_TIMEOUT_MS', 0)) or None,
+}
+mongo_client = (MongoClient(MONGO_URI, connect=False, event_listeners=[MongoTimingListener()], **MONGO_OPTIONS)
+                if MONGO_URI else None)
 db = mongo_client[MONGO_DB_NAME] if mongo_client is not None else None
 users_col = db['users'] if db is not None else None
 meals_col = db['meals'] if db is not None else None
+# `advanced` insights of compact (schema 2) meals, by meal id; fetched only for responses that show them
+insights_col = db['meal_insights'] if db is not None else None
 fs = gridfs.GridFS(db) if db is not None else None
 
-# Ensure indexes
-if users_col is not None:
-    try:
-        users_col.create_index('email', unique=True)
-    except Exception as _:
-        pass
-if meals_col is not None:
-    try:
-        meals_col.create_index([('user_id', 1), ('timestamp', -1)])
-        meals_col.create_index('id', unique=True)
-    except Exception as _:
-        pass
+# Cache of Gemini analyses keyed by image hash (Mongo collection, or local files without Mongo)
+ANALYSIS_CACHE_DIR = os.path.join(DATA_DIR, 'analysis_cache')
+analysis_cache = AnalysisCache(
+    collection=db['analysis_cache'] if db is not None else None,
+    path=ANALYSIS_CACHE_DIR,
+    ttl=int(os.getenv('ANALYSIS_CACHE_TTL', 7 * 24 * 3600)),
+    max_entries=int(os.getenv('ANALYSIS_CACHE_MAX_ENTRIES', 512)),
+    max_bytes=int(os.getenv('ANALYSIS_CACHE_MAX_BYTES', 16 * 1024 * 1024)),
+)
+
+# Per-user daily nutrition sums, maintained on upload (sidecar JSON next to meals.csv without Mongo)
+ROLLUPS_FILE = os.path.join(DATA_DIR, 'daily_rollups.json')
+rollup_store = MongoRollupStore(db['daily_rollups']) if db is not None else FileRollupStore(ROLLUPS_FILE)
+# Perceptual hashes of recent uploads, for spotting burst shots and re-uploads of the same plate
+# (stored on the meal documents with Mongo, a sidecar JSON under DATA_DIR without)
+NEAR_DUPLICATE_WINDOW_HOURS = float(os.getenv('NEAR_DUPLICATE_WINDOW_HOURS', 12))
+NEAR_DUPLICATE_MAX_DISTANCE = int(os.getenv('NEAR_DUPLICATE_MAX_DISTANCE', 6))
+phash_index = (MongoPhashIndex(meals_col) if db is not None
+               else FilePhashIndex(os.path.join(DATA_DIR, 'phash_index.json'),
+                                   timedelta(hours=NEAR_DUPLICATE_WINDOW_HOURS)))
+# Weekly / monthly insight summaries behind /api/insights (insights.py), marked stale when a meal
+# in their period is saved and recomputed in the background INSIGHTS_REFRESH_DELAY seconds after an
+# upload (or on the next read, with INSIGHTS_BACKGROUND_REFRESH=0 or after an import)
+insight_store = (MongoInsightStore(db['insight_summaries']) if db is not None
+                 else FileInsightStore(os.path.join(DATA_DIR, 'insight_summaries.json')))
+INSIGHTS_BACKGROUND_REFRESH = env_flag('INSIGHTS_BACKGROUND_REFRESH', '1')
+INSIGHTS_REFRESH_DELAY = float(os.getenv('INSIGHTS_REFRESH_DELAY', 5))
+# Serve /api/nutrition totals from rollups; enable once `flask --app app rebuild-rollups` has run
+USE_DAILY_ROLLUPS = env_flag('USE_DAILY_ROLLUPS')
+
+# Storage schema of new Mongo meal documents: 1 keeps the analysis verbatim under `nutrition`, 2 is
+# the compact form in meal_schema.py. Reads handle both; set 2 once every worker runs this version,
+# then convert older meals with `flask --app app migrate-meals`.
+MEAL_SCHEMA_VERSION = int(os.getenv('MEAL_SCHEMA_VERSION', 1))
+
+# Rendered /api/nutrition and /api/meals responses, per user (RESPONSE_CACHE=memory|shared|off).
+# `memory` lives in this process, so it is only correct with a single worker, and writes made by
+# the CLI commands reach it only when its entries expire (RESPONSE_CACHE_TTL); `shared` uses
+# Mongo, or a directory under DATA_DIR as a local stand-in when Mongo is not configured.
+RESPONSE_CACHE = os.getenv('RESPONSE_CACHE', 'memory').lower()
+RESPONSE_CACHE_TTL = int(os.getenv('RESPONSE_CACHE_TTL', 24 * 3600))
+if RESPONSE_CACHE == 'shared':
+    response_cache = ResponseCache(
+        MongoBackend(db, RESPONSE_CACHE_TTL) if db is not None
+        else FileBackend(os.path.join(DATA_DIR, 'response_cache'), RESPONSE_CACHE_TTL))
+elif RESPONSE_CACHE == 'memory':
+    response_cache = ResponseCache(MemoryBackend(int(os.getenv('RESPONSE_CACHE_MAX_ENTRIES', 1024)),
+                                                 ttl=RESPONSE_CACHE_TTL))
+else:
+    response_cache = None
 
 UPLOAD_PASSWORD = os.getenv('UPLOAD_PASSWORD', 'idk991')
 
-# Setup rate limiter
-limiter = Limiter(get_remote_address, app=app)
+# Setup rate limiter. Counters live in this process by default; with several workers point
+# RATE_LIMIT_STORAGE_URI at shared storage (redis://..., mongodb://..., or file:///path for one host)
+RATE_LIMIT_STORAGE_URI = os.getenv('RATE_LIMIT_STORAGE_URI', 'memory://')
+limiter = Limiter(get_remote_address, app=app, storage_uri=RATE_LIMIT_STORAGE_URI)
+
+
+# -------------------- Instrumentation --------------------
+# Adds a Server-Timing header (model_call, image_decode, gridfs_*, mongo, total) to every response
+SERVER_TIMING = env_flag('SERVER_TIMING')
+
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+
+@app.after_request
+def record_request_metrics(response):
+    started = g.pop('request_started', None)
+    if started is None:
+        return response
+    # Streamed bodies (SSE, /api/meals) are timed up to the first byte
+    elapsed = time.perf_counter() - started
+    route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    REQUEST_SECONDS.observe(elapsed, request.method, route, response.status_code)
+    if response.status_code == 429:
+        RATE_LIMITED.inc(route)
+    if SERVER_TIMING:
+        response.headers['Server-Timing'] = server_timing_header(g.get('server_timings', {}), elapsed)
+    return response
 
 
 # -------------------- Auth Helpers --------------------
@@ -94,19 +215,49 @@ def decode_token(token: str):
         return None
 
 
+# Verified claims by token digest, so repeat requests skip the HMAC check and JSON decode
+claims_cache = ClaimsCache(int(os.getenv('TOKEN_CACHE_SIZE', 1024)))
+
+
 def get_auth_user():
     auth_header = request.headers.get('Authorization', '')
     if auth_header.startswith('Bearer '):
         token = auth_header.split(' ', 1)[1]
-        claims = decode_token(token)
+        claims = claims_cache.get(token)
+        if claims is None:
+            claims = decode_token(token)
+            if claims:
+                claims_cache.put(token, claims)
         if claims:
             return claims
     return None
 
-def analyze_food_image(image):
-    """Analyze food image using Gemini and extract nutrition information"""
-    
-    prompt = """
+
+# werkzeug method string including the work factor, e.g. scrypt:16384:8:1 or pbkdf2:sha256:600000.
+# Existing hashes keep verifying; they are re-hashed with the new setting on the next login.
+PASSWORD_HASH_METHOD = os.getenv('PASSWORD_HASH_METHOD', 'scrypt:32768:8:1')
+# Hashing runs on its own small pool (hashlib releases the GIL) so a burst of
+# logins cannot take every CPU away from the rest of the API
+password_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv('PASSWORD_HASH_WORKERS', 2)),
+    thread_name_prefix='password-hash'
+)
+
+
+def hash_password(password):
+    with timed('password_hash'):
+        return password_executor.submit(generate_password_hash, password, method=PASSWORD_HASH_METHOD).result()
+
+
+def verify_password(password_hash, password):
+    with timed('password_hash'):
+        return password_executor.submit(check_password_hash, password_hash, password).result()
+
+
+# Bump whenever ANALYSIS_PROMPT changes so cached analyses from the old prompt are not reused
+PROMPT_VERSION = '2'
+
+ANALYSIS_PROMPT = """
         Analyze this food image and provide detailed nutritional information in JSON format.
 
         Return EXACTLY one JSON object (no markdown), following this structure and units:
@@ -171,89 +322,186 @@ def analyze_food_image(image):
 
         Be concise and use numeric values where specified. If uncertain, provide reasonable estimates.
         """
-    
+
+
+# Images with less grey-level spread than this (blank, flat or dark shots) share dHashes, so they
+# are only cached by content hash
+PERCEPTUAL_KEY_MIN_TEXTURE = float(os.getenv('PERCEPTUAL_KEY_MIN_TEXTURE', 8))
+
+
+def analysis_cache_keys(image, image_bytes=None):
+    """Cache keys for an image: exact content hash first, then perceptual hash plus coarse colours"""
+    keys = []
+    if image_bytes is not None:
+        keys.append(f"sha:{PROMPT_VERSION}:{content_hash(image_bytes)}")
     try:
-        response = model.generate_content([prompt, image])
-        
-        # Extract JSON from response
-        response_text = response.text
-        
-        # Find JSON in the response (sometimes it's wrapped in markdown)
-        start_idx = response_text.find('{')
-        end_idx = response_text.rfind('}') + 1
-        
-        if start_idx != -1 and end_idx != -1:
-            json_str = response_text[start_idx:end_idx]
-            nutrition_info = json.loads(json_str)
-            return nutrition_info
-        else:
-            raise ValueError("No valid JSON found in response")
-            
-    except Exception as e:
-        print(f"Error analyzing image: {str(e)}")
-        # Return default/fallback data
-        return {
-            "food_name": "Unknown Food",
-            "serving_size": "1 serving",
-            "calories": 300,
-            "macronutrients": {
-                "protein": 15,
-                "carbs": 30,
-                "fat": 10,
-                "fiber": 5,
-                "sugar": 8
-            },
-            "micronutrients": {
-                "vitamins": [
-                    {"name": "Vitamin A", "amount": 100, "unit": "μg"},
-                    {"name": "Vitamin C", "amount": 10, "unit": "mg"},
-                    {"name": "Vitamin D", "amount": 2, "unit": "μg"},
-                    {"name": "Vitamin E", "amount": 1, "unit": "mg"},
-                    {"name": "Vitamin K", "amount": 10, "unit": "μg"},
-                    {"name": "Folate", "amount": 40, "unit": "μg"},
-                    {"name": "B12", "amount": 0.5, "unit": "μg"}
-                ],
-                "minerals": [
-                    {"name": "Calcium", "amount": 100, "unit": "mg"},
-                    {"name": "Iron", "amount": 2, "unit": "mg"},
-                    {"name": "Magnesium", "amount": 50, "unit": "mg"},
-                    {"name": "Phosphorus", "amount": 100, "unit": "mg"},
-                    {"name": "Potassium", "amount": 400, "unit": "mg"},
-                    {"name": "Zinc", "amount": 1, "unit": "mg"}
-                ]
-            },
-            "other_nutrients": {
-                "sodium": 200,
-                "cholesterol": 20
-            },
-            "advanced": {
-                "glycemic_index": 55,
-                "glycemic_load": 12,
-                "amino_acid_profile": {"leucine": 1200, "valine": 900, "lysine": 800},
-                "fatty_acids": {
-                    "omega_3": 0.2,
-                    "omega_6": 1.1,
-                    "omega_3_to_6_ratio": 0.18,
-                    "saturated_fat": 3,
-                    "monounsaturated_fat": 4,
-                    "polyunsaturated_fat": 2
-                },
-                "antioxidant_orac": 1500,
-                "meal_health_score": 6.5,
-                "diet_compatibility": ["balanced"],
-                "potential_allergens": [],
-                "deficiency_alerts": ["Low Vitamin D"],
-                "excessive_intake_alerts": [],
-                "workout_energy_match": "Suitable for a light 30-minute jog",
-                "burn_time_equivalents": {"walking_minutes": 60, "jogging_minutes": 30, "cycling_minutes": 25},
-                "environmental": {"carbon_footprint_g_co2": 800, "water_usage_liters": 200, "sourcing": {"local": False, "organic": False}},
-                "historical": {"meal_history_impact": "Occasional", "trend_suggestions": ["Increase greens"], "ai_suggestions": ["Add spinach for iron"]}
-            },
-            "confidence": 50
-        }
+        if texture(image) >= PERCEPTUAL_KEY_MIN_TEXTURE:
+            keys.append(f"dhash:{PROMPT_VERSION}:{dhash(image)}:{colour_signature(image)}")
+    except Exception as _:
+        pass
+    return keys
+
+
+# Schema-constrained JSON output; the prompt still describes units and intent
+ANALYSIS_CONFIG = {
+    'response_mime_type': 'application/json',
+    'response_schema': RESPONSE_SCHEMA,
+}
+# Attempts per image before falling back (one retry on an unparseable or invalid reply)
+ANALYSIS_ATTEMPTS = 2
+analysis_stats = {'model_calls': 0, 'parse_failures': 0, 'retries': 0, 'errors': 0, 'fallbacks': 0,
+                  'duplicate_reuses': 0, 'throttled': 0, 'coalesced': 0}
+_analysis_stats_lock = threading.Lock()
+
+
+def record_model_wait(seconds, outcome):
+    MODEL_QUEUE_SECONDS.observe(seconds, outcome)
+    record_timing('model_queue', seconds)
+
+
+# Model calls: MODEL_MAX_CONCURRENCY at once per worker, MODEL_RATE_LIMIT (e.g. "60 per minute")
+# across all workers via the limiter storage; calls wait up to MODEL_QUEUE_TIMEOUT seconds
+MODEL_RATE_LIMIT = os.getenv('MODEL_RATE_LIMIT')
+model_gate = ModelGate(
+    max_concurrency=int(os.getenv('MODEL_MAX_CONCURRENCY', 4)),
+    rate=parse_rate(MODEL_RATE_LIMIT) if MODEL_RATE_LIMIT else None,
+    strategy=limiter.limiter,
+    timeout=float(os.getenv('MODEL_QUEUE_TIMEOUT', 30)),
+    on_wait=record_model_wait,
+)
+# Concurrent analyses of the same image share one model call
+inflight_analyses = Coalescer()
+
+
+def _count(stat):
+    with _analysis_stats_lock:
+        analysis_stats[stat] += 1
+    ANALYSIS_EVENTS.inc(stat)
+
+
+def _generate_analysis(image, on_partial=None):
+    """One model call; with `on_partial`, stream and report top-level fields as soon as they parse"""
+    with model_gate.slot():
+        return _call_model(image, on_partial)
+
+
+def _call_model(image, on_partial):
+    _count('model_calls')
+    with timed('model_call'):
+        if on_partial is None:
+            return model.generate_content([ANALYSIS_PROMPT, image], generation_config=ANALYSIS_CONFIG).text
+        text = ''
+        seen = {}
+        for chunk in model.generate_content([ANALYSIS_PROMPT, image], generation_config=ANALYSIS_CONFIG, stream=True):
+            text += chunk.text
+            found = scan_partial(text, seen)
+            if found:
+                seen.update(found)
+                on_partial(found)
+        return text
+
+
+def analyze_food_image(image, image_bytes=None, on_partial=None) -> NutritionInfo:
+    """Analyze food image using Gemini and extract nutrition information (`fallback` on failure, or ModelBusyError)"""
+    cache_keys = analysis_cache_keys(image, image_bytes)
+    cached = analysis_cache.get(cache_keys)
+    if cached is not None:
+        return cached
+    if not cache_keys:
+        return _analyze_uncached(image, cache_keys, on_partial)
+    nutrition_info, shared = inflight_analyses.run(
+        cache_keys[0], lambda: _analyze_uncached(image, cache_keys, on_partial))
+    if shared:
+        _count('coalesced')
+        # Callers may annotate their result; don't hand them the same dict
+        return copy.deepcopy(nutrition_info)
+    return nutrition_info
+
+
+def _analyze_uncached(image, cache_keys, on_partial):
+    for attempt in range(ANALYSIS_ATTEMPTS):
+        if attempt:
+            _count('retries')
+        try:
+            # Only stream the first attempt; partial fields already sent would repeat
+            nutrition_info = parse_nutrition_response(_generate_analysis(image, on_partial if attempt == 0 else None))
+        except ModelBusyError:
+            # Overload is the caller's 503, never a placeholder meal
+            _count('throttled')
+            raise
+        except Exception as e:
+            if _attempt_failed(e, attempt):
+                continue
+            break
+        analysis_cache.put(cache_keys, nutrition_info)
+        return nutrition_info
+    _count('fallbacks')
+    return fallback_nutrition()
+
+
+def _attempt_failed(e, attempt):
+    """Count a failed analysis attempt; True if another attempt may succeed"""
+    if isinstance(e, ValueError):
+        _count('parse_failures')
+        print(f"Unusable analysis (attempt {attempt + 1}): {str(e)}")
+        return True
+    _count('errors')
+    print(f"Error analyzing image: {str(e)}")
+    return False
+
+
+async def analyze_food_image_async(image, image_bytes=None) -> NutritionInfo:
+    """analyze_food_image for asgi_native: the model call is awaited, hashing and cache reads run on threads"""
+    cache_keys = await asyncio.to_thread(analysis_cache_keys, image, image_bytes)
+    cached = await asyncio.to_thread(analysis_cache.get, cache_keys)
+    if cached is not None:
+        return cached
+    if not cache_keys:
+        return await _analyze_uncached_async(image, cache_keys)
+    nutrition_info, shared = await inflight_analyses.run_async(
+        cache_keys[0], lambda: _analyze_uncached_async(image, cache_keys))
+    if shared:
+        _count('coalesced')
+        return copy.deepcopy(nutrition_info)
+    return nutrition_info
+
+
+async def _analyze_uncached_async(image, cache_keys):
+    for attempt in range(ANALYSIS_ATTEMPTS):
+        if attempt:
+            _count('retries')
+        try:
+            async with model_gate.async_slot():
+                _count('model_calls')
+                with timed('model_call'):
+                    reply = await model.generate_content_async([ANALYSIS_PROMPT, image],
+                                                               generation_config=ANALYSIS_CONFIG)
+            nutrition_info = parse_nutrition_response(reply.text)
+        except ModelBusyError:
+            _count('throttled')
+            raise
+        except Exception as e:
+            if _attempt_failed(e, attempt):
+                continue
+            break
+        await asyncio.to_thread(analysis_cache.put, cache_keys, nutrition_info)
+        return nutrition_info
+    _count('fallbacks')
+    return fallback_nutrition()
 
 
 # -------------------- Auth Routes --------------------
+# Whether this process has made sure of the unique email index signup's 409 relies on
+users_index_ready = False
+
+
+def ensure_users_index():
+    global users_index_ready
+    if not users_index_ready:
+        users_col.create_index('email', unique=True)
+        users_index_ready = True
+
+
 @app.route('/api/auth/signup', methods=['POST'])
 def signup():
     if users_col is None:
@@ -265,7 +513,8 @@ def signup():
     if not email or not password:
         return jsonify({'error': 'Email and password required'}), 400
     try:
-        hashed = generate_password_hash(password)
+        ensure_users_index()
+        hashed = hash_password(password)
         res = users_col.insert_one({
             'email': email,
             'password_hash': hashed,
@@ -287,289 +536,1364 @@ def login():
     email = (data.get('email') or '').strip().lower()
     password = data.get('password') or ''
     user = users_col.find_one({'email': email})
-    if not user or not check_password_hash(user.get('password_hash', ''), password):
+    if not user or not verify_password(user.get('password_hash', ''), password):
         return jsonify({'error': 'Invalid credentials'}), 401
     user_id = str(user['_id'])
+    if not user['password_hash'].startswith(PASSWORD_HASH_METHOD + '$'):
+        users_col.update_one({'_id': user['_id']}, {'$set': {'password_hash': hash_password(password)}})
     token = create_token(user_id, email)
     return jsonify({'token': token, 'user': {'id': user_id, 'email': email, 'name': user.get('name', '')}})
 
-def read_meals_from_csv():
-    meals = []
-    if not os.path.exists(MEALS_CSV):
-        return meals
-    with open(MEALS_CSV, newline='', encoding='utf-8') as csvfile:
-        reader = csv.DictReader(csvfile)
-        for row in reader:
-            # Parse nutrition JSON
-            nutrition = json.loads(row['nutrition_json']) if row.get('nutrition_json') else {}
-            meal = {
-                'id': row['id'],
-                'user_id': row['user_id'],
-                'date': row['date'],
-                'time': row['time'],
-                'name': row['name'],
-                'calories': int(row['calories']),
-                'nutrition': nutrition,
-                'timestamp': row['timestamp']
-            }
-            meals.append(meal)
-    return meals
+def read_meals_from_csv(user_id=None, start=None, end=None):
+    """Meals from the CSV store; filtering by user (and date range) only decodes matching rows"""
+    if user_id is None:
+        return list(csv_store.iter_all())
+    return csv_store.find(user_id, start=start, end=end)
 
 def append_meal_to_csv(meal):
-    file_exists = os.path.exists(MEALS_CSV)
-    with open(MEALS_CSV, 'a', newline='', encoding='utf-8') as csvfile:
-        fieldnames = ['id', 'user_id', 'date', 'time', 'name', 'calories', 'nutrition_json', 'timestamp']
-        writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-        if not file_exists:
-            writer.writeheader()
-        writer.writerow({
-            'id': meal['id'],
-            'user_id': meal['user_id'],
-            'date': meal['date'],
-            'time': meal['time'],
-            'name': meal['name'],
-            'calories': meal['calories'],
-            'nutrition_json': json.dumps(meal['nutrition']),
-            'timestamp': meal['timestamp']
-        })
+    csv_store.append(meal)
+
+# Uploads are downscaled and re-encoded before analysis and storage
+IMAGE_MAX_EDGE = int(os.getenv('IMAGE_MAX_EDGE', 1280))
+IMAGE_FORMAT = os.getenv('IMAGE_FORMAT', 'JPEG').upper()
+IMAGE_QUALITY = int(os.getenv('IMAGE_QUALITY', 85))
+KEEP_ORIGINAL_UPLOADS = env_flag('KEEP_ORIGINAL_UPLOADS')
+# Named sizes served by /api/meal-image (longest edge in px); 'full' is the stored upload
+IMAGE_RENDITIONS = {'thumb': 256, 'medium': 640}
+RENDITIONS_ON_UPLOAD = env_flag('RENDITIONS_ON_UPLOAD')
+IMAGE_CACHE_MAX_AGE = int(os.getenv('IMAGE_CACHE_MAX_AGE', 30 * 24 * 3600))
+# Whole request bodies above this get a 413 before they are read (a /upload-meals batch counts once)
+app.config['MAX_CONTENT_LENGTH'] = int(os.getenv('MAX_CONTENT_LENGTH', 32 * 1024 * 1024))
+# Each upload is copied into a spool that rolls over to a temp file past this size,
+# so queued jobs and batches don't pin full-size originals in memory
+UPLOAD_SPOOL_BYTES = int(os.getenv('UPLOAD_SPOOL_BYTES', 1024 * 1024))
+
+
+@app.errorhandler(RequestEntityTooLarge)
+def request_too_large(e):
+    return jsonify({'error': f"Request body exceeds {app.config['MAX_CONTENT_LENGTH']} bytes"}), 413
+
+
+def prepare_upload_image(upload):
+    """Normalize the upload once; returns (PIL image, encoded bytes)"""
+    if 'image_bytes' not in upload:
+        with timed('image_decode'):
+            image, data = preprocess_image(upload['original'], IMAGE_MAX_EDGE, IMAGE_FORMAT, IMAGE_QUALITY)
+        upload['pil_image'] = image
+        upload['image_bytes'] = data
+        upload['phash'] = dhash(image)
+        if not KEEP_ORIGINAL_UPLOADS:
+            # The original is no longer needed; don't keep it alive in queued jobs
+            release_original(upload)
+    return upload['pil_image'], upload['image_bytes']
+
+
+def release_original(upload):
+    if upload.get('original') is not None:
+        upload['original'].close()
+        upload['original'] = None
+
+
+def store_meal_image(upload):
+    """Put the normalized upload into GridFS and return the meal's `image` sub-document"""
+    _, data = prepare_upload_image(upload)
+    stem, filename, content_type = image_file_meta(upload)
+    with timed('gridfs_put'):
+        grid_id = fs.put(data, filename=filename, content_type=content_type)
+    image_info = {
+        'file_id': str(grid_id),
+        'filename': filename,
+        'content_type': content_type,
+        'size': len(data)
+    }
+    if KEEP_ORIGINAL_UPLOADS and upload['original'] is not None:
+        upload['original'].seek(0)
+        with timed('gridfs_put'):
+            # GridFS reads the spool one chunk at a time
+            original_id = fs.put(
+                upload['original'],
+                filename=upload['filename'] or f"{upload['meal_id']}.jpg",
+                content_type=upload['content_type'] or 'application/octet-stream'
+            )
+        image_info['original_file_id'] = str(original_id)
+        image_info['original_size'] = upload['original_size']
+        release_original(upload)
+    if RENDITIONS_ON_UPLOAD:
+        image, _ = prepare_upload_image(upload)
+        image_info['renditions'] = {
+            name: put_rendition(make_rendition(image, edge, IMAGE_FORMAT, IMAGE_QUALITY), stem, name)
+            for name, edge in IMAGE_RENDITIONS.items()
+        }
+    return image_info
+
+
+def image_file_meta(upload):
+    """(stem, GridFS filename, content type) of an upload's normalized image"""
+    stem = os.path.splitext(upload['filename'] or upload['meal_id'])[0]
+    return stem, f"{stem}.{IMAGE_FORMAT.lower()}", CONTENT_TYPES.get(IMAGE_FORMAT, 'application/octet-stream')
+
+
+def put_rendition(data, stem, name):
+    content_type = CONTENT_TYPES.get(IMAGE_FORMAT, 'application/octet-stream')
+    with timed('gridfs_put'):
+        grid_id = fs.put(data, filename=f"{stem}_{name}.{IMAGE_FORMAT.lower()}", content_type=content_type)
+    return {'file_id': str(grid_id), 'content_type': content_type, 'size': len(data)}
+
+
+def new_upload(file, user_id, meal_time, date_str):
+    """Everything the pipeline needs about one uploaded image, spooled so it outlives the request"""
+    spool = tempfile.SpooledTemporaryFile(max_size=UPLOAD_SPOOL_BYTES)
+    shutil.copyfileobj(file.stream, spool, 64 * 1024)
+    size = spool.tell()
+    spool.seek(0)
+    return {
+        'original': spool,
+        'original_size': size,
+        'meal_id': str(uuid.uuid4()),
+        'user_id': user_id,
+        'meal_time': meal_time,
+        'date': date_str,
+        'filename': file.filename,
+        'content_type': file.content_type,
+    }
+
+
+# What to do when an upload looks like a recent meal: `analyze` it anyway (no lookup),
+# `reuse` the earlier meal's analysis and image, or `reject` it with 409 so the client can choose
+DUPLICATE_POLICIES = ('analyze', 'reuse', 'reject')
+NEAR_DUPLICATE_POLICY = os.getenv('NEAR_DUPLICATE_POLICY', 'analyze').lower()
+
+
+class DuplicateMealError(Exception):
+    def __init__(self, matches):
+        super().__init__('Looks like a meal uploaded in the last '
+                         f'{NEAR_DUPLICATE_WINDOW_HOURS:g} hours; resend with on_duplicate=reuse or analyze')
+        self.matches = matches
+
+
+def duplicate_policy():
+    """The request's `on_duplicate` (or the default); None if it is not a known policy"""
+    policy = (request.args.get('on_duplicate') or request.form.get('on_duplicate') or NEAR_DUPLICATE_POLICY).lower()
+    return policy if policy in DUPLICATE_POLICIES else None
+
+
+def bad_duplicate_policy():
+    return jsonify({'error': f"on_duplicate must be one of {', '.join(DUPLICATE_POLICIES)}"}), 400
+
+
+def find_near_duplicates(upload):
+    """The user's recent meals whose image hash is within NEAR_DUPLICATE_MAX_DISTANCE bits of this one"""
+    prepare_upload_image(upload)
+    since = datetime.now() - timedelta(hours=NEAR_DUPLICATE_WINDOW_HOURS)
+    with timed('duplicate_lookup'):
+        matches = phash_index.find(upload['user_id'], upload['phash'], since, NEAR_DUPLICATE_MAX_DISTANCE)
+    return [{k: m.get(k) for k in ('id', 'name', 'date', 'time', 'timestamp', 'distance')} for m in matches]
+
+
+def load_meal(user_id, meal_id, date):
+    if meals_col is not None:
+        meal = meals_col.find_one({'id': meal_id, 'user_id': user_id}, {'_id': 0})
+        return next(with_nutrition([meal]), None) if meal else None
+    return next((m for m in csv_store.scan(user_id, start=date, end=date) if m['id'] == meal_id), None)
+
+
+def reuse_meal(upload, matches):
+    """Meal record copied from the closest earlier meal with a real analysis (sharing its GridFS image), or None"""
+    for match in matches:
+        earlier = load_meal(upload['user_id'], match['id'], match['date'])
+        if not earlier or (earlier.get('nutrition') or {}).get('fallback'):
+            continue
+        if earlier.get('image'):
+            upload['image'] = earlier['image']
+        _count('duplicate_reuses')
+        return {
+            'id': upload['meal_id'],
+            'user_id': upload['user_id'],
+            'name': earlier['name'],
+            'time': upload['meal_time'],
+            'date': upload['date'],
+            'calories': earlier['calories'],
+            'nutrition': earlier['nutrition'],
+            'timestamp': datetime.now().isoformat(),
+            'duplicate_of': earlier['id']
+        }
+    return None
+
+
+def analyze_upload(upload, on_partial=None):
+    """Run the model on an upload and build its meal record (nothing is persisted)"""
+    image, image_bytes = prepare_upload_image(upload)
+    policy = upload.get('on_duplicate', 'analyze')
+    if policy != 'analyze':
+        matches = find_near_duplicates(upload)
+        if matches and policy == 'reject':
+            raise DuplicateMealError(matches)
+        meal_record = reuse_meal(upload, matches) if matches else None
+        if meal_record is not None:
+            return meal_record
+    return meal_record_for(upload, analyze_food_image(image, image_bytes, on_partial=on_partial))
+
+
+def meal_record_for(upload, nutrition_info):
+    return {
+        'id': upload['meal_id'],
+        'user_id': upload['user_id'],
+        'name': nutrition_info['food_name'],
+        'time': upload['meal_time'],
+        'date': upload['date'],
+        'calories': nutrition_info['calories'],
+        'nutrition': nutrition_info,
+        'timestamp': datetime.now().isoformat()
+    }
+
+
+def save_meals(analyzed):
+    """Persist [(upload, meal_record), ...]; returns {index: error} for meals that failed to save"""
+    errors = {}
+    # Store images and meals in Mongo if configured
+    if meals_col is not None and fs is not None:
+        images = [upload.get('image') or store_meal_image(upload) for upload, _ in analyzed]
+        docs, insights = storage_documents(
+            meal_document(upload, meal_record, image_info)
+            for (upload, meal_record), image_info in zip(analyzed, images))
+        save_insights(insights)
+        if len(docs) == 1:
+            try:
+                meals_col.insert_one(docs[0])
+            except WriteError:
+                delete_unsaved_images(analyzed, images, [0])
+                raise
+        elif docs:
+            try:
+                meals_col.insert_many(docs, ordered=False)
+            except BulkWriteError as e:
+                for err in e.details.get('writeErrors', []):
+                    errors[err['index']] = err.get('errmsg', 'Write failed')
+                delete_unsaved_images(analyzed, images, errors)
+    else:
+        csv_store.append_many([meal_record for _, meal_record in analyzed])
+    after_meals_saved(analyzed, errors)
+    return errors
+
+
+def delete_unsaved_images(analyzed, images, indexes):
+    """Remove the GridFS files stored for meals that were rejected by the insert (best effort)"""
+    for i in indexes:
+        # A reused meal points at the earlier meal's files, which stay
+        if 'duplicate_of' in analyzed[i][1]:
+            continue
+        image_info = images[i]
+        file_ids = [image_info['file_id'], image_info.get('original_file_id')]
+        file_ids += [r['file_id'] for r in (image_info.get('renditions') or {}).values()]
+        for file_id in filter(None, file_ids):
+            try:
+                fs.delete(ObjectId(file_id))
+            except Exception as e:
+                print(f"Failed to delete image of an unsaved meal: {str(e)}")
+
+
+def meal_document(upload, meal_record, image_info):
+    """What is stored in Mongo for a meal: the record plus its image and hash fields"""
+    meal_doc = dict(meal_record, image=image_info)
+    if upload.get('phash'):
+        meal_doc.update(phash_index.fields(upload['phash']))
+    return meal_doc
+
+
+def storage_documents(meals):
+    """(meal documents, insights documents) to insert for `meals` under MEAL_SCHEMA_VERSION"""
+    if MEAL_SCHEMA_VERSION < SCHEMA_VERSION:
+        return list(meals), []
+    docs, insights = [], []
+    for meal in meals:
+        doc, advanced = encode_meal(meal)
+        docs.append(doc)
+        if advanced is not None:
+            insights.append(insights_document(doc, advanced))
+    return docs, insights
+
+
+def insights_writes(insights):
+    # Keyed by meal id and written before the meals, so a retried save just overwrites them
+    return [ReplaceOne({'_id': d['_id']}, d, upsert=True) for d in insights]
+
+
+def save_insights(insights):
+    if insights:
+        insights_col.bulk_write(insights_writes(insights), ordered=False)
+
+
+def load_insights(meals):
+    """{meal id: advanced} for the compact meals among `meals` that have insights"""
+    ids = [m['id'] for m in meals if needs_insights(m)]
+    if not ids or insights_col is None:
+        return {}
+    return {d['_id']: d['advanced'] for d in insights_col.find({'_id': {'$in': ids}})}
+
+
+def with_nutrition(meals, insights=True, chunk_size=200):
+    """Stored meals (either schema, or CSV rows) with `nutrition` decoded; `insights` also fetches `advanced`"""
+    meals = iter(meals)
+    while chunk := list(itertools.islice(meals, chunk_size)):
+        advanced = load_insights(chunk) if insights else {}
+        for meal in chunk:
+            yield decode_meal(meal, advanced.get(meal.get('id')))
+
+
+def after_meals_saved(analyzed, errors):
+    """Update the data derived from saved meals (rollups, hash index, insights, response versions)"""
+    for i, (upload, meal_record) in enumerate(analyzed):
+        if i in errors:
+            continue
+        try:
+            rollup_store.add_meal(meal_record['user_id'], meal_record['date'], meal_record['nutrition'])
+        except Exception as e:
+            # Rollups are derived data; a rebuild fixes them, so don't fail the upload
+            print(f"Failed to update daily rollup: {str(e)}")
+        if upload.get('phash'):
+            try:
+                phash_index.add(meal_record, upload['phash'])
+            except Exception as e:
+                print(f"Failed to index image hash: {str(e)}")
+    saved = [meal for i, (_, meal) in enumerate(analyzed) if i not in errors]
+    mark_insights_stale(saved, refresh=INSIGHTS_BACKGROUND_REFRESH)
+    bump_response_versions(saved)
+
+
+def bump_response_versions(meals):
+    """Invalidate cached /api/nutrition and /api/meals views covering these meals' dates"""
+    if response_cache is None:
+        return
+    touched = {}
+    for meal in meals:
+        touched.setdefault(meal['user_id'], set()).add(meal['date'])
+    for user_id, dates in touched.items():
+        try:
+            response_cache.bump(user_id, dates)
+        except Exception as e:
+            print(f"Failed to bump response cache version: {str(e)}")
+
+
+def mark_insights_stale(meals, refresh=False):
+    """Mark the insight summaries covering these meals' dates stale; `refresh` queues their recomputation"""
+    touched = {}
+    for meal in meals:
+        touched.setdefault(meal['user_id'], set()).add(meal['date'])
+    for user_id, dates in touched.items():
+        keys = periods_touched(dates)
+        try:
+            insight_store.mark_stale(user_id, keys)
+        except Exception as e:
+            print(f"Failed to mark insight summaries stale: {str(e)}")
+            continue
+        if refresh:
+            insight_scheduler.schedule(user_id, keys)
+
+
+def process_meal_upload(upload, on_partial=None):
+    """Analyze an upload and persist the meal; shared by sync requests and background jobs"""
+    meal_record = analyze_upload(upload, on_partial)
+    save_meals([(upload, meal_record)])
+    return meal_record
+
+
+# Background analysis for `async=1` uploads
+upload_jobs = JobQueue(
+    process_meal_upload,
+    workers=int(os.getenv('UPLOAD_WORKERS', 2)),
+    max_queue=int(os.getenv('UPLOAD_QUEUE_SIZE', 32)),
+    collection=db['upload_jobs'] if db is not None else None,
+)
+ASYNC_UPLOADS_DEFAULT = env_flag('ASYNC_UPLOADS')
+
+
+def wants_async_upload():
+    flag = request.args.get('async', request.form.get('async'))
+    if flag is None:
+        return ASYNC_UPLOADS_DEFAULT
+    return is_truthy(flag)
+
+
+# Single and batch uploads share one budget that counts images, not requests
+UPLOAD_RATE_LIMIT = os.getenv('UPLOAD_RATE_LIMIT', '5 per minute')
+upload_rate_limit = limiter.shared_limit(
+    UPLOAD_RATE_LIMIT,
+    scope='meal-upload',
+    cost=lambda: max(len(request.files.getlist('image')), 1)
+)
+
+
+@upload_rate_limit
+def check_upload_rate_limit():
+    """Charge the request to the upload budget (raises 429) outside a decorated view (asgi_native)"""
+
+
+# A batch is charged one unit per image, so it may not cost more than the smallest window allows
+MAX_BATCH_IMAGES = min(int(os.getenv('MAX_BATCH_IMAGES', 10)),
+                       *(rate.amount for rate in parse_rates(UPLOAD_RATE_LIMIT)))
+
+
+@app.before_request
+def reject_oversized_batch():
+    # Runs before the route's rate limit, so an oversized batch is a 400 and charges nothing
+    if request.endpoint == 'upload_meals' and len(request.files.getlist('image')) > MAX_BATCH_IMAGES:
+        return jsonify({'error': f'At most {MAX_BATCH_IMAGES} images per request'}), 400
+
+
+# Bounds concurrent model calls across batch and streaming requests in this worker
+batch_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv('BATCH_ANALYSIS_CONCURRENCY', 4)),
+    thread_name_prefix='meal-batch'
+)
+
+
+def upload_from_request():
+    """(upload, None) for the request's image, or (None, error response)"""
+    claims = get_auth_user()
+    password = request.form.get('password') if not claims else None
+    if claims is None and password != UPLOAD_PASSWORD:
+        return None, (jsonify({'error': 'Unauthorized'}), 401)
+    if 'image' not in request.files:
+        return None, (jsonify({'error': 'No image file provided'}), 400)
+    file = request.files['image']
+    if file.filename == '':
+        return None, (jsonify({'error': 'No file selected'}), 400)
+    meal_time = request.form.get('meal_time', datetime.now().strftime('%H:%M'))
+    date_str = request.form.get('date', datetime.now().strftime('%Y-%m-%d'))
+    user_id = (claims.get('user_id') if claims else request.form.get('user_id', 'default_user'))
+    policy = duplicate_policy()
+    if policy is None:
+        return None, bad_duplicate_policy()
+    return dict(new_upload(file, user_id, meal_time, date_str), on_duplicate=policy), None
+
 
 @app.route('/api/upload-meal', methods=['POST'])
-@limiter.limit('5 per minute')
+@upload_rate_limit
 def upload_meal():
     """Upload and analyze a meal image (password required)"""
+    try:
+        upload, error = upload_from_request()
+        if error is not None:
+            return error
+        return dispatch_upload(upload)
+    except Exception as e:
+        return upload_error_response(e)
+
+
+def dispatch_upload(upload):
+    """Queue, stream or process an upload as the request asks"""
+    if wants_async_upload():
+        # Store the image up front so only analysis is left to the worker
+        # (unless the worker may reuse an earlier meal's image instead)
+        if meals_col is not None and fs is not None and upload['on_duplicate'] == 'analyze':
+            upload['image'] = store_meal_image(upload)
+        try:
+            job = upload_jobs.submit(upload['user_id'], upload)
+        except QueueFullError as e:
+            return jsonify({'error': str(e)}), 503, {'Retry-After': '5'}
+        return jsonify({
+            'success': True,
+            'job_id': job['id'],
+            'status': job['status'],
+            'status_url': f"/api/jobs/{job['id']}"
+        }), 202
+    if wants_streaming_upload():
+        return stream_meal_upload(upload)
+    meal_record = process_meal_upload(upload)
+    return jsonify(upload_result(meal_record))
+
+
+def upload_error_response(e):
+    if isinstance(e, DuplicateMealError):
+        return jsonify({'error': str(e), 'near_duplicates': e.matches}), 409
+    if isinstance(e, InvalidImageError):
+        return jsonify({'error': str(e)}), 400
+    if isinstance(e, ModelBusyError):
+        return jsonify({'error': str(e)}), 503, {'Retry-After': '5'}
+    if isinstance(e, HTTPException):
+        raise e
+    return jsonify({'error': str(e)}), 500
+
+
+def upload_result(meal_record):
+    return {
+        'success': True,
+        'meal': meal_record,
+        'nutrition': meal_record['nutrition'],
+        # Placeholder nutrition from a failed analysis is flagged, never passed off as real
+        'fallback': bool(meal_record['nutrition'].get('fallback')),
+        'reused': 'duplicate_of' in meal_record
+    }
+
+
+def wants_streaming_upload():
+    flag = request.args.get('stream', request.form.get('stream'))
+    if flag is not None:
+        return is_truthy(flag)
+    return request.accept_mimetypes.best == 'text/event-stream'
+
+
+def stream_meal_upload(upload):
+    """Server-sent events: `partial` as food_name/calories parse, then `meal` (or `error`)"""
+    events = queue.Queue()
+
+    def run():
+        try:
+            meal_record = process_meal_upload(upload, on_partial=lambda fields: events.put(('partial', fields)))
+            events.put(('meal', upload_result(meal_record)))
+        except Exception as e:
+            events.put(('error', {'error': str(e)}))
+        events.put(None)
+
+    batch_executor.submit(run)
+
+    def generate():
+        while True:
+            try:
+                item = events.get(timeout=15)
+            except queue.Empty:
+                yield ': keep-alive\n\n'
+                continue
+            if item is None:
+                return
+            event, data = item
+            yield f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+    return Response(generate(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+@app.route('/api/upload-meals', methods=['POST'])
+@upload_rate_limit
+def upload_meals():
+    """Upload and analyze several meal images in one request (multiple `image` parts)"""
     try:
         claims = get_auth_user()
         password = request.form.get('password') if not claims else None
         if claims is None and password != UPLOAD_PASSWORD:
             return jsonify({'error': 'Unauthorized'}), 401
-        if 'image' not in request.files:
-            return jsonify({'error': 'No image file provided'}), 400
-        file = request.files['image']
-        if file.filename == '':
-            return jsonify({'error': 'No file selected'}), 400
-        meal_time = request.form.get('meal_time', datetime.now().strftime('%H:%M'))
-        date_str = request.form.get('date', datetime.now().strftime('%Y-%m-%d'))
+        files = [f for f in request.files.getlist('image') if f.filename]
+        if not files:
+            return jsonify({'error': 'No image files provided'}), 400
         user_id = (claims.get('user_id') if claims else request.form.get('user_id', 'default_user'))
-        # Read file bytes once
-        fbytes = file.read()
-        image = Image.open(io.BytesIO(fbytes))
-        nutrition_info = analyze_food_image(image)
-        meal_id = str(uuid.uuid4())
-        meal_record = {
-            'id': meal_id,
-            'user_id': user_id,
-            'name': nutrition_info['food_name'],
-            'time': meal_time,
-            'date': date_str,
-            'calories': nutrition_info['calories'],
-            'nutrition': nutrition_info,
-            'timestamp': datetime.now().isoformat()
-        }
-        # Store image and meal in Mongo if configured
-        if meals_col is not None and fs is not None:
-            grid_id = fs.put(
-                fbytes,
-                filename=file.filename or f"{meal_id}.jpg",
-                content_type=file.content_type or 'application/octet-stream'
-            )
-            meal_doc = dict(meal_record)
-            meal_doc['image'] = {
-                'file_id': str(grid_id),
-                'filename': file.filename,
-                'content_type': file.content_type,
-                'size': len(fbytes)
-            }
-            meals_col.insert_one(meal_doc)
-        else:
-            append_meal_to_csv(meal_record)
+        # meal_time/date may be given once for all images or once per image
+        times = request.form.getlist('meal_time')
+        dates = request.form.getlist('date')
+        now = datetime.now()
+        policy = duplicate_policy()
+        if policy is None:
+            return bad_duplicate_policy()
+        uploads = []
+        for i, file in enumerate(files):
+            meal_time = times[i] if len(times) == len(files) else (times[0] if times else now.strftime('%H:%M'))
+            date_str = dates[i] if len(dates) == len(files) else (dates[0] if dates else now.strftime('%Y-%m-%d'))
+            uploads.append(dict(new_upload(file, user_id, meal_time, date_str), on_duplicate=policy))
+
+        results = [None] * len(uploads)
+        analyzed = []
+        throttled = False
+        futures = [batch_executor.submit(analyze_upload, upload) for upload in uploads]
+        for i, future in enumerate(futures):
+            try:
+                analyzed.append((i, uploads[i], future.result()))
+            except Exception as e:
+                results[i] = {'index': i, 'filename': uploads[i]['filename'], 'success': False, 'error': str(e)}
+                if isinstance(e, DuplicateMealError):
+                    results[i]['near_duplicates'] = e.matches
+                throttled = throttled or isinstance(e, ModelBusyError)
+        save_errors = save_meals([(upload, meal_record) for _, upload, meal_record in analyzed])
+        for j, (i, upload, meal_record) in enumerate(analyzed):
+            if j in save_errors:
+                results[i] = {'index': i, 'filename': upload['filename'], 'success': False, 'error': save_errors[j]}
+            else:
+                results[i] = dict(upload_result(meal_record), index=i, filename=upload['filename'])
+        failed = sum(1 for r in results if not r['success'])
+        # Images the model gate turned away were not saved; they can be sent again
+        headers = {'Retry-After': '5'} if throttled else {}
         return jsonify({
-            'success': True,
-            'meal': meal_record,
-            'nutrition': nutrition_info
-        })
+            'success': failed == 0,
+            'uploaded': len(results) - failed,
+            'failed': failed,
+            'results': results
+        }), headers
+    except HTTPException:
+        raise
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_upload_job(job_id):
+    """Status of a background upload; `?wait=<seconds>` long-polls until it finishes"""
+    try:
+        wait = min(max(float(request.args.get('wait', 0)), 0), 30)
+        job = upload_jobs.get(job_id, wait=wait)
+        if job is None:
+            return jsonify({'error': 'Job not found'}), 404
+        body = {'id': job['id'], 'status': job['status']}
+        if job['status'] == 'done':
+            body.update(upload_result(job['result']))
+        elif job['status'] == 'failed':
+            body['error'] = job['error']
+        return jsonify(body)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+def meal_summary(meal):
+    return {
+        'id': meal.get('id', ''),
+        'name': meal.get('name', ''),
+        'time': meal.get('time', ''),
+        'calories': meal.get('calories', 0),
+        'imageUrl': f"/api/meal-image/{meal.get('id', '')}",
+        'nutrition': meal.get('nutrition', {})
+    }
+
+
+def aggregate_nutrition(meals_src, user_id, start, end):
+    """Sum nutrition over raw meal dicts in Python (CSV path; reference for the Mongo pipeline)"""
+    total_nutrition = {
+        'calories': 0,
+        'protein': 0,
+        'carbs': 0,
+        'fat': 0,
+        'fiber': 0,
+        'sugar': 0,
+        'sodium': 0,
+        'cholesterol': 0,
+        'vitamins': {},
+        'minerals': {},
+        'meals': []
+    }
+    for meal in meals_src:
+        if meal.get('user_id') != user_id:
+            continue
+        if not start <= meal.get('date', '') <= end:
+            continue
+        nutrition = meal.get('nutrition', {})
+        # Add macronutrients
+        total_nutrition['calories'] += nutrition.get('calories', 0)
+        macro = nutrition.get('macronutrients', {})
+        total_nutrition['protein'] += macro.get('protein', 0)
+        total_nutrition['carbs'] += macro.get('carbs', 0)
+        total_nutrition['fat'] += macro.get('fat', 0)
+        total_nutrition['fiber'] += macro.get('fiber', 0)
+        total_nutrition['sugar'] += macro.get('sugar', 0)
+        # Add other nutrients
+        other = nutrition.get('other_nutrients', {})
+        total_nutrition['sodium'] += other.get('sodium', 0)
+        total_nutrition['cholesterol'] += other.get('cholesterol', 0)
+        # Add vitamins
+        for vitamin in nutrition.get('micronutrients', {}).get('vitamins', []):
+            name = vitamin['name']
+            if name not in total_nutrition['vitamins']:
+                total_nutrition['vitamins'][name] = {'amount': 0, 'unit': vitamin['unit']}
+            total_nutrition['vitamins'][name]['amount'] += vitamin['amount']
+        # Add minerals
+        for mineral in nutrition.get('micronutrients', {}).get('minerals', []):
+            name = mineral['name']
+            if name not in total_nutrition['minerals']:
+                total_nutrition['minerals'][name] = {'amount': 0, 'unit': mineral['unit']}
+            total_nutrition['minerals'][name]['amount'] += mineral['amount']
+        # Add meal to list
+        total_nutrition['meals'].append(meal_summary(meal))
+    # Convert vitamins and minerals to list format
+    vitamins_list = [{'name': name, 'amount': data['amount'], 'unit': data['unit']} 
+                    for name, data in total_nutrition['vitamins'].items()]
+    minerals_list = [{'name': name, 'amount': data['amount'], 'unit': data['unit']} 
+                    for name, data in total_nutrition['minerals'].items()]
+    result = {
+        'calories': total_nutrition['calories'],
+        'protein': total_nutrition['protein'],
+        'carbs': total_nutrition['carbs'],
+        'fat': total_nutrition['fat'],
+        'fiber': total_nutrition['fiber'],
+        'sugar': total_nutrition['sugar'],
+        'sodium': total_nutrition['sodium'],
+        'cholesterol': total_nutrition['cholesterol'],
+        'vitamins': vitamins_list,
+        'minerals': minerals_list,
+        'meals': total_nutrition['meals']
+    }
+    return result
+
+
+def _sum_micronutrients(field):
+    # One row per nutrient name: amounts summed, unit and order from its first occurrence
+    path = f'$nutrition.micronutrients.{field}'
+    return [
+        {'$unwind': {'path': path, 'includeArrayIndex': 'idx'}},
+        {'$group': {
+            '_id': f'{path}.name',
+            'amount': {'$sum': f'{path}.amount'},
+            'unit': {'$first': f'{path}.unit'},
+            'first_meal': {'$first': '$_id'},
+            'first_idx': {'$first': '$idx'}
+        }},
+        {'$sort': {'first_meal': 1, 'first_idx': 1}}
+    ]
+
+
+# Each NUTRITION_TOTAL_KEYS value of a meal document, in either storage schema
+NUTRITION_TOTAL_PATHS = {key: total_expression(key, path) for key, path in {
+    'calories': '$nutrition.calories',
+    'protein': '$nutrition.macronutrients.protein',
+    'carbs': '$nutrition.macronutrients.carbs',
+    'fat': '$nutrition.macronutrients.fat',
+    'fiber': '$nutrition.macronutrients.fiber',
+    'sugar': '$nutrition.macronutrients.sugar',
+    'sodium': '$nutrition.other_nutrients.sodium',
+    'cholesterol': '$nutrition.other_nutrients.cholesterol',
+}.items()}
+
+
+def nutrition_pipeline(user_id, start, end):
+    q = {'user_id': user_id, 'date': {'$gte': start, '$lte': end}}
+    return [
+        {'$match': q},
+        {'$sort': {'_id': 1}},
+        {'$facet': {
+            # Compact meals' dictionary nutrients are summed slot by slot here, without an $unwind
+            'totals': [{'$group': dict(
+                {key: {'$sum': path} for key, path in NUTRITION_TOTAL_PATHS.items()},
+                **slot_accumulators('vitamins'), **slot_accumulators('minerals'), _id=None)}],
+            'vitamins': _sum_micronutrients('vitamins'),
+            'minerals': _sum_micronutrients('minerals'),
+            'extra_vitamins': extra_micronutrient_stages('vitamins'),
+            'extra_minerals': extra_micronutrient_stages('minerals')
+        }}
+    ]
+
+
+def nutrition_from_facets(agg):
+    """Totals, vitamins and minerals from the nutrition_pipeline() result document"""
+    totals = (agg.get('totals') or [{}])[0]
+    result = {key: totals.get(key, 0) for key in NUTRITION_TOTAL_KEYS}
+    for field in ('vitamins', 'minerals'):
+        result[field] = merge_micronutrients(field, totals, agg.get(field, []), agg.get(f'extra_{field}', []))
+    return result
+
+
+def aggregate_nutrition_mongo(user_id, start, end):
+    """Same result as aggregate_nutrition, with the sums computed by MongoDB"""
+    result = nutrition_from_facets(next(meals_col.aggregate(nutrition_pipeline(user_id, start, end)), {}))
+    result['meals'] = fetch_meal_summaries(user_id, start, end)
+    return result
+
+
+# Only the fields the /api/nutrition `meals` list needs; image info, timestamps etc. stay on the server
+MEAL_SUMMARY_PROJECTION = dict(NUTRITION_PROJECTION, _id=0, id=1, time=1)
+
+
+def fetch_meal_summaries(user_id, start, end):
+    """The `meals` list of the /api/nutrition response"""
+    if meals_col is None:
+        return [meal_summary(m) for m in read_meals_from_csv(user_id, start, end)]
+    q = {'user_id': user_id, 'date': {'$gte': start, '$lte': end}}
+    return [meal_summary(m) for m in with_nutrition(meals_col.find(q, MEAL_SUMMARY_PROJECTION).sort('_id', 1))]
+
+
+# Longest custom start_date..end_date span /api/nutrition will total; /series buckets longer ones
+MAX_NUTRITION_RANGE_DAYS = int(os.getenv('MAX_NUTRITION_RANGE_DAYS', 366))
+
+
+def nutrition_window(period):
+    """(start, end) datetimes of the request's period, from `date` or `start_date`/`end_date`"""
+    date_param = request.args.get('date')
+    start_date = request.args.get('start_date')
+    end_date = request.args.get('end_date')
+    if not date_param and not (start_date and end_date):
+        date_param = datetime.now().strftime('%Y-%m-%d')
+    # Calculate date range based on period
+    if period == 'daily':
+        start = end = datetime.strptime(date_param, '%Y-%m-%d')
+    elif period in ('weekly', 'monthly') and start_date and end_date:
+        start = datetime.strptime(start_date, '%Y-%m-%d')
+        end = datetime.strptime(end_date, '%Y-%m-%d')
+    elif period == 'weekly':
+        target_date = datetime.strptime(date_param, '%Y-%m-%d')
+        start = target_date - timedelta(days=target_date.weekday())
+        end = start + timedelta(days=6)
+    elif period == 'monthly':
+        target_date = datetime.strptime(date_param, '%Y-%m-%d')
+        start = target_date.replace(day=1)
+        if start.month == 12:
+            end = start.replace(year=start.year + 1, month=1) - timedelta(days=1)
+        else:
+            end = start.replace(month=start.month + 1) - timedelta(days=1)
+    else:
+        raise ValueError(f"Unknown period '{period}'")
+    return start, end
+
+
+def nutrition_range_too_long(user_id):
+    return jsonify({'error': f'Ranges are limited to {MAX_NUTRITION_RANGE_DAYS} days; '
+                             f'use /api/nutrition/{user_id}/series for longer spans'}), 400
+
+
 @app.route('/api/nutrition/<user_id>/<period>', methods=['GET'])
 def get_nutrition_data(user_id, period):
     """Get aggregated nutrition data for a specific period (MongoDB preferred, CSV fallback)"""
     try:
-        date_param = request.args.get('date')
-        start_date = request.args.get('start_date')
-        end_date = request.args.get('end_date')
-        if not date_param and not (start_date and end_date):
-            date_param = datetime.now().strftime('%Y-%m-%d')
-        # Calculate date range based on period
-        if period == 'daily':
-            target_date = datetime.strptime(date_param, '%Y-%m-%d')
-            dates_to_include = [target_date.strftime('%Y-%m-%d')]
-        elif period == 'weekly':
-            if start_date and end_date:
-                start = datetime.strptime(start_date, '%Y-%m-%d')
-                end = datetime.strptime(end_date, '%Y-%m-%d')
-            else:
-                target_date = datetime.strptime(date_param, '%Y-%m-%d')
-                start = target_date - timedelta(days=target_date.weekday())
-                end = start + timedelta(days=6)
-            dates_to_include = []
-            current = start
-            
-            # if end_date > :
-
-            while current <= end:
-                dates_to_include.append(current.strftime('%Y-%m-%d'))
-                current += timedelta(days=1)
-        elif period == 'monthly':
-            if start_date and end_date:
-                start = datetime.strptime(start_date, '%Y-%m-%d')
-                end = datetime.strptime(end_date, '%Y-%m-%d')
+        start, end = nutrition_window(period)
+        if (end - start).days >= MAX_NUTRITION_RANGE_DAYS:
+            return nutrition_range_too_long(user_id)
+        # Everything below is an inclusive (user_id, date) range scan, so cost follows
+        # the number of meals found rather than the number of days spanned
+        first, last = start.strftime('%Y-%m-%d'), end.strftime('%Y-%m-%d')
+
+        def build():
+            if USE_DAILY_ROLLUPS:
+                result = totals_from_rollups(rollup_store.get(user_id, first, last))
+                result['meals'] = fetch_meal_summaries(user_id, first, last)
+            elif meals_col is not None:
+                result = aggregate_nutrition_mongo(user_id, first, last)
             else:
-                target_date = datetime.strptime(date_param, '%Y-%m-%d')
-                start = target_date.replace(day=1)
-                if start.month == 12:
-                    end = start.replace(year=start.year + 1, month=1) - timedelta(days=1)
-                else:
-                    end = start.replace(month=start.month + 1) - timedelta(days=1)
-            dates_to_include = []
-            current = start
-            while current <= end:
-                dates_to_include.append(current.strftime('%Y-%m-%d'))
-                current += timedelta(days=1)
-        # Fetch meals from MongoDB or CSV fallback
-        meals_src = []
-        if meals_col is not None:
-            q = {'user_id': user_id, 'date': {'$in': dates_to_include}}
-            meals_src = list(meals_col.find(q))
-            # Normalize docs
-            for m in meals_src:
-                m.setdefault('nutrition', {})
-        else:
-            meals_src = read_meals_from_csv()
-        total_nutrition = {
-            'calories': 0,
-            'protein': 0,
-            'carbs': 0,
-            'fat': 0,
-            'fiber': 0,
-            'sugar': 0,
-            'sodium': 0,
-            'cholesterol': 0,
-            'vitamins': {},
-            'minerals': {},
-            'meals': []
-        }
-        for meal in meals_src:
-            if meal.get('user_id') != user_id:
-                continue
-            if meal.get('date') not in dates_to_include:
-                continue
-            nutrition = meal.get('nutrition', {})
-            # Add macronutrients
-            total_nutrition['calories'] += nutrition.get('calories', 0)
-            macro = nutrition.get('macronutrients', {})
-            total_nutrition['protein'] += macro.get('protein', 0)
-            total_nutrition['carbs'] += macro.get('carbs', 0)
-            total_nutrition['fat'] += macro.get('fat', 0)
-            total_nutrition['fiber'] += macro.get('fiber', 0)
-            total_nutrition['sugar'] += macro.get('sugar', 0)
-            # Add other nutrients
-            other = nutrition.get('other_nutrients', {})
-            total_nutrition['sodium'] += other.get('sodium', 0)
-            total_nutrition['cholesterol'] += other.get('cholesterol', 0)
-            # Add vitamins
-            for vitamin in nutrition.get('micronutrients', {}).get('vitamins', []):
-                name = vitamin['name']
-                if name not in total_nutrition['vitamins']:
-                    total_nutrition['vitamins'][name] = {'amount': 0, 'unit': vitamin['unit']}
-                total_nutrition['vitamins'][name]['amount'] += vitamin['amount']
-            # Add minerals
-            for mineral in nutrition.get('micronutrients', {}).get('minerals', []):
-                name = mineral['name']
-                if name not in total_nutrition['minerals']:
-                    total_nutrition['minerals'][name] = {'amount': 0, 'unit': mineral['unit']}
-                total_nutrition['minerals'][name]['amount'] += mineral['amount']
-            # Add meal to list
-            total_nutrition['meals'].append({
-                'id': meal.get('id', ''),
-                'name': meal.get('name', ''),
-                'time': meal.get('time', ''),
-                'calories': meal.get('calories', 0),
-                'imageUrl': f"/api/meal-image/{meal.get('id', '')}",
-                'nutrition': meal.get('nutrition', {})
+                result = aggregate_nutrition(read_meals_from_csv(user_id, first, last), user_id, first, last)
+            return jsonify(result)
+
+        return cached_response(user_id, 'nutrition', {'period': period, 'dates': [first, last]}, first, last, build)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+SERIES_DEFAULT_METRICS = ('calories', 'protein', 'carbs', 'fat')
+SERIES_DEFAULT_DAYS = 30
+MAX_SERIES_BUCKETS = int(os.getenv('MAX_SERIES_BUCKETS', 1000))
+
+
+def daily_totals(user_id, start, end, metrics):
+    """Per-day sums of `metrics` for a user in [start, end], from one grouped pass"""
+    if USE_DAILY_ROLLUPS:
+        return rollup_store.get(user_id, start.isoformat(), end.isoformat())
+    if meals_col is not None:
+        group = {'_id': '$date'}
+        group.update({m: {'$sum': 1 if m == 'meals' else NUTRITION_TOTAL_PATHS[m]} for m in metrics})
+        pipeline = [
+            {'$match': {'user_id': user_id, 'date': {'$gte': start.isoformat(), '$lte': end.isoformat()}}},
+            {'$group': group},
+        ]
+        return [dict(row, date=row['_id']) for row in meals_col.aggregate(pipeline)]
+    return list(build_rollups(csv_store.find(user_id, start=start.isoformat(), end=end.isoformat())).values())
+
+
+@app.route('/api/nutrition/<user_id>/series', methods=['GET'])
+def get_nutrition_series(user_id):
+    """Nutrition totals per day/week/month as columnar arrays for charts (weeks start Monday)"""
+    try:
+        try:
+            end = datetime.strptime(request.args['end_date'], '%Y-%m-%d').date() if request.args.get('end_date') \
+                else datetime.now().date()
+            start = datetime.strptime(request.args['start_date'], '%Y-%m-%d').date() if request.args.get('start_date') \
+                else end - timedelta(days=SERIES_DEFAULT_DAYS - 1)
+            if start > end:
+                raise ValueError('start_date must not be after end_date')
+            bucket = request.args.get('bucket', 'day')
+            if bucket not in SERIES_BUCKETS:
+                raise ValueError(f"bucket must be one of {', '.join(SERIES_BUCKETS)}")
+            raw = request.args.get('metrics')
+            metrics = tuple(m.strip() for m in raw.split(',') if m.strip()) if raw else SERIES_DEFAULT_METRICS
+            unknown = [m for m in metrics if m not in SERIES_METRICS]
+            if unknown or not metrics:
+                raise ValueError(f"Unknown metrics: {', '.join(unknown)}" if unknown else 'No metrics requested')
+            if len(bucket_starts(start, end, bucket)) > MAX_SERIES_BUCKETS:
+                raise ValueError(f'At most {MAX_SERIES_BUCKETS} buckets; use a wider bucket or a shorter range')
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        def build():
+            starts, columns = series_from_daily(daily_totals(user_id, start, end, metrics), start, end, bucket, metrics)
+            return jsonify({
+                'user_id': user_id,
+                'start_date': start.isoformat(),
+                'end_date': end.isoformat(),
+                'bucket': bucket,
+                'buckets': starts,
+                'series': columns,
             })
-        # Convert vitamins and minerals to list format
-        vitamins_list = [{'name': name, 'amount': data['amount'], 'unit': data['unit']} 
-                        for name, data in total_nutrition['vitamins'].items()]
-        minerals_list = [{'name': name, 'amount': data['amount'], 'unit': data['unit']} 
-                        for name, data in total_nutrition['minerals'].items()]
-        result = {
-            'calories': total_nutrition['calories'],
-            'protein': total_nutrition['protein'],
-            'carbs': total_nutrition['carbs'],
-            'fat': total_nutrition['fat'],
-            'fiber': total_nutrition['fiber'],
-            'sugar': total_nutrition['sugar'],
-            'sodium': total_nutrition['sodium'],
-            'cholesterol': total_nutrition['cholesterol'],
-            'vitamins': vitamins_list,
-            'minerals': minerals_list,
-            'meals': total_nutrition['meals']
-        }
-        return jsonify(result)
+
+        params = {'start': start.isoformat(), 'end': end.isoformat(), 'bucket': bucket, 'metrics': metrics}
+        return cached_response(user_id, 'series', params, start.isoformat(), end.isoformat(), build)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+def meals_for_insights(user_id, start, end):
+    """A user's meals in [start, end] with `nutrition` decoded, insights included"""
+    if meals_col is None:
+        return read_meals_from_csv(user_id, start, end)
+    q = {'user_id': user_id, 'date': {'$gte': start, '$lte': end}}
+    return with_nutrition(meals_col.find(q, dict(NUTRITION_PROJECTION, _id=0, id=1, date=1)).sort('_id', 1))
+
+
+def refresh_insights(user_id, period, start):
+    """Recompute and store one insight summary; returns the stored document"""
+    first, last = (d.isoformat() for d in period_bounds(datetime.strptime(start, '%Y-%m-%d').date(), period))
+    # The version is read first: a meal saved while this runs leaves the summary stale
+    stored = insight_store.get(user_id, period, first)
+    version = stored.get('version', 0) if stored else 0
+    summary = summarize_insights(meals_for_insights(user_id, first, last))
+    return insight_store.put(user_id, period, first, last, summary, version)
+
+
+insight_scheduler = InsightScheduler(refresh_insights, delay=INSIGHTS_REFRESH_DELAY)
+
+
+@app.route('/api/insights/<user_id>/<period>', methods=['GET'])
+def get_insights(user_id, period):
+    """Insight summary of the week (Monday-Sunday) or month containing `date` (default: today)"""
+    try:
+        try:
+            if period not in INSIGHT_PERIODS:
+                raise ValueError(f"period must be one of {', '.join(INSIGHT_PERIODS)}")
+            day = datetime.strptime(request.args['date'], '%Y-%m-%d').date() if request.args.get('date') \
+                else datetime.now().date()
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        first, last = (d.isoformat() for d in period_bounds(day, period))
+
+        def build():
+            doc = insight_store.get(user_id, period, first)
+            if not is_fresh(doc):
+                doc = refresh_insights(user_id, period, first)
+            return jsonify(insight_response(doc))
+
+        return cached_response(user_id, 'insights', {'period': period, 'start': first}, first, last, build)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+
+def cached_response(user_id, view, params, start, end, build):
+    """Serve `build()` (a 200 JSON Response) through the response cache, with a strong ETag and 304s"""
+    lookup = cache_lookup(user_id, view, params, start, end)
+    if lookup is None:
+        return build()
+    key, stamp, entry = lookup
+    if entry is None:
+        response = build()
+        body = cacheable_body(response, response_cache.max_body)
+        if body is None:
+            return response
+        entry = response_cache.put(key, stamp, body, response.mimetype)
+    return cached_entry_response(entry)
+
+
+def cacheable_body(response, limit):
+    """The body of `response` if it is at most `limit` bytes, else None (a streamed body still streams)"""
+    if response.direct_passthrough:
+        return None
+    if not response.is_streamed:
+        body = response.get_data()
+        return body if len(body) <= limit else None
+    chunks, size = [], 0
+    stream = response.iter_encoded()
+    for chunk in stream:
+        chunks.append(chunk)
+        size += len(chunk)
+        if size > limit:
+            response.response = itertools.chain(chunks, stream)
+            return None
+    return b''.join(chunks)
+
+
+def cache_lookup(user_id, view, params, start, end):
+    """(key, stamp, entry or None) for a cacheable view; None when there is no usable cache"""
+    if response_cache is None:
+        return None
+    key = response_cache.key(user_id, view, params)
+    try:
+        stamp = response_cache.stamp(user_id, start, end)
+    except Exception as e:
+        print(f"Response cache unavailable: {str(e)}")
+        return None
+    return key, stamp, response_cache.get(key, stamp)
+
+
+def cached_entry_response(entry):
+    response = Response(entry['body'], mimetype=entry['mimetype'])
+    response.set_etag(entry['etag'])
+    # Browsers may keep it, but must revalidate; an upload changes the ETag
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response.make_conditional(request)
+
+
+MEAL_FIELDS = ('id', 'user_id', 'date', 'time', 'name', 'calories', 'nutrition', 'timestamp')
+MEAL_FIELD_SETS = {'summary': tuple(f for f in MEAL_FIELDS if f != 'nutrition')}
+MAX_MEALS_PAGE = int(os.getenv('MAX_MEALS_PAGE', 500))
+
+
+def parse_meal_fields(raw):
+    """`fields=` value -> tuple of meal fields; 'summary' drops the nutrition blob"""
+    if not raw:
+        return MEAL_FIELDS
+    if raw in MEAL_FIELD_SETS:
+        return MEAL_FIELD_SETS[raw]
+    fields = tuple(f.strip() for f in raw.split(',') if f.strip())
+    unknown = [f for f in fields if f not in MEAL_FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    return fields
+
+
+def encode_cursor(meal):
+    raw = json.dumps([meal.get('timestamp', ''), meal.get('id', '')]).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token):
+    try:
+        ts, meal_id = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+        return str(ts), str(meal_id)
+    except Exception:
+        raise ValueError('Invalid cursor')
+
+
+def normalize_meal(m, fields):
+    # Ensure JSON serializable
+    meal = {
+        'id': m.get('id', ''),
+        'user_id': m.get('user_id', ''),
+        'date': m.get('date', ''),
+        'time': m.get('time', ''),
+        'name': m.get('name', ''),
+        'calories': int(m.get('calories', 0)),
+        'nutrition': m.get('nutrition', {}),
+        'timestamp': m.get('timestamp', '')
+    }
+    return meal if fields is MEAL_FIELDS else {f: meal[f] for f in fields}
+
+
+def meals_page_args():
+    """Validated query of GET /api/meals; raises ValueError for a bad fields/limit/cursor"""
+    args = {
+        'date': request.args.get('date'),
+        'start': request.args.get('start_date'),
+        'end': request.args.get('end_date'),
+        'fields': parse_meal_fields(request.args.get('fields')),
+        'limit': request.args.get('limit', type=int),
+        'after': decode_cursor(request.args['cursor']) if request.args.get('cursor') else None,
+    }
+    if args['limit'] is not None and not 1 <= args['limit'] <= MAX_MEALS_PAGE:
+        raise ValueError(f'limit must be between 1 and {MAX_MEALS_PAGE}')
+    return args
+
+
+def meals_page_query(user_id, args):
+    """Mongo filter and projection for a meals page (sorted newest first by (timestamp, id))"""
+    q = {'user_id': user_id}
+    if args['date']:
+        q['date'] = args['date']
+    elif args['start'] or args['end']:
+        q['date'] = {k: v for k, v in (('$gte', args['start']), ('$lte', args['end'])) if v}
+    after = args['after']
+    if after:
+        q['$or'] = [{'timestamp': {'$lt': after[0]}}, {'timestamp': after[0], 'id': {'$lt': after[1]}}]
+    projection = {'_id': 0, 'id': 1, 'timestamp': 1}
+    projection.update({f: 1 for f in args['fields']})
+    if 'nutrition' in args['fields']:
+        projection.update(NUTRITION_PROJECTION)
+    return q, projection
+
+
+MEALS_PAGE_SORT = [('timestamp', -1), ('id', -1)]
+
+
+def render_meals_page(meals, fields, limit):
+    """JSON body of a meals page, in pieces; `meals` holds up to limit + 1 rows (the extra one means more)"""
+    yield '{"meals": ['
+    count = 0
+    next_cursor = None
+    for m in meals:
+        if limit and count == limit:
+            next_cursor = encode_cursor(last)
+            break
+        yield (',' if count else '') + json.dumps(normalize_meal(m, fields), default=str)
+        count += 1
+        last = m
+    yield f'], "next_cursor": {json.dumps(next_cursor)}}}'
+
+
+def meals_page_cache_params(args):
+    params = dict(args)
+    first_date, last_date = (args['date'], args['date']) if args['date'] else (args['start'], args['end'])
+    return params, first_date, last_date
+
+
 @app.route('/api/meals/<user_id>', methods=['GET'])
 def get_user_meals(user_id):
-    """Get all meals for a user (MongoDB preferred, CSV fallback)"""
+    """Get a user's meals, newest first, one page at a time (MongoDB preferred, CSV fallback)"""
+    try:
+        try:
+            args = meals_page_args()
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        limit = args['limit']
+        fetch = limit + 1 if limit else None
+
+        def build():
+            if meals_col is not None:
+                q, projection = meals_page_query(user_id, args)
+                meals = meals_col.find(q, projection).sort(MEALS_PAGE_SORT)
+                if fetch:
+                    meals = meals.limit(fetch)
+                if 'nutrition' in args['fields']:
+                    meals = with_nutrition(meals)
+            else:
+                meals = csv_store.page(
+                    user_id,
+                    dates=[args['date']] if args['date'] else None,
+                    start=args['start'],
+                    end=args['end'],
+                    after=args['after'],
+                    limit=fetch
+                )
+            meals = iter(meals)
+            # Pull the first row here so storage errors still produce a 500 rather than a broken stream
+            first = next(meals, None)
+            rows = itertools.chain([first] if first is not None else [], meals)
+            return Response(stream_with_context(render_meals_page(rows, args['fields'], limit)),
+                            mimetype='application/json')
+
+        params, first_date, last_date = meals_page_cache_params(args)
+        return cached_response(user_id, 'meals', params, first_date, last_date, build)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/api/meals/<user_id>/export', methods=['GET'])
+def export_user_meals(user_id):
+    """Stream a user's meals as NDJSON, oldest first, optionally gzipped"""
     try:
-        date_param = request.args.get('date')
-        meals = []
+        start_date = request.args.get('start_date')
+        end_date = request.args.get('end_date')
         if meals_col is not None:
             q = {'user_id': user_id}
-            if date_param:
-                q['date'] = date_param
-            meals = list(meals_col.find(q))
+            if start_date or end_date:
+                q['date'] = {k: v for k, v in (('$gte', start_date), ('$lte', end_date)) if v}
+            projection = dict(NUTRITION_PROJECTION, _id=0)
+            projection.update({f: 1 for f in MEAL_FIELDS})
+            meals = with_nutrition(meals_col.find(q, projection).sort([('timestamp', 1), ('id', 1)]).batch_size(1000))
         else:
-            all_meals = read_meals_from_csv()
-            meals = [m for m in all_meals if m['user_id'] == user_id]
-            if date_param:
-                meals = [m for m in meals if m['date'] == date_param]
-        meals.sort(key=lambda x: x.get('timestamp', ''), reverse=True)
-        # Ensure JSON serializable
-        normalized = []
-        for m in meals:
-            normalized.append({
-                'id': m.get('id', ''),
-                'user_id': m.get('user_id', ''),
-                'date': m.get('date', ''),
-                'time': m.get('time', ''),
-                'name': m.get('name', ''),
-                'calories': int(m.get('calories', 0)),
-                'nutrition': m.get('nutrition', {}),
-                'timestamp': m.get('timestamp', '')
-            })
-        return jsonify({'meals': normalized})
+            meals = csv_store.scan(user_id, start=start_date, end=end_date)
+        body = ndjson_lines(normalize_meal(m, MEAL_FIELDS) for m in meals)
+        filename = f"meals-{user_id}.ndjson"
+        headers = {'Content-Disposition': f'attachment; filename="{filename}"'}
+        if is_truthy(request.args.get('gzip', '')):
+            body = gzip_chunks(body)
+            headers['Content-Encoding'] = 'gzip'
+        return Response(stream_with_context(body), mimetype='application/x-ndjson', headers=headers)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 
+IMPORT_BATCH_SIZE = int(os.getenv('IMPORT_BATCH_SIZE', 1000))
+
+
+def rebuild_rollups(user_id=None):
+    """Recompute daily rollups from stored meals (everyone, or one user); returns the count"""
+    if meals_col is not None:
+        q = {'user_id': user_id} if user_id else {}
+        meals = with_nutrition(meals_col.find(q, dict(NUTRITION_PROJECTION, _id=0, user_id=1, date=1)), insights=False)
+    else:
+        meals = read_meals_from_csv(user_id)
+    return rollup_store.rebuild(meals, user_id=user_id)
+
+
+def import_meals(rows, user_id=None, batch_size=IMPORT_BATCH_SIZE):
+    """Bulk-load meal rows (dicts from meal_io.read_rows), skipping existing ids; returns counts and rate"""
+    started = time.perf_counter()
+    stats = {'read': 0, 'inserted': 0, 'skipped': 0, 'invalid': 0, 'errors': []}
+    known_ids = csv_store.known_ids() if meals_col is None else None
+    touched = []
+    batch = []
+
+    def flush():
+        if not batch:
+            return
+        if meals_col is not None:
+            docs, insights = storage_documents(batch)
+            failed = set()
+            try:
+                stats['inserted'] += len(meals_col.insert_many(docs, ordered=False).inserted_ids)
+            except BulkWriteError as e:
+                stats['inserted'] += e.details.get('nInserted', 0)
+                for err in e.details.get('writeErrors', []):
+                    failed.add(docs[err['index']]['id'])
+                    if err.get('code') == 11000:
+                        stats['skipped'] += 1
+                    else:
+                        stats['invalid'] += 1
+                        stats['errors'].append(err.get('errmsg', 'Write failed'))
+            # After the meals, so an id that was skipped keeps the insights it has
+            save_insights([d for d in insights if d['_id'] not in failed])
+        else:
+            csv_store.append_many(batch)
+            stats['inserted'] += len(batch)
+        touched.extend({'user_id': m['user_id'], 'date': m['date']} for m in batch)
+        batch.clear()
+
+    for row in rows:
+        stats['read'] += 1
+        try:
+            meal = meal_from_row(row, user_id)
+        except ValueError as e:
+            stats['invalid'] += 1
+            stats['errors'].append(f"row {stats['read']}: {e}")
+            continue
+        if known_ids is not None:
+            if meal['id'] in known_ids:
+                stats['skipped'] += 1
+                continue
+            known_ids.add(meal['id'])
+        batch.append(meal)
+        if len(batch) >= batch_size:
+            flush()
+    flush()
+
+    for owner in {m['user_id'] for m in touched}:
+        rebuild_rollups(owner)
+    # Imported history is mostly old periods: recompute their summaries when they are read
+    mark_insights_stale(touched)
+    bump_response_versions(touched)
+    seconds = time.perf_counter() - started
+    stats['errors'] = stats['errors'][:20]
+    stats['seconds'] = round(seconds, 3)
+    stats['rows_per_second'] = round(stats['read'] / seconds, 1) if seconds else None
+    return stats
+
+
+def stored_size(doc, insights=None):
+    return len(bson_encode(doc)) + (len(bson_encode(insights)) if insights else 0)
+
+
+def migrate_meals(to_version=SCHEMA_VERSION, user_id=None, batch_size=IMPORT_BATCH_SIZE):
+    """Rewrite stored meals into storage schema `to_version` in re-runnable batches; returns counts"""
+    started = time.perf_counter()
+    compact = to_version >= SCHEMA_VERSION
+    stats = {'scanned': 0, 'migrated': 0, 'kept': 0, 'bytes_before': 0, 'bytes_after': 0}
+    q = {'schema': {'$exists': False}} if compact else {'schema': SCHEMA_VERSION}
+    if user_id:
+        q['user_id'] = user_id
+    cursor = meals_col.find(q).batch_size(batch_size)
+    while batch := list(itertools.islice(cursor, batch_size)):
+        stats['scanned'] += len(batch)
+        fetched = {} if compact else load_insights(batch)
+        writes, insights, migrated = [], [], []
+        for doc in batch:
+            if compact:
+                new, advanced = encode_meal(doc)
+                if new.get('schema') is None:
+                    stats['kept'] += 1
+                    continue
+                stored = insights_document(new, advanced) if advanced is not None else None
+                if stored:
+                    insights.append(stored)
+                before, after = stored_size(doc), stored_size(new, stored)
+            else:
+                advanced = fetched.get(doc['id'])
+                new = decode_meal(doc, advanced)
+                before = stored_size(doc, insights_document(doc, advanced) if advanced is not None else None)
+                after = stored_size(new)
+            writes.append(ReplaceOne({'_id': doc['_id'], 'schema': q['schema']}, new))
+            migrated.append(doc)
+            stats['bytes_before'] += before
+            stats['bytes_after'] += after
+        save_insights(insights)
+        if writes:
+            stats['migrated'] += meals_col.bulk_write(writes, ordered=False).modified_count
+        if not compact and migrated:
+            insights_col.delete_many({'_id': {'$in': [m['id'] for m in migrated]}})
+        # Decoded vitamins and minerals come out in a different order, so cached views are stale
+        bump_response_versions(migrated)
+    stats['seconds'] = round(time.perf_counter() - started, 3)
+    return stats
+
+
+@app.route('/api/meals/import', methods=['POST'])
+def import_meals_route():
+    """Import meals from NDJSON or meals.csv-style CSV, plain or gzipped"""
+    try:
+        claims = get_auth_user()
+        if 'file' in request.files:
+            if claims is None and request.form.get('password') != UPLOAD_PASSWORD:
+                return jsonify({'error': 'Unauthorized'}), 401
+            upload = request.files['file']
+            fmt = request.form.get('format') or ('csv' if (upload.filename or '').endswith(('.csv', '.csv.gz'))
+                                                 else 'ndjson')
+            stream, gzipped = upload.stream, (upload.filename or '').endswith('.gz')
+        else:
+            if claims is None:
+                return jsonify({'error': 'Unauthorized'}), 401
+            fmt = 'csv' if request.mimetype == 'text/csv' else 'ndjson'
+            stream, gzipped = request.stream, request.headers.get('Content-Encoding') == 'gzip'
+        if fmt not in IMPORT_FORMATS:
+            return jsonify({'error': f"format must be one of {', '.join(IMPORT_FORMATS)}"}), 400
+        stats = import_meals(read_rows(stream, fmt, gzipped), user_id=claims.get('user_id') if claims else None)
+        return jsonify(dict(stats, success=stats['invalid'] == 0))
+    except HTTPException:
+        raise
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+def ensure_rendition(meal_id, image_info, size):
+    """Return the stored rendition, generating and saving it on first use"""
+    rendition = (image_info.get('renditions') or {}).get(size)
+    if rendition:
+        return rendition
+    with timed('gridfs_get'):
+        source = fs.get(ObjectId(image_info['file_id']))
+    with timed('image_decode'):
+        # Decoded straight from the GridFS file, which is read chunk by chunk
+        _, out = preprocess_image(source, IMAGE_RENDITIONS[size], IMAGE_FORMAT, IMAGE_QUALITY)
+    rendition = put_rendition(out, meal_id, size)
+    res = meals_col.update_one(
+        {'id': meal_id, f'image.renditions.{size}': {'$exists': False}},
+        {'$set': {f'image.renditions.{size}': rendition}}
+    )
+    if res.modified_count == 0:
+        # Another request generated it first; keep theirs
+        fs.delete(ObjectId(rendition['file_id']))
+        meal = meals_col.find_one({'id': meal_id}, {'image': 1})
+        return meal['image']['renditions'][size]
+    return rendition
+
+
 @app.route('/api/meal-image/<meal_id>', methods=['GET'])
 def get_meal_image(meal_id):
-    """Return the image bytes for a meal if stored in GridFS."""
+    """Stream a meal image from GridFS; `?size=thumb|medium|full` picks the rendition."""
     try:
         if meals_col is None or fs is None:
             return jsonify({'error': 'Image storage not configured'}), 404
-        meal = meals_col.find_one({'id': meal_id})
+        size = request.args.get('size', 'full')
+        if size != 'full' and size not in IMAGE_RENDITIONS:
+            return jsonify({'error': f"Unknown size '{size}'"}), 400
+        meal = meals_col.find_one({'id': meal_id}, {'image': 1})
         if not meal:
             return jsonify({'error': 'Meal not found'}), 404
         image_info = meal.get('image') or {}
-        file_id = image_info.get('file_id')
-        if not file_id:
+        if not image_info.get('file_id'):
             return jsonify({'error': 'Image not found'}), 404
-        gridout = fs.get(ObjectId(file_id))
-        data = gridout.read()
-        return send_file(io.BytesIO(data), mimetype=image_info.get('content_type') or 'application/octet-stream')
+        target = image_info if size == 'full' else ensure_rendition(meal_id, image_info, size)
+        # GridFS files are immutable, so the file id is a strong validator
+        etag = target['file_id']
+        if etag in request.if_none_match:
+            response = app.response_class(status=304)
+            response.set_etag(etag)
+            response.cache_control.max_age = IMAGE_CACHE_MAX_AGE
+            return response
+        with timed('gridfs_get'):
+            gridout = fs.get(ObjectId(etag))
+        response = send_file(
+            gridout,
+            mimetype=target.get('content_type') or 'application/octet-stream',
+            etag=etag,
+            last_modified=gridout.upload_date,
+            max_age=IMAGE_CACHE_MAX_AGE,
+            conditional=True
+        )
+        response.cache_control.immutable = True
+        return response
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -580,14 +1904,156 @@ def health_check():
         'status': 'healthy',
         'timestamp': datetime.now().isoformat(),
     'gemini_configured': bool(os.getenv('GEMINI_API_KEY')),
-    'db_connected': db is not None
+    'model_provider': model.name,
+    'db_connected': db is not None,
+    'analysis_cache': analysis_cache.snapshot(),
+    'token_cache': claims_cache.snapshot(),
+    'response_cache': response_cache.snapshot() if response_cache is not None else None,
+    'upload_jobs': upload_jobs.snapshot(),
+    'insights': insight_scheduler.snapshot(),
+    'model_gate': dict(model_gate.snapshot(), coalescing=inflight_analyses.in_flight()),
+    'rate_limit_storage': RATE_LIMIT_STORAGE_URI.split('://', 1)[0],
+    'analysis': dict(analysis_stats)
     })
 
+registry.register(Gauge('ahaar_upload_queue_depth', 'Background upload jobs waiting for a worker',
+                        lambda: upload_jobs.snapshot()['queue_depth']))
+registry.register(Gauge('ahaar_upload_jobs_total', 'Background upload jobs by outcome',
+                        lambda: {(k,): v for k, v in upload_jobs.snapshot().items()
+                                 if k in ('submitted', 'completed', 'failed', 'rejected')},
+                        labelnames=('outcome',), kind='counter'))
+registry.register(Gauge('ahaar_insight_refreshes_pending', 'Insight summaries waiting for a background refresh',
+                        lambda: insight_scheduler.snapshot()['pending']))
+registry.register(Gauge('ahaar_insight_refreshes_total', 'Background insight summary refreshes by outcome',
+                        lambda: {(k,): v for k, v in insight_scheduler.snapshot().items()
+                                 if k in ('refreshed', 'failed')},
+                        labelnames=('outcome',), kind='counter'))
+registry.register(Gauge('ahaar_model_calls_waiting', 'Model calls queued for a slot or rate token',
+                        lambda: model_gate.snapshot()['waiting']))
+registry.register(Gauge('ahaar_model_calls_in_flight', 'Model calls running in this worker',
+                        lambda: model_gate.snapshot()['in_flight']))
+registry.register(Gauge('ahaar_analysis_cache_lookups_total', 'Analysis cache lookups by result',
+                        lambda: {(k,): v for k, v in analysis_cache.snapshot().items()
+                                 if k in ('memory_hits', 'persistent_hits', 'misses')},
+                        labelnames=('result',), kind='counter'))
+
+registry.register(Gauge('ahaar_response_cache_lookups_total', 'Nutrition/meals response cache lookups by result',
+                        lambda: {(k,): v for k, v in (response_cache.stats.items() if response_cache else ())
+                                 if k in ('hits', 'misses')},
+                        labelnames=('result',), kind='counter'))
+
+
+@app.route('/api/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Prometheus text-format metrics for this worker process"""
+    return Response(registry.render(), mimetype='text/plain; version=0.0.4')
+
+
 @app.route('/api/test', methods=['POST'])
 def test_endpoint():
     """Test endpoint for CORS"""
     return jsonify({'message': 'CORS is working', 'method': 'POST'})
 
+
+def warn_process_local_cache():
+    """CLI writes can't invalidate a server's in-process response cache; say how long it may lag"""
+    if response_cache is not None and response_cache.backend.name == 'memory':
+        click.echo(f"Note: servers using RESPONSE_CACHE=memory may serve responses cached before this for up to "
+                   f"{RESPONSE_CACHE_TTL}s; restart them to drop those now (RESPONSE_CACHE=shared avoids this)",
+                   err=True)
+
+
+@app.cli.command('rebuild-rollups')
+@click.option('--user', 'user_id', default=None, help='Only rebuild this user (default: everyone)')
+def rebuild_rollups_command(user_id):
+    """Recompute daily_rollups from stored meals (Mongo, or meals.csv)"""
+    started = time.perf_counter()
+    count = rebuild_rollups(user_id)
+    click.echo(f"Rebuilt {count} daily rollups in {time.perf_counter() - started:.2f}s")
+    warn_process_local_cache()
+
+
+@app.cli.command('import-meals')
+@click.argument('path')
+@click.option('--format', 'fmt', type=click.Choice(IMPORT_FORMATS), default=None,
+              help='Default: from the file name (.csv / .ndjson, optionally .gz)')
+@click.option('--user', 'user_id', default=None, help='Import every row for this user')
+@click.option('--batch-size', default=IMPORT_BATCH_SIZE, show_default=True)
+@click.option('--defer-indexes', is_flag=True,
+              help='Drop the non-unique meal indexes during the load and rebuild them after (large Mongo loads)')
+def import_meals_command(path, fmt, user_id, batch_size, defer_indexes):
+    """Bulk-import meals from an NDJSON or CSV file ('-' for stdin)"""
+    name = path[:-3] if path.endswith('.gz') else path
+    fmt = fmt or ('csv' if name.endswith('.csv') else 'ndjson')
+    if defer_indexes and meals_col is not None:
+        for index in meals_col.list_indexes():
+            if index['name'] != '_id_' and not index.get('unique'):
+                meals_col.drop_index(index['name'])
+    fp = click.get_binary_stream('stdin') if path == '-' else open(path, 'rb')
+    try:
+        stats = import_meals(read_rows(fp, fmt, path.endswith('.gz')), user_id=user_id, batch_size=batch_size)
+    finally:
+        if fp is not click.get_binary_stream('stdin'):
+            fp.close()
+    if meals_col is not None:
+        started = time.perf_counter()
+        ensure_indexes()
+        click.echo(f"Indexes rebuilt in {time.perf_counter() - started:.2f}s")
+    for error in stats['errors']:
+        click.echo(f"  {error}", err=True)
+    click.echo(f"Read {stats['read']} rows: {stats['inserted']} inserted, {stats['skipped']} already present, "
+               f"{stats['invalid']} invalid in {stats['seconds']:.2f}s ({stats['rows_per_second']} rows/s)")
+    warn_process_local_cache()
+
+
+@app.cli.command('migrate-meals')
+@click.option('--to', 'to_version', type=click.IntRange(1, SCHEMA_VERSION), default=SCHEMA_VERSION, show_default=True,
+              help='Storage schema to convert meals to (1 undoes a migration)')
+@click.option('--user', 'user_id', default=None, help='Only migrate this user')
+@click.option('--batch-size', default=IMPORT_BATCH_SIZE, show_default=True)
+def migrate_meals_command(to_version, user_id, batch_size):
+    """Convert stored Mongo meals between storage schemas (see meal_schema.py)"""
+    if meals_col is None:
+        click.echo('MONGO_URI is not set; meals.csv has a single schema')
+        return
+    stats = migrate_meals(to_version, user_id, batch_size)
+    saved = stats['bytes_before'] - stats['bytes_after']
+    click.echo(f"Scanned {stats['scanned']} meals: {stats['migrated']} migrated to schema {to_version}, "
+               f"{stats['kept']} kept in schema 1 in {stats['seconds']:.2f}s")
+    if stats['bytes_before']:
+        click.echo(f"Stored size {stats['bytes_before']} -> {stats['bytes_after']} bytes "
+                   f"({saved / stats['bytes_before']:.0%} smaller)")
+    warn_process_local_cache()
+
+
+def ensure_indexes():
+    """Create every Mongo index the app relies on (idempotent)"""
+    users_col.create_index('email', unique=True)
+    # Also serves (user_id, timestamp) queries; the older two-key index is dropped where it exists
+    meals_col.create_index([('user_id', 1), ('timestamp', -1), ('id', -1)])
+    if 'user_id_1_timestamp_-1' in meals_col.index_information():
+        meals_col.drop_index('user_id_1_timestamp_-1')
+    meals_col.create_index('id', unique=True)
+    meals_col.create_index([('user_id', 1), ('date', 1)])
+    db['upload_jobs'].create_index('id', unique=True)
+    rollup_store.ensure_indexes()
+    phash_index.ensure_indexes()
+    analysis_cache.ensure_indexes()
+    if response_cache is not None and isinstance(response_cache.backend, MongoBackend):
+        response_cache.backend.ensure_indexes()
+
+
+@app.cli.command('init-db')
+def init_db_command():
+    """Create Mongo indexes; run once per deploy (and after upgrades that add indexes)"""
+    if db is None:
+        click.echo('MONGO_URI is not set; the CSV store needs no migration')
+        return
+    started = time.perf_counter()
+    ensure_indexes()
+    click.echo(f"Indexes ensured in {time.perf_counter() - started:.2f}s")
+
+
 # ASGI adapter for uvicorn
 try:
     from asgiref.wsgi import WsgiToAsgi
@@ -0,0 +1,334 @@
+"""Async-native ASGI entry point: `uvicorn asgi_native:asgi_app`."""
+import asyncio
+import re
+import tempfile
+import time
+
+from asgiref.wsgi import WsgiToAsgi, WsgiToAsgiInstance
+from bson import ObjectId
+from flask import jsonify, request
+from gridfs import AsyncGridFS
+from pymongo import AsyncMongoClient
+from werkzeug.http import is_resource_modified
+
+import app as ahaar
+from meal_schema import decode_meal, needs_insights
+from metrics import MongoTimingListener, timed
+
+# The hot endpoints are coroutines here instead of running on asgiref's thread pool like
+# app:asgi_app: uploads await the model, nutrition/meals/meal-image await AsyncMongoClient and GridFS.
+# They go through the Flask app's hooks and error handlers, so responses match the WSGI mode; other
+# routes, CSV reads, Range requests and async/streaming/duplicate uploads go to the Flask app as before.
+ROUTES = (
+    ('POST', re.compile(r'/api/upload-meal'), 'upload_meal'),
+    ('GET', re.compile(r'/api/nutrition/(?P<user_id>[^/]+)/(?P<period>[^/]+)'), 'nutrition'),
+    ('GET', re.compile(r'/api/meals/(?P<user_id>[^/]+)'), 'meals'),
+    ('GET', re.compile(r'/api/meal-image/(?P<meal_id>[^/]+)'), 'meal_image'),
+)
+# Flask endpoints charged to the shared upload budget (app.upload_rate_limit)
+UPLOAD_ENDPOINTS = ('upload_meal', 'upload_meals')
+
+
+class AsyncBodyResponse(ahaar.app.response_class):
+    """A response whose body is an async iterator of bytes (`chunks`)"""
+
+    chunks = None
+
+
+class NativeApp:
+    def __init__(self, flask_app):
+        self.flask_app = flask_app
+        self.wsgi = WsgiToAsgi(flask_app)
+        self.client = None
+        self.db = None
+        self.fs = None
+
+    # ---------- plumbing ----------
+    def _connect(self):
+        # Created on first use so the client belongs to the serving event loop
+        if self.db is None and ahaar.MONGO_URI:
+            self.client = AsyncMongoClient(ahaar.MONGO_URI, event_listeners=[MongoTimingListener()],
+                                           **ahaar.MONGO_OPTIONS)
+            self.db = self.client[ahaar.MONGO_DB_NAME]
+            self.fs = AsyncGridFS(self.db)
+        return self.db
+
+    @property
+    def meals_col(self):
+        return self._connect()['meals']
+
+    @property
+    def insights_col(self):
+        return self._connect()['meal_insights']
+
+    async def with_nutrition(self, meals):
+        """ahaar.with_nutrition() for a fetched list: decoded, with insights from one query"""
+        ids = [m['id'] for m in meals if needs_insights(m)]
+        advanced = {}
+        if ids:
+            advanced = {d['_id']: d['advanced'] for d in await self.insights_col.find({'_id': {'$in': ids}}).to_list()}
+        return [decode_meal(m, advanced.get(m.get('id'))) for m in meals]
+
+    def _handles(self, name, scope, params):
+        """Whether the native handler serves this request (else the Flask app does)"""
+        if name == 'upload_meal':
+            return True
+        if ahaar.meals_col is None:
+            # CSV store: reads are local file work, no better off on the event loop
+            return False
+        if name == 'nutrition':
+            # /api/nutrition/<user>/series is its own Flask route
+            return params['period'] != 'series'
+        if name == 'meal_image':
+            return not any(k == b'range' for k, _ in scope.get('headers', ()))
+        return True
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self._lifespan(receive, send)
+        if scope['type'] == 'http':
+            for method, pattern, name in ROUTES:
+                match = pattern.fullmatch(scope['path'])
+                if match and scope['method'] == method and self._handles(name, scope, match.groupdict()):
+                    return await self._serve(getattr(self, name), match.groupdict(), scope, receive, send)
+        return await self.wsgi(scope, receive, send)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                if self.client is not None:
+                    await self.client.close()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def _read_body(self, scope, receive, body):
+        """Spool the request body, stopping once it passes MAX_CONTENT_LENGTH (Werkzeug then answers 413)"""
+        limit = self.flask_app.config['MAX_CONTENT_LENGTH']
+        declared = next((v for k, v in scope.get('headers', ()) if k == b'content-length'), None)
+        if limit is not None and declared is not None and int(declared) > limit:
+            return
+        size = 0
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                break
+            chunk = message.get('body', b'')
+            body.write(chunk)
+            size += len(chunk)
+            if not message.get('more_body') or (limit is not None and size > limit):
+                break
+        body.seek(0)
+
+    async def _serve(self, handler, params, scope, receive, send):
+        with tempfile.SpooledTemporaryFile(max_size=ahaar.UPLOAD_SPOOL_BYTES) as body:
+            await self._read_body(scope, receive, body)
+            builder = WsgiToAsgiInstance(self.flask_app)
+            builder.scope = scope
+            ctx = self.flask_app.request_context(builder.build_environ(scope, body))
+            ctx.push()
+            error = None
+            try:
+                # As Flask.wsgi_app: an error no handler took becomes a 500 (and got_request_exception)
+                try:
+                    response = await self._dispatch(handler, params)
+                except Exception as e:
+                    error = e
+                    response = self.flask_app.handle_exception(e)
+                await self._send(response, send)
+            finally:
+                if error is not None and self.flask_app.should_ignore_error(error):
+                    error = None
+                ctx.pop(error)
+
+    async def _dispatch(self, handler, params):
+        """Flask's full_dispatch_request with an awaited view"""
+        app = self.flask_app
+        try:
+            # before_request hooks: request timer, rate limits (which may parse the form)
+            rv = await asyncio.to_thread(app.preprocess_request)
+            if rv is None and request.endpoint in UPLOAD_ENDPOINTS:
+                # Flask-Limiter applies route limits in the view decorator, which the coroutines skip
+                await asyncio.to_thread(ahaar.check_upload_rate_limit)
+            if rv is None:
+                rv = await handler(**params)
+        except Exception as e:
+            rv = app.handle_user_exception(e)
+        return app.process_response(app.make_response(rv))
+
+    async def _send(self, response, send):
+        headers = [(k.lower().encode('latin-1'), v.encode('latin-1')) for k, v in response.headers.items()]
+        await send({'type': 'http.response.start', 'status': response.status_code, 'headers': headers})
+        try:
+            if isinstance(response, AsyncBodyResponse) and response.chunks is not None:
+                async for chunk in response.chunks:
+                    await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            elif response.is_streamed:
+                # A generator from the Flask side (e.g. SSE); it may block, so pull it on a thread
+                chunks = response.iter_encoded()
+                while (chunk := await asyncio.to_thread(next, chunks, None)) is not None:
+                    await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            else:
+                await send({'type': 'http.response.body', 'body': response.get_data(), 'more_body': True})
+        finally:
+            response.close()
+        await send({'type': 'http.response.body', 'body': b''})
+
+    async def _cache_call(self, fn, *args):
+        # The in-process cache is a dict lookup; shared backends do I/O
+        if ahaar.response_cache.backend.name == 'memory':
+            return fn(*args)
+        return await asyncio.to_thread(fn, *args)
+
+    async def cached_response(self, user_id, view, params, start, end, build):
+        """app.cached_response with an awaitable build()"""
+        lookup = await self._cache_call(ahaar.cache_lookup, user_id, view, params, start, end) \
+            if ahaar.response_cache is not None else None
+        if lookup is None:
+            return await build()
+        key, stamp, entry = lookup
+        if entry is None:
+            response = await build()
+            body = ahaar.cacheable_body(response, ahaar.response_cache.max_body)
+            if body is None:
+                return response
+            entry = await self._cache_call(ahaar.response_cache.put, key, stamp, body, response.mimetype)
+        return ahaar.cached_entry_response(entry)
+
+    # ---------- endpoints ----------
+    async def upload_meal(self):
+        try:
+            upload, error = await asyncio.to_thread(ahaar.upload_from_request)
+            if error is not None:
+                return error
+            if upload['on_duplicate'] != 'analyze' or ahaar.wants_async_upload() or ahaar.wants_streaming_upload():
+                return await asyncio.to_thread(ahaar.dispatch_upload, upload)
+            image, image_bytes = await asyncio.to_thread(ahaar.prepare_upload_image, upload)
+            meal_record = ahaar.meal_record_for(upload, await ahaar.analyze_food_image_async(image, image_bytes))
+            await self.save_meal(upload, meal_record)
+            return jsonify(ahaar.upload_result(meal_record))
+        except Exception as e:
+            return ahaar.upload_error_response(e)
+
+    async def save_meal(self, upload, meal_record):
+        if ahaar.meals_col is not None and ahaar.fs is not None:
+            if ahaar.KEEP_ORIGINAL_UPLOADS or ahaar.RENDITIONS_ON_UPLOAD:
+                image_info = await asyncio.to_thread(ahaar.store_meal_image, upload)
+            else:
+                image_info = await self.store_image(upload)
+            docs, insights = ahaar.storage_documents([ahaar.meal_document(upload, meal_record, image_info)])
+            if insights:
+                await self.insights_col.bulk_write(ahaar.insights_writes(insights), ordered=False)
+            await self.meals_col.insert_one(docs[0])
+        else:
+            await asyncio.to_thread(ahaar.csv_store.append_many, [meal_record])
+        await asyncio.to_thread(ahaar.after_meals_saved, [(upload, meal_record)], {})
+
+    async def store_image(self, upload):
+        data = upload['image_bytes']
+        _, filename, content_type = ahaar.image_file_meta(upload)
+        self._connect()
+        with timed('gridfs_put'):
+            grid_id = await self.fs.put(data, filename=filename, content_type=content_type)
+        return {'file_id': str(grid_id), 'filename': filename, 'content_type': content_type, 'size': len(data)}
+
+    async def nutrition(self, user_id, period):
+        try:
+            start, end = ahaar.nutrition_window(period)
+            if (end - start).days >= ahaar.MAX_NUTRITION_RANGE_DAYS:
+                return ahaar.nutrition_range_too_long(user_id)
+            first, last = start.strftime('%Y-%m-%d'), end.strftime('%Y-%m-%d')
+
+            async def build():
+                if ahaar.USE_DAILY_ROLLUPS:
+                    rollups = await asyncio.to_thread(ahaar.rollup_store.get, user_id, first, last)
+                    result = ahaar.totals_from_rollups(rollups)
+                else:
+                    cursor = await self.meals_col.aggregate(ahaar.nutrition_pipeline(user_id, first, last))
+                    result = ahaar.nutrition_from_facets(next(iter(await cursor.to_list()), {}))
+                q = {'user_id': user_id, 'date': {'$gte': first, '$lte': last}}
+                summaries = await self.meals_col.find(q, ahaar.MEAL_SUMMARY_PROJECTION).sort('_id', 1).to_list()
+                result['meals'] = [ahaar.meal_summary(m) for m in await self.with_nutrition(summaries)]
+                return jsonify(result)
+
+            return await self.cached_response(
+                user_id, 'nutrition', {'period': period, 'dates': [first, last]}, first, last, build)
+        except Exception as e:
+            return jsonify({'error': str(e)}), 500
+
+    async def meals(self, user_id):
+        try:
+            try:
+                args = ahaar.meals_page_args()
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+            limit = args['limit']
+
+            async def build():
+                q, projection = ahaar.meals_page_query(user_id, args)
+                cursor = self.meals_col.find(q, projection).sort(ahaar.MEALS_PAGE_SORT)
+                if limit:
+                    cursor = cursor.limit(limit + 1)
+                rows = await cursor.to_list()
+                if 'nutrition' in args['fields']:
+                    rows = await self.with_nutrition(rows)
+                return ahaar.app.response_class(''.join(ahaar.render_meals_page(rows, args['fields'], limit)),
+                                                mimetype='application/json')
+
+            params, first_date, last_date = ahaar.meals_page_cache_params(args)
+            return await self.cached_response(user_id, 'meals', params, first_date, last_date, build)
+        except Exception as e:
+            return jsonify({'error': str(e)}), 500
+
+    async def meal_image(self, meal_id):
+        try:
+            size = request.args.get('size', 'full')
+            if size != 'full' and size not in ahaar.IMAGE_RENDITIONS:
+                return jsonify({'error': f"Unknown size '{size}'"}), 400
+            meal = await self.meals_col.find_one({'id': meal_id}, {'image': 1})
+            if not meal:
+                return jsonify({'error': 'Meal not found'}), 404
+            image_info = meal.get('image') or {}
+            if not image_info.get('file_id'):
+                return jsonify({'error': 'Image not found'}), 404
+            if size == 'full':
+                target = image_info
+            else:
+                # Stored renditions are read directly; generating a missing one is CPU work
+                target = ((image_info.get('renditions') or {}).get(size)
+                          or await asyncio.to_thread(ahaar.ensure_rendition, meal_id, image_info, size))
+            etag = target['file_id']
+            if etag in request.if_none_match:
+                response = ahaar.app.response_class(status=304)
+                response.set_etag(etag)
+                response.cache_control.max_age = ahaar.IMAGE_CACHE_MAX_AGE
+                return response
+            with timed('gridfs_get'):
+                gridout = await self.fs.get(ObjectId(etag))
+            if not is_resource_modified(request.environ, etag=etag, last_modified=gridout.upload_date):
+                response = ahaar.app.response_class(status=304)
+                response.set_etag(etag)
+                return response
+            response = AsyncBodyResponse(mimetype=target.get('content_type') or 'application/octet-stream')
+            response.chunks = self._read_chunks(gridout)
+            response.content_length = gridout.length
+            response.set_etag(etag)
+            response.last_modified = gridout.upload_date
+            response.cache_control.public = True
+            response.cache_control.max_age = ahaar.IMAGE_CACHE_MAX_AGE
+            response.cache_control.immutable = True
+            response.expires = time.time() + ahaar.IMAGE_CACHE_MAX_AGE
+            response.accept_ranges = 'bytes'
+            return response
+        except Exception as e:
+            return jsonify({'error': str(e)}), 500
+
+    @staticmethod
+    async def _read_chunks(gridout):
+        while chunk := await gridout.readchunk():
+            yield chunk
+
+
+asgi_app = NativeApp(ahaar.app)
@@ -0,0 +1,200 @@
+"""Load-test the hot API routes in-process against the fake model provider.
+
+Seeds a synthetic meal history, then drives /api/upload-meal (with the
+Data/test_data images), /api/nutrition/<user_id>/<period> and
+/api/meals/<user_id> from concurrent clients and reports p50/p95/p99
+latency, requests per second, errors and RSS per store.
+
+    python benchmarks/bench_api.py --store all --requests 300 --concurrency 16 --latency-ms 800
+
+Stores: csv (temporary DATA_DIR), mongomock (`pip install mongomock`) and
+mongod (needs MONGO_URI; a scratch database is created and dropped).
+"""
+import argparse
+import glob
+import io
+import itertools
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(BENCH_DIR)
+DATA_DIR = os.path.join(BACKEND_DIR, '..', 'Data', 'test_data')
+sys.path.insert(0, BACKEND_DIR)
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, os.path.join(BACKEND_DIR, 'tests'))
+
+from mongomock_store import use_mongomock  # noqa: E402,F401  (bench_auth, bench_upload_memory)
+
+STORES = ('csv', 'mongomock', 'mongod')
+SCENARIOS = ('upload', 'nutrition', 'meals')
+
+
+def rss_mb():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except OSError:
+        usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return usage / (1024 * 1024) if sys.platform == 'darwin' else usage / 1024
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    k = (len(sorted_values) - 1) * pct / 100
+    lo, hi = int(k), min(int(k) + 1, len(sorted_values) - 1)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (k - lo)
+
+
+def run_store(args):
+    os.environ['MODEL_PROVIDER'] = 'fake'
+    os.environ['FAKE_MODEL_LATENCY_MS'] = str(args.latency_ms)
+    os.environ['FAKE_MODEL_JITTER_MS'] = str(args.latency_ms * 0.2)
+    os.environ['FAKE_MODEL_FAILURE_RATE'] = str(args.failure_rate)
+    os.environ['DATA_DIR'] = tempfile.mkdtemp(prefix='ahaar-bench-')
+    if args.store == 'mongod':
+        if not os.getenv('MONGO_URI'):
+            sys.exit('--store mongod needs MONGO_URI')
+        os.environ['MONGO_DB_NAME'] = f'ahaar_bench_{os.getpid()}'
+    else:
+        os.environ.pop('MONGO_URI', None)
+
+    import app
+    from analysis_cache import AnalysisCache
+    from synthetic import make_meals
+
+    if args.store == 'mongomock':
+        use_mongomock(app)
+    if app.db is not None:
+        app.ensure_indexes()
+    if not args.cache:
+        app.analysis_cache = AnalysisCache(max_entries=0)
+    app.limiter.enabled = False
+
+    users = [f'bench-user-{i}' for i in range(args.users)]
+    history = [m for i, u in enumerate(users) for m in make_meals(u, args.days, args.meals_per_day, seed=i)]
+    if app.meals_col is not None:
+        app.meals_col.insert_many([dict(m) for m in history])
+    else:
+        app.csv_store.append_many(history)
+    app.rollup_store.rebuild(history)
+    dates = sorted({m['date'] for m in history})
+
+    images = []
+    for path in sorted(glob.glob(os.path.join(DATA_DIR, '*.jpg'))):
+        with open(path, 'rb') as f:
+            images.append(f.read())
+    image_cycle = itertools.cycle(images)
+    image_lock = threading.Lock()
+    local = threading.local()
+    rng = random.Random(1)
+
+    def client():
+        if not hasattr(local, 'client'):
+            local.client = app.app.test_client()
+        return local.client
+
+    def upload():
+        with image_lock:
+            data = next(image_cycle)
+        return client().post('/api/upload-meal', data={
+            'password': app.UPLOAD_PASSWORD,
+            'user_id': rng.choice(users),
+            'image': (io.BytesIO(data), 'meal.jpg', 'image/jpeg'),
+        })
+
+    def nutrition():
+        period = rng.choice(['daily', 'weekly', 'monthly'])
+        return client().get(f'/api/nutrition/{rng.choice(users)}/{period}?date={rng.choice(dates)}')
+
+    def meals():
+        return client().get(f'/api/meals/{rng.choice(users)}?limit=50')
+
+    results = []
+    try:
+        for name in args.scenarios:
+            fn = {'upload': upload, 'nutrition': nutrition, 'meals': meals}[name]
+            latencies = []
+            errors = 0
+            lock = threading.Lock()
+
+            def one(_):
+                nonlocal errors
+                start = time.perf_counter()
+                response = fn()
+                response.get_data()
+                elapsed = time.perf_counter() - start
+                with lock:
+                    latencies.append(elapsed)
+                    errors += response.status_code >= 400
+
+            rss_before = rss_mb()
+            started = time.perf_counter()
+            with ThreadPoolExecutor(args.concurrency) as pool:
+                list(pool.map(one, range(args.requests)))
+            wall = time.perf_counter() - started
+            latencies.sort()
+            results.append({
+                'store': args.store,
+                'scenario': name,
+                'requests': len(latencies),
+                'errors': errors,
+                'rps': round(len(latencies) / wall, 1),
+                'p50_ms': round(percentile(latencies, 50) * 1000, 1),
+                'p95_ms': round(percentile(latencies, 95) * 1000, 1),
+                'p99_ms': round(percentile(latencies, 99) * 1000, 1),
+                'rss_mb': round(rss_mb(), 1),
+                'rss_growth_mb': round(rss_mb() - rss_before, 1),
+            })
+    finally:
+        if args.store == 'mongod' and app.mongo_client is not None:
+            app.mongo_client.drop_database(os.environ['MONGO_DB_NAME'])
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--store', choices=STORES + ('all',), default='csv')
+    parser.add_argument('--scenarios', nargs='+', choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--days', type=int, default=90)
+    parser.add_argument('--meals-per-day', type=int, default=3)
+    parser.add_argument('--requests', type=int, default=200, help='requests per scenario')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--latency-ms', type=float, default=800, help='fake model latency per call')
+    parser.add_argument('--failure-rate', type=float, default=0.0, help='fraction of fake model calls that fail')
+    parser.add_argument('--cache', action='store_true', help='keep the analysis cache on (uploads repeat images)')
+    parser.add_argument('--json', action='store_true', help='print raw JSON results')
+    args = parser.parse_args()
+
+    if args.store != 'all':
+        results = run_store(args)
+    else:
+        results = []
+        stores = [s for s in STORES if s != 'mongod' or os.getenv('MONGO_URI')]
+        for store in stores:
+            cmd = [sys.executable, __file__, '--json', '--store', store] + [
+                a for a in sys.argv[1:] if a not in ('--json', '--store', 'all')]
+            out = subprocess.run(cmd, check=True, capture_output=True, text=True)
+            results.extend(json.loads(out.stdout.strip().splitlines()[-1]))
+
+    if args.json:
+        print(json.dumps(results))
+        return
+    cols = ['store', 'scenario', 'requests', 'errors', 'rps', 'p50_ms', 'p95_ms', 'p99_ms', 'rss_mb', 'rss_growth_mb']
+    print(''.join(f'{c:>14}' for c in cols))
+    for r in results:
+        print(''.join(f'{r[c]:>14}' for c in cols))
+
+
+if __name__ == '__main__':
+    main()
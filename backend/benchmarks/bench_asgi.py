@@ -0,0 +1,283 @@
+"""Throughput of the WsgiToAsgi adapter vs the async-native ASGI app under uvicorn.
+
+Starts `uvicorn app:asgi_app` and `uvicorn asgi_native:asgi_app` in turn, each
+on a fresh copy of the same synthetic history (loaded with `flask
+import-meals`), and drives /api/upload-meal (fake model with --latency-ms,
+distinct images so neither cache nor coalescing short-cuts the model call),
+/api/nutrition, /api/meals and, with Mongo, /api/meal-image over
+--connections keep-alive HTTP/1.1 connections. Reports requests per second,
+p50/p95/p99 latency, errors and the server's thread count per scenario.
+
+    python benchmarks/bench_asgi.py --connections 128 --requests 2000 --latency-ms 300
+    MONGO_URI=mongodb://localhost:27017 python benchmarks/bench_asgi.py   # scratch databases, dropped after
+
+Without MONGO_URI only uploads run natively: nutrition and meals reads of
+the CSV store are served by the Flask app in both modes, and uploads are
+bounded by the rollup sidecar, which is rewritten whole on every meal.
+WsgiToAsgi runs the Flask app on a single thread-sensitive thread, which is
+what the `threads` column shows.
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+from bench_api import percentile  # noqa: E402
+from synthetic import make_meals  # noqa: E402
+
+SERVERS = {'wsgi': 'app:asgi_app', 'native': 'asgi_native:asgi_app'}
+SCENARIOS = ('upload', 'nutrition', 'meals', 'image')
+BOUNDARY = 'ahaar-bench-boundary'
+
+
+def make_images(count, seed=1):
+    """`count` distinct small JPEGs (distinct hashes, so every upload calls the model)"""
+    from PIL import Image
+    rng = random.Random(seed)
+    images = []
+    for _ in range(count):
+        image = Image.effect_noise((160, 120), 48).convert('RGB')
+        image.putpixel((0, 0), (rng.randrange(256), rng.randrange(256), rng.randrange(256)))
+        out = io.BytesIO()
+        image.save(out, 'JPEG', quality=80)
+        images.append(out.getvalue())
+    return images
+
+
+def upload_body(image, user_id, password):
+    fields = ''.join(f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="{k}"\r\n\r\n{v}\r\n'
+                     for k, v in (('password', password), ('user_id', user_id)))
+    head = (f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="image"; filename="meal.jpg"\r\n'
+            'Content-Type: image/jpeg\r\n\r\n')
+    return fields.encode() + head.encode() + image + f'\r\n--{BOUNDARY}--\r\n'.encode()
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def server_threads(pid):
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            return next(int(line.split()[1]) for line in f if line.startswith('Threads:'))
+    except (OSError, StopIteration):
+        return None
+
+
+class Connection:
+    """One keep-alive HTTP/1.1 connection (just enough of the protocol for these routes)"""
+
+    def __init__(self, port):
+        self.port = port
+        self.reader = self.writer = None
+
+    async def request(self, method, path, body=b'', content_type=None):
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection('127.0.0.1', self.port)
+        head = f'{method} {path} HTTP/1.1\r\nHost: localhost\r\nContent-Length: {len(body)}\r\n'
+        if content_type:
+            head += f'Content-Type: {content_type}\r\n'
+        self.writer.write(head.encode() + b'\r\n' + body)
+        status_line = await self.reader.readline()
+        if not status_line:
+            raise ConnectionError('server closed the connection')
+        status = int(status_line.split()[1])
+        headers = {}
+        while (line := await self.reader.readline()) not in (b'\r\n', b''):
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+        if headers.get('transfer-encoding') == 'chunked':
+            data = b''
+            while size := int((await self.reader.readline()).split(b';')[0], 16):
+                data += await self.reader.readexactly(size)
+                await self.reader.readline()
+            await self.reader.readline()
+        else:
+            data = await self.reader.readexactly(int(headers.get('content-length', 0)))
+        if headers.get('connection') == 'close':
+            self.close()
+        return status, data
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.reader = self.writer = None
+
+
+async def drive(port, make_request, total, connections):
+    """Send `total` requests over `connections` connections; latencies, errors, OK bodies and wall time"""
+    latencies, bodies = [], []
+    errors = 0
+    counter = iter(range(total))
+
+    async def worker():
+        nonlocal errors
+        conn = Connection(port)
+        try:
+            for i in counter:
+                method, path, body, content_type = make_request(i)
+                started = time.perf_counter()
+                try:
+                    status, data = await conn.request(method, path, body, content_type)
+                except (OSError, ValueError, asyncio.IncompleteReadError):
+                    conn.close()
+                    errors += 1
+                    continue
+                latencies.append(time.perf_counter() - started)
+                if status >= 400:
+                    errors += 1
+                else:
+                    bodies.append(data)
+        finally:
+            conn.close()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(connections)))
+    return latencies, errors, bodies, time.perf_counter() - started
+
+
+def wait_ready(port, proc, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            sys.exit(f'server exited with {proc.returncode}')
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=1) as s:
+                s.sendall(b'GET /api/health HTTP/1.1\r\nHost: localhost\r\nConnection: close\r\n\r\n')
+                if s.recv(16).startswith(b'HTTP/1.1 200'):
+                    return
+        except OSError:
+            pass
+        time.sleep(0.2)
+    sys.exit('server did not become ready')
+
+
+def seed_env(args, server):
+    env = dict(os.environ,
+               DATA_DIR=tempfile.mkdtemp(prefix=f'ahaar-bench-{server}-'),
+               MODEL_PROVIDER='fake',
+               FAKE_MODEL_LATENCY_MS=str(args.latency_ms),
+               MODEL_MAX_CONCURRENCY='0',
+               ANALYSIS_CACHE_MAX_ENTRIES='0',
+               RESPONSE_CACHE='off',
+               UPLOAD_RATE_LIMIT='1000000 per minute',
+               PYTHONPATH=BACKEND_DIR)
+    if env.get('MONGO_URI'):
+        env['MONGO_DB_NAME'] = f'ahaar_bench_{os.getpid()}_{server}'
+    return env
+
+
+def run_server(args, server, history_path, users, dates, images):
+    env = seed_env(args, server)
+    flask = [sys.executable, '-m', 'flask', '--app', 'app']
+    if env.get('MONGO_URI'):
+        subprocess.run(flask + ['init-db'], cwd=BACKEND_DIR, env=env, check=True, capture_output=True)
+    subprocess.run(flask + ['import-meals', history_path], cwd=BACKEND_DIR, env=env, check=True, capture_output=True)
+
+    port = free_port()
+    proc = subprocess.Popen([sys.executable, '-m', 'uvicorn', SERVERS[server], '--port', str(port),
+                             '--log-level', 'warning', '--no-access-log', '--backlog', str(args.connections * 4)],
+                            cwd=BACKEND_DIR, env=env)
+    rng = random.Random(7)
+    meal_ids = []
+    results = []
+    try:
+        wait_ready(port, proc)
+
+        def upload(i):
+            body = upload_body(images[i % len(images)], rng.choice(users), 'idk991')
+            return 'POST', '/api/upload-meal', body, f'multipart/form-data; boundary={BOUNDARY}'
+
+        def nutrition(i):
+            period = rng.choice(['daily', 'weekly', 'monthly'])
+            return 'GET', f'/api/nutrition/{rng.choice(users)}/{period}?date={rng.choice(dates)}', b'', None
+
+        def meals(i):
+            return 'GET', f'/api/meals/{rng.choice(users)}?limit=50', b'', None
+
+        def image(i):
+            return 'GET', f'/api/meal-image/{rng.choice(meal_ids)}?size=thumb', b'', None
+
+        for name in args.scenarios:
+            if name == 'image' and not meal_ids:
+                continue  # needs Mongo/GridFS and the upload scenario's meals
+            fn = {'upload': upload, 'nutrition': nutrition, 'meals': meals, 'image': image}[name]
+            total = args.uploads if name == 'upload' else args.requests
+            latencies, errors, bodies, wall = asyncio.run(drive(port, fn, total, args.connections))
+            if name == 'upload':
+                for body in bodies:
+                    meal = json.loads(body).get('meal') or {}
+                    if meal.get('image_url'):
+                        meal_ids.append(meal['id'])
+            latencies.sort()
+            results.append({
+                'server': server,
+                'scenario': name,
+                'requests': len(latencies),
+                'errors': errors,
+                'rps': round(len(latencies) / wall, 1),
+                'p50_ms': round(percentile(latencies, 50) * 1000, 1),
+                'p95_ms': round(percentile(latencies, 95) * 1000, 1),
+                'p99_ms': round(percentile(latencies, 99) * 1000, 1),
+                'threads': server_threads(proc.pid),
+            })
+    finally:
+        proc.terminate()
+        proc.wait(timeout=30)
+        if env.get('MONGO_URI'):
+            from pymongo import MongoClient
+            MongoClient(env['MONGO_URI']).drop_database(env['MONGO_DB_NAME'])
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--servers', nargs='+', choices=tuple(SERVERS), default=list(SERVERS))
+    parser.add_argument('--scenarios', nargs='+', choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument('--connections', type=int, default=128, help='concurrent keep-alive connections')
+    parser.add_argument('--requests', type=int, default=2000, help='requests per read scenario')
+    parser.add_argument('--uploads', type=int, default=512, help='requests in the upload scenario')
+    parser.add_argument('--latency-ms', type=float, default=300, help='fake model latency per call')
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--days', type=int, default=90)
+    parser.add_argument('--json', action='store_true', help='print raw JSON results')
+    args = parser.parse_args()
+
+    users = [f'bench-user-{i}' for i in range(args.users)]
+    history = [m for i, u in enumerate(users) for m in make_meals(u, args.days, seed=i)]
+    dates = sorted({m['date'] for m in history})
+    with tempfile.NamedTemporaryFile('w', suffix='.ndjson', delete=False) as f:
+        f.writelines(json.dumps(m) + '\n' for m in history)
+    images = make_images(args.uploads)
+
+    results = []
+    try:
+        for server in args.servers:
+            results.extend(run_server(args, server, f.name, users, dates, images))
+    finally:
+        os.unlink(f.name)
+
+    if args.json:
+        print(json.dumps(results))
+        return
+    cols = ['server', 'scenario', 'requests', 'errors', 'rps', 'p50_ms', 'p95_ms', 'p99_ms', 'threads']
+    print(''.join(f'{c:>12}' for c in cols))
+    for r in results:
+        print(''.join(f'{str(r[c]):>12}' for c in cols))
+
+
+if __name__ == '__main__':
+    main()
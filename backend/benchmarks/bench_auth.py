@@ -0,0 +1,109 @@
+"""Login throughput and bearer-token verification cost under concurrency.
+
+Signs up --users accounts in an in-memory mongomock database (or the
+MONGO_URI database, scratch name, dropped afterwards), then reports for
+each concurrency level:
+
+  login   POST /api/auth/login (password hashing on the dedicated pool)
+  verify  get_auth_user() with the claims cache on and off
+
+    python benchmarks/bench_auth.py --concurrency 1 4 16 --hash-method scrypt:16384:8:1
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+
+
+def drive(fn, requests, concurrency):
+    latencies = []
+    lock = threading.Lock()
+
+    def one(i):
+        start = time.perf_counter()
+        fn(i)
+        elapsed = time.perf_counter() - start
+        with lock:
+            latencies.append(elapsed)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        list(pool.map(one, range(requests)))
+    wall = time.perf_counter() - started
+    latencies.sort()
+    return len(latencies) / wall, latencies[len(latencies) // 2] * 1000, latencies[int(len(latencies) * 0.95)] * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--requests', type=int, default=200, help='logins per concurrency level')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 16, 64])
+    parser.add_argument('--hash-method', help='PASSWORD_HASH_METHOD for this run')
+    parser.add_argument('--hash-workers', type=int, help='PASSWORD_HASH_WORKERS for this run')
+    args = parser.parse_args()
+
+    os.environ['MODEL_PROVIDER'] = 'fake'
+    os.environ['DATA_DIR'] = tempfile.mkdtemp(prefix='ahaar-bench-')
+    if args.hash_method:
+        os.environ['PASSWORD_HASH_METHOD'] = args.hash_method
+    if args.hash_workers:
+        os.environ['PASSWORD_HASH_WORKERS'] = str(args.hash_workers)
+    if os.getenv('MONGO_URI'):
+        os.environ['MONGO_DB_NAME'] = f'ahaar_bench_{os.getpid()}'
+
+    import app
+    from bench_api import use_mongomock
+    from token_cache import ClaimsCache
+
+    if app.db is None:
+        use_mongomock(app)
+    app.ensure_indexes()
+    app.limiter.enabled = False
+    local = threading.local()
+
+    def client():
+        if not hasattr(local, 'client'):
+            local.client = app.app.test_client()
+        return local.client
+
+    try:
+        accounts = [(f'bench{i}@example.com', f'pw-{i}') for i in range(args.users)]
+        tokens = []
+        for email, password in accounts:
+            tokens.append(client().post('/api/auth/signup', json={'email': email, 'password': password}).json['token'])
+
+        print(f"hash method {app.PASSWORD_HASH_METHOD}, {app.password_executor._max_workers} hashing workers")
+        print(f"{'scenario':>16}{'concurrency':>13}{'ops/s':>12}{'p50_ms':>10}{'p95_ms':>10}")
+        rng = random.Random(1)
+
+        def login(_):
+            email, password = rng.choice(accounts)
+            assert client().post('/api/auth/login', json={'email': email, 'password': password}).status_code == 200
+
+        def verify(_):
+            with app.app.test_request_context(headers={'Authorization': f'Bearer {rng.choice(tokens)}'}):
+                assert app.get_auth_user() is not None
+
+        for concurrency in args.concurrency:
+            rows = [('login', drive(login, args.requests, concurrency))]
+            for label, size in (('verify cached', 1024), ('verify uncached', 0)):
+                app.claims_cache = ClaimsCache(size)
+                rows.append((label, drive(verify, args.requests * 20, concurrency)))
+            for label, (rps, p50, p95) in rows:
+                print(f"{label:>16}{concurrency:>13}{rps:>12.1f}{p50:>10.2f}{p95:>10.2f}")
+    finally:
+        if os.getenv('MONGO_URI') and app.mongo_client is not None:
+            app.mongo_client.drop_database(os.environ['MONGO_DB_NAME'])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+"""Document size and /api/nutrition aggregate speed of meal storage schema 1 vs 2.
+
+Stores the same synthetic history once per schema (meal_schema.py; schema 2
+meals plus their meal_insights documents) and reports the average BSON
+size per meal, then the median time of the /api/nutrition pipeline over
+daily, weekly, monthly and 90-day windows on each collection.
+
+    python benchmarks/bench_meal_schema.py --users 20 --days 180 --repeat 20
+    MONGO_URI=mongodb://localhost:27017 python benchmarks/bench_meal_schema.py   # scratch database, dropped after
+
+Timings are only meaningful against a real mongod (which also reports
+collection sizes); mongomock evaluates pipelines in Python.
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+
+from bson import encode as bson_encode  # noqa: E402
+from synthetic import make_meals  # noqa: E402
+
+WINDOWS = {'daily': 1, 'weekly': 7, 'monthly': 31, '90 days': 90}
+
+
+def get_database():
+    uri = os.environ.pop('MONGO_URI', None)
+    if uri:
+        from pymongo import MongoClient
+        client = MongoClient(uri)
+        db = client[f'ahaar_schema_{os.getpid()}']
+        return db, True, lambda: client.drop_database(db.name)
+    import mongomock
+    return mongomock.MongoClient()['ahaar'], False, lambda: None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--days', type=int, default=180)
+    parser.add_argument('--meals-per-day', type=int, default=3)
+    parser.add_argument('--repeat', type=int, default=10, help='runs per window (median reported)')
+    args = parser.parse_args()
+
+    db, real, cleanup = get_database()
+    import app
+    from meal_schema import encode_meal, insights_document
+
+    end = datetime(2025, 6, 30)
+    users = [f'u{i}' for i in range(args.users)]
+    meals = [m for i, u in enumerate(users) for m in make_meals(u, args.days, args.meals_per_day, end=end, seed=i)]
+    compact, insights = [], []
+    for meal in meals:
+        doc, advanced = encode_meal(meal)
+        compact.append(doc)
+        if advanced is not None:
+            insights.append(insights_document(doc, advanced))
+
+    verbose_bytes = sum(len(bson_encode(m)) for m in meals)
+    compact_bytes = sum(len(bson_encode(d)) for d in compact)
+    insights_bytes = sum(len(bson_encode(d)) for d in insights)
+    n = len(meals)
+    print(f'{n} meals, {sum(d.get("schema") == 2 for d in compact)} encoded in schema 2')
+    print(f'{"":<24}{"bytes/meal":>12}{"total KB":>12}')
+    for label, size in (('schema 1', verbose_bytes), ('schema 2 meal', compact_bytes),
+                        ('schema 2 insights', insights_bytes), ('schema 2 total', compact_bytes + insights_bytes)):
+        print(f'{label:<24}{size / n:>12.0f}{size / 1024:>12.0f}')
+
+    collections = {'1': db['meals_schema1'], '2': db['meals_schema2']}
+    try:
+        collections['1'].insert_many([dict(m) for m in meals])
+        collections['2'].insert_many(compact)
+        db['meal_insights'].insert_many(insights)
+        for col in collections.values():
+            col.create_index([('user_id', 1), ('date', 1)])
+        if real:
+            for schema, col in collections.items():
+                stats = db.command('collStats', col.name)
+                print(f'schema {schema} collection: size {stats["size"] // 1024} KB, '
+                      f'storage {stats["storageSize"] // 1024} KB')
+
+        print(f'\n{"window":<10}{"meals":>8}{"schema 1 ms":>14}{"schema 2 ms":>14}{"speedup":>10}')
+        last = end.strftime('%Y-%m-%d')
+        for label, days in WINDOWS.items():
+            first = (end - timedelta(days=days - 1)).strftime('%Y-%m-%d')
+            medians = {}
+            for schema, col in collections.items():
+                timings = []
+                for i in range(args.repeat):
+                    user = users[i % len(users)]
+                    started = time.perf_counter()
+                    result = app.nutrition_from_facets(next(col.aggregate(app.nutrition_pipeline(user, first, last)), {}))
+                    timings.append(time.perf_counter() - started)
+                medians[schema] = statistics.median(timings) * 1000
+            count = collections['1'].count_documents({'user_id': users[0], 'date': {'$gte': first, '$lte': last}})
+            print(f'{label:<10}{count:>8}{medians["1"]:>14.2f}{medians["2"]:>14.2f}'
+                  f'{medians["1"] / medians["2"]:>9.1f}x')
+            assert result['calories'] >= 0
+    finally:
+        cleanup()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+"""Compare raw uploads with the preprocessing stage over Data/test_data/*.jpg.
+
+Reports decode (+ re-encode) time, bytes that would be sent/stored and peak RSS for each
+mode. Each mode runs in its own subprocess so peak RSS is not shared.
+
+    python benchmarks/bench_preprocess.py [--max-edge 1280] [--format JPEG] [--quality 85]
+"""
+import argparse
+import glob
+import io
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA_DIR = os.path.join(BACKEND_DIR, '..', 'Data', 'test_data')
+sys.path.insert(0, BACKEND_DIR)
+
+
+def peak_rss_mb():
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    return usage / (1024 * 1024) if sys.platform == 'darwin' else usage / 1024
+
+
+def run_mode(mode, paths, max_edge, fmt, quality):
+    from PIL import Image
+    from imaging import preprocess_image
+
+    baseline_rss = peak_rss_mb()
+    decode_seconds = 0.0
+    bytes_in = 0
+    bytes_out = 0
+    pixels = 0
+    for path in paths:
+        with open(path, 'rb') as f:
+            data = f.read()
+        bytes_in += len(data)
+        start = time.perf_counter()
+        if mode == 'raw':
+            image = Image.open(io.BytesIO(data))
+            image.load()
+            out = data
+        else:
+            image, out = preprocess_image(data, max_edge, fmt, quality)
+        decode_seconds += time.perf_counter() - start
+        bytes_out += len(out)
+        pixels += image.width * image.height
+    return {
+        'mode': mode,
+        'images': len(paths),
+        'process_ms_per_image': round(decode_seconds * 1000 / len(paths), 2),
+        'bytes_in': bytes_in,
+        'bytes_sent': bytes_out,
+        'megapixels_decoded': round(pixels / 1e6, 2),
+        'peak_rss_delta_mb': round(peak_rss_mb() - baseline_rss, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--max-edge', type=int, default=int(os.getenv('IMAGE_MAX_EDGE', 1280)))
+    parser.add_argument('--format', default=os.getenv('IMAGE_FORMAT', 'JPEG').upper())
+    parser.add_argument('--quality', type=int, default=int(os.getenv('IMAGE_QUALITY', 85)))
+    parser.add_argument('--data', default=DATA_DIR)
+    parser.add_argument('--mode', choices=['raw', 'preprocessed'], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    paths = sorted(glob.glob(os.path.join(args.data, '*.jpg')))
+    if not paths:
+        sys.exit(f"No images found in {args.data}")
+
+    if args.mode:
+        print(json.dumps(run_mode(args.mode, paths, args.max_edge, args.format, args.quality)))
+        return
+
+    results = []
+    for mode in ('raw', 'preprocessed'):
+        out = subprocess.run(
+            [sys.executable, __file__, '--mode', mode, '--data', args.data,
+             '--max-edge', str(args.max_edge), '--format', args.format, '--quality', str(args.quality)],
+            check=True, capture_output=True, text=True,
+        )
+        results.append(json.loads(out.stdout))
+
+    print(f"{len(paths)} images, max edge {args.max_edge}px, {args.format} q{args.quality}\n")
+    print(f"{'mode':<14}{'process ms/img':>15}{'bytes sent':>14}{'megapixels':>12}{'peak RSS MB':>13}")
+    for r in results:
+        print(f"{r['mode']:<14}{r['process_ms_per_image']:>15}{r['bytes_sent']:>14}"
+              f"{r['megapixels_decoded']:>12}{r['peak_rss_delta_mb']:>13}")
+
+
+if __name__ == '__main__':
+    main()
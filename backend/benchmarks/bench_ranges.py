@@ -0,0 +1,108 @@
+"""Show /api/nutrition cost following meals found, not days spanned.
+
+Seeds a dense user (meals every day for --days) and a sparse one (meals
+only in the last 14 days), then times weekly totals over growing
+start_date..end_date spans ending on the same day. With range scans on
+(user_id, date) the per-meal cost stays flat for the dense user and the
+sparse user's cost stays flat as the span grows.
+
+    python benchmarks/bench_ranges.py --store all --days 400
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+
+# mongomock is left out: it scans whole collections, so it says nothing about index use
+STORES = ('csv', 'mongod')
+SPANS = (7, 30, 90, 180, 366)
+
+
+def run_store(args):
+    os.environ['MODEL_PROVIDER'] = 'fake'
+    os.environ['RESPONSE_CACHE'] = 'off'
+    os.environ['DATA_DIR'] = tempfile.mkdtemp(prefix='ahaar-bench-')
+    if args.store == 'mongod':
+        if not os.getenv('MONGO_URI'):
+            sys.exit('--store mongod needs MONGO_URI')
+        os.environ['MONGO_DB_NAME'] = f'ahaar_bench_{os.getpid()}'
+    else:
+        os.environ.pop('MONGO_URI', None)
+
+    import app
+    from synthetic import make_meals
+
+    if app.db is not None:
+        app.ensure_indexes()
+
+    end = datetime(2025, 6, 30)
+    history = make_meals('dense', args.days, args.meals_per_day, end=end)
+    history += make_meals('sparse', 14, args.meals_per_day, end=end, seed=3)
+    history += [m for i in range(args.other_users) for m in make_meals(f'other{i}', args.days, 1, end=end, seed=10 + i)]
+    if app.meals_col is not None:
+        app.meals_col.insert_many([dict(m) for m in history])
+    else:
+        app.csv_store.append_many(history)
+
+    client = app.app.test_client()
+    results = []
+    try:
+        for user in ('dense', 'sparse'):
+            for span in SPANS:
+                start = (end - timedelta(days=span - 1)).strftime('%Y-%m-%d')
+                url = f"/api/nutrition/{user}/weekly?start_date={start}&end_date={end.strftime('%Y-%m-%d')}"
+                meals = len(client.get(url).json['meals'])  # warm-up
+                timings = []
+                for _ in range(args.repeat):
+                    t = time.perf_counter()
+                    assert client.get(url).status_code == 200
+                    timings.append(time.perf_counter() - t)
+                ms = statistics.median(timings) * 1000
+                results.append({'store': args.store, 'user': user, 'span_days': span, 'meals': meals,
+                                'ms': round(ms, 2), 'us_per_meal': round(ms * 1000 / meals, 1) if meals else None})
+    finally:
+        if args.store == 'mongod' and app.mongo_client is not None:
+            app.mongo_client.drop_database(os.environ['MONGO_DB_NAME'])
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--store', choices=STORES + ('all',), default='csv')
+    parser.add_argument('--days', type=int, default=400)
+    parser.add_argument('--meals-per-day', type=int, default=3)
+    parser.add_argument('--other-users', type=int, default=10)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--json', action='store_true', help='print raw JSON results')
+    args = parser.parse_args()
+
+    if args.store != 'all':
+        results = run_store(args)
+    else:
+        results = []
+        for store in (s for s in STORES if s != 'mongod' or os.getenv('MONGO_URI')):
+            cmd = [sys.executable, __file__, '--json', '--store', store] + [
+                a for a in sys.argv[1:] if a not in ('--json', '--store', 'all')]
+            out = subprocess.run(cmd, check=True, capture_output=True, text=True)
+            results.extend(json.loads(out.stdout.strip().splitlines()[-1]))
+
+    if args.json:
+        print(json.dumps(results))
+        return
+    cols = ['store', 'user', 'span_days', 'meals', 'ms', 'us_per_meal']
+    print(''.join(f'{c:>13}' for c in cols))
+    for r in results:
+        print(''.join(f'{str(r[c]):>13}' for c in cols))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+"""Measure cold-start cost: time to import app and time to the first response.
+
+Each run is a fresh interpreter. "in-process" runs import app and issue the
+first request through the Flask test client; "server" runs spawn uvicorn and
+poll until the first 200, which is what a scale-from-zero deploy waits for.
+
+    python benchmarks/bench_startup.py --runs 5
+    python benchmarks/bench_startup.py --mode server --path /api/health
+    python benchmarks/bench_startup.py --unreachable-mongo   # startup must not wait on the database
+"""
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(BENCH_DIR)
+
+CHILD = r'''
+import json, sys, time
+started = time.perf_counter()
+import app
+imported = time.perf_counter()
+response = app.app.test_client().get(sys.argv[1])
+response.get_data()
+done = time.perf_counter()
+print(json.dumps({'import_s': imported - started, 'first_response_s': done - started, 'status': response.status_code}))
+'''
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def run_in_process(path, env):
+    out = subprocess.run([sys.executable, '-c', CHILD, path], cwd=BACKEND_DIR, env=env,
+                         check=True, capture_output=True, text=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def run_server(path, env, timeout=60):
+    port = free_port()
+    started = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, '-m', 'uvicorn', 'app:asgi_app', '--port', str(port),
+                             '--log-level', 'warning'], cwd=BACKEND_DIR, env=env)
+    try:
+        while time.perf_counter() - started < timeout:
+            try:
+                with urllib.request.urlopen(f'http://127.0.0.1:{port}{path}', timeout=5) as response:
+                    return {'first_response_s': time.perf_counter() - started, 'status': response.status}
+            except urllib.error.HTTPError as exc:
+                return {'first_response_s': time.perf_counter() - started, 'status': exc.code}
+            except OSError:
+                if proc.poll() is not None:
+                    sys.exit('uvicorn exited before serving a request')
+                time.sleep(0.01)
+        sys.exit(f'no response within {timeout}s')
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--mode', choices=('in-process', 'server'), default='in-process')
+    parser.add_argument('--path', default='/api/health', help='first request to time')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--unreachable-mongo', action='store_true',
+                        help='point MONGO_URI at a closed port to show startup does not block on the database')
+    args = parser.parse_args()
+
+    env = dict(os.environ, DATA_DIR=tempfile.mkdtemp(prefix='ahaar-startup-'), MODEL_PROVIDER='fake')
+    if args.unreachable_mongo:
+        env['MONGO_URI'] = f'mongodb://127.0.0.1:{free_port()}/'
+
+    runs = []
+    for _ in range(args.runs):
+        runs.append(run_in_process(args.path, env) if args.mode == 'in-process' else run_server(args.path, env))
+
+    print(f"{args.mode}, {args.runs} runs, first request GET {args.path} -> {runs[-1]['status']}")
+    for key in ('import_s', 'first_response_s'):
+        if key in runs[0]:
+            values = [r[key] * 1000 for r in runs]
+            print(f"  {key[:-2]:<16} median {statistics.median(values):8.1f} ms   "
+                  f"min {min(values):8.1f} ms   max {max(values):8.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
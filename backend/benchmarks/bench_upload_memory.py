@@ -0,0 +1,132 @@
+"""Peak RSS per concurrent upload of a large photo.
+
+Each concurrency level runs in a fresh interpreter: a synthetic
+--megapixels JPEG is posted to /api/upload-meal by N clients at once
+(fake model with --latency-ms, so uploads overlap) and the process's peak
+RSS growth (sampled every few ms, over the RSS right before the burst) is
+divided by N.
+
+    python benchmarks/bench_upload_memory.py --concurrency 1 4 16 --megapixels 12
+    python benchmarks/bench_upload_memory.py --async-uploads   # queued jobs hold their spools
+"""
+import argparse
+import gc
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+
+from bench_api import rss_mb, use_mongomock  # noqa: E402
+
+
+class PeakSampler(threading.Thread):
+    """Highest current RSS seen while running (ru_maxrss can't be reset between phases)"""
+
+    def __init__(self, interval=0.005):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.peak = rss_mb()
+        self._done = threading.Event()
+
+    def run(self):
+        while not self._done.wait(self.interval):
+            self.peak = max(self.peak, rss_mb())
+
+    def stop(self):
+        self._done.set()
+        self.join()
+        return max(self.peak, rss_mb())
+
+
+def make_photo(megapixels):
+    """Noisy gradient JPEG: compresses about as badly as a real phone photo"""
+    from PIL import Image
+    width = int((megapixels * 1e6 * 4 / 3) ** 0.5)
+    height = int(width * 3 / 4)
+    image = Image.radial_gradient('L').resize((width, height)).convert('RGB')
+    noise = Image.effect_noise((width, height), 64).convert('RGB')
+    out = io.BytesIO()
+    Image.blend(image, noise, 0.5).save(out, 'JPEG', quality=92)
+    return out.getvalue()
+
+
+def run_level(args):
+    os.environ['MODEL_PROVIDER'] = 'fake'
+    os.environ['FAKE_MODEL_LATENCY_MS'] = str(args.latency_ms)
+    os.environ['DATA_DIR'] = tempfile.mkdtemp(prefix='ahaar-bench-')
+    os.environ['UPLOAD_QUEUE_SIZE'] = str(max(args.level * 2, 32))
+    os.environ.pop('MONGO_URI', None)
+    import app
+    from analysis_cache import AnalysisCache
+
+    if args.store == 'mongomock':
+        use_mongomock(app)
+    app.analysis_cache = AnalysisCache(max_entries=0)
+    app.limiter.enabled = False
+    photo = make_photo(args.megapixels)
+    local = threading.local()
+
+    def one(i):
+        if not hasattr(local, 'client'):
+            local.client = app.app.test_client()
+        data = {'password': app.UPLOAD_PASSWORD, 'user_id': f'u{i}',
+                'image': (io.BytesIO(photo), 'photo.jpg', 'image/jpeg')}
+        if args.async_uploads:
+            data['async'] = '1'
+        response = local.client.post('/api/upload-meal', data=data)
+        assert response.status_code in (200, 202), response.get_data()
+        return response.json.get('job_id')
+
+    # Warm up imports, codecs and the thread pool so they are not billed to the uploads
+    with ThreadPoolExecutor(1) as pool:
+        job = pool.submit(one, -1).result()
+    if job:
+        app.upload_jobs.get(job, wait=60)
+    gc.collect()
+    baseline = rss_mb()
+    sampler = PeakSampler()
+    sampler.start()
+    with ThreadPoolExecutor(args.level) as pool:
+        jobs = list(pool.map(one, range(args.level)))
+    for job in filter(None, jobs):
+        app.upload_jobs.get(job, wait=120)
+    peak = sampler.stop()
+    return {'concurrency': args.level, 'photo_mb': round(len(photo) / 1e6, 2), 'baseline_mb': round(baseline, 1),
+            'peak_mb': round(peak, 1), 'per_upload_mb': round((peak - baseline) / args.level, 2)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 16])
+    parser.add_argument('--megapixels', type=float, default=12)
+    parser.add_argument('--latency-ms', type=float, default=300)
+    parser.add_argument('--store', choices=('csv', 'mongomock'), default='csv')
+    parser.add_argument('--async-uploads', action='store_true', help='post with async=1 and wait for the jobs')
+    parser.add_argument('--level', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.level:
+        print(json.dumps(run_level(args)))
+        return
+    cols = ['concurrency', 'photo_mb', 'baseline_mb', 'peak_mb', 'per_upload_mb']
+    print(''.join(f'{c:>15}' for c in cols))
+    for level in args.concurrency:
+        cmd = [sys.executable, __file__, '--level', str(level), '--megapixels', str(args.megapixels),
+               '--latency-ms', str(args.latency_ms), '--store', args.store]
+        if args.async_uploads:
+            cmd.append('--async-uploads')
+        out = subprocess.run(cmd, check=True, capture_output=True, text=True)
+        result = json.loads(out.stdout.strip().splitlines()[-1])
+        print(''.join(f'{result[c]:>15}' for c in cols))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+"""Check that the Mongo aggregation pipeline for /api/nutrition matches the Python path.
+
+Uses MONGO_URI when set (a scratch database is created and dropped),
+otherwise mongomock (`pip install mongomock`). Also prints the time each path takes (only meaningful
+against a real mongod; mongomock evaluates pipelines in Python). `--schema` picks the storage schema of the
+meal documents (meal_schema.py); `mixed` alternates them, as during a migration.
+
+    python benchmarks/check_nutrition_parity.py [--days 90] [--meals-per-day 4] [--schema 1|2|mixed]
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from synthetic import make_meals  # noqa: E402
+
+
+def get_collection():
+    uri = os.environ.pop('MONGO_URI', None)
+    if uri:
+        from pymongo import MongoClient
+        client = MongoClient(uri)
+        db = client[f"ahaar_parity_{os.getpid()}"]
+        return db['meals'], lambda: client.drop_database(db.name)
+    import mongomock
+    return mongomock.MongoClient()['ahaar']['meals'], lambda: None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--days', type=int, default=90)
+    parser.add_argument('--meals-per-day', type=int, default=4)
+    parser.add_argument('--schema', choices=('1', '2', 'mixed'), default='mixed')
+    args = parser.parse_args()
+
+    meals_col, cleanup = get_collection()
+    import app
+    from meal_schema import encode_meal
+    app.meals_col = meals_col
+
+    end = datetime(2025, 3, 31)
+    meals = make_meals('u1', args.days, args.meals_per_day, end=end) + make_meals('u2', args.days, 1, end=end, seed=11)
+    if args.schema != '1':
+        # Aggregates never read the insights, so they are not stored here
+        meals = [encode_meal(m)[0] if args.schema == '2' or i % 2 else m for i, m in enumerate(meals)]
+    meals_col.insert_many(meals)
+    meals_col.insert_one({'id': 'bare', 'user_id': 'u1', 'date': end.strftime('%Y-%m-%d')})
+    meals_col.create_index([('user_id', 1), ('date', 1)])
+
+    day = end.strftime('%Y-%m-%d')
+    windows = {
+        'daily': (day, day),
+        'weekly': ((end - timedelta(days=6)).strftime('%Y-%m-%d'), day),
+        'monthly': ((end - timedelta(days=30)).strftime('%Y-%m-%d'), day),
+        'empty': ('1999-01-01', '1999-01-01'),
+    }
+    failures = 0
+    try:
+        for label, (first, last) in windows.items():
+            start = time.perf_counter()
+            docs = list(app.with_nutrition(
+                meals_col.find({'user_id': 'u1', 'date': {'$gte': first, '$lte': last}}).sort('_id', 1), insights=False))
+            for m in docs:
+                m.setdefault('nutrition', {})
+            expected = app.aggregate_nutrition(docs, 'u1', first, last)
+            py_ms = (time.perf_counter() - start) * 1000
+            start = time.perf_counter()
+            actual = app.aggregate_nutrition_mongo('u1', first, last)
+            mongo_ms = (time.perf_counter() - start) * 1000
+            ok = _close(expected, actual)
+            failures += not ok
+            print(f"{label:<8} meals={len(expected['meals']):<4} python={py_ms:7.1f}ms "
+                  f"pipeline={mongo_ms:7.1f}ms {'OK' if ok else 'MISMATCH'}")
+    finally:
+        cleanup()
+    sys.exit(1 if failures else 0)
+
+
+def _close(a, b):
+    """Structural equality, allowing float rounding differences in sums"""
+    if isinstance(a, float) or isinstance(b, float):
+        return isinstance(a, (int, float)) and isinstance(b, (int, float)) and abs(a - b) <= 1e-6 * max(1, abs(a))
+    if isinstance(a, dict):
+        return isinstance(b, dict) and a.keys() == b.keys() and all(_close(a[k], b[k]) for k in a)
+    if isinstance(a, list):
+        return isinstance(b, list) and len(a) == len(b) and all(_close(x, y) for x, y in zip(a, b))
+    return a == b and type(a) is type(b)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,33 @@
+"""Synthetic meal histories shaped like real Gemini analyses, for benchmarks and parity checks."""
+import os
+import random
+import sys
+import uuid
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from providers import fake_nutrition  # noqa: E402
+
+
+def make_meals(user_id, days, meals_per_day=3, end=None, seed=7):
+    """Meals for `days` consecutive days ending at `end` (default today), oldest first"""
+    rng = random.Random(seed)
+    end = end or datetime.now()
+    meals = []
+    for d in range(days - 1, -1, -1):
+        day = end - timedelta(days=d)
+        for i in range(meals_per_day):
+            nutrition = fake_nutrition(rng)
+            ts = day.replace(hour=8 + i * 5, minute=rng.randint(0, 59), second=0, microsecond=0)
+            meals.append({
+                'id': str(uuid.UUID(int=rng.getrandbits(128))),
+                'user_id': user_id,
+                'name': nutrition['food_name'],
+                'time': ts.strftime('%H:%M'),
+                'date': ts.strftime('%Y-%m-%d'),
+                'calories': nutrition['calories'],
+                'nutrition': nutrition,
+                'timestamp': ts.isoformat()
+            })
+    return meals
@@ -0,0 +1,178 @@
+import bisect
+import csv
+import io
+import json
+import os
+import threading
+
+from sidecar import flock
+
+FIELDNAMES = ['id', 'user_id', 'date', 'time', 'name', 'calories', 'nutrition_json', 'timestamp']
+
+
+def _encode_row(meal):
+    buf = io.StringIO()
+    csv.DictWriter(buf, fieldnames=FIELDNAMES).writerow({
+        'id': meal['id'],
+        'user_id': meal['user_id'],
+        'date': meal['date'],
+        'time': meal['time'],
+        'name': meal['name'],
+        'calories': meal['calories'],
+        'nutrition_json': json.dumps(meal['nutrition']),
+        'timestamp': meal['timestamp']
+    })
+    return buf.getvalue().encode('utf-8')
+
+
+def row_to_meal(row):
+    """A meals.csv row (as a dict of strings) -> meal dict"""
+    return {
+        'id': row['id'],
+        'user_id': row['user_id'],
+        'date': row['date'],
+        'time': row['time'],
+        'name': row['name'],
+        'calories': int(float(row['calories'])),
+        'nutrition': json.loads(row['nutrition_json']) if row.get('nutrition_json') else {},
+        'timestamp': row['timestamp']
+    }
+
+
+class CsvMealStore:
+    """meals.csv with an in-memory (user_id, date) -> byte offset index, extended as rows are appended"""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._fieldnames = None
+        self._index = {}      # user_id -> date -> [(offset, length, timestamp, id), ...] in file order
+        self._dates = {}      # user_id -> sorted list of the dates in self._index[user_id]
+        self._indexed = 0     # bytes of the file covered by the index
+        self._stamp = None    # (inode, size, mtime) the index was last synced against
+
+    # ---------- index maintenance ----------
+    def _records(self, fh, start):
+        """Yield (offset, raw bytes) for each complete CSV record from `start`"""
+        fh.seek(start)
+        offset = start
+        pending = b''
+        pending_at = start
+        for line in fh:
+            if not pending:
+                pending_at = offset
+            offset += len(line)
+            pending += line
+            # A record can span lines only inside a quoted field
+            if pending.count(b'"') % 2 == 0 and pending.endswith(b'\n'):
+                yield pending_at, pending
+                pending = b''
+
+    def _sync(self):
+        """Bring the index up to date with the file; caller holds self._lock"""
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            self._reset()
+            return
+        stamp = (st.st_ino, st.st_size, st.st_mtime_ns)
+        if stamp == self._stamp:
+            return
+        if self._stamp is not None and (st.st_ino != self._stamp[0] or st.st_size < self._indexed):
+            # Replaced or truncated: start over
+            self._reset()
+        with open(self.path, 'rb') as fh, flock(fh, exclusive=False):
+            for offset, raw in self._records(fh, self._indexed):
+                row = next(csv.reader(io.StringIO(raw.decode('utf-8'))), None)
+                if self._fieldnames is None:
+                    self._fieldnames = row
+                elif row:
+                    record = dict(zip(self._fieldnames, row))
+                    user_id, date = record.get('user_id'), record.get('date', '')
+                    dates = self._index.setdefault(user_id, {})
+                    if date not in dates:
+                        dates[date] = []
+                        bisect.insort(self._dates.setdefault(user_id, []), date)
+                    dates[date].append((offset, len(raw), record.get('timestamp', ''), record.get('id', '')))
+                self._indexed = offset + len(raw)
+        self._stamp = stamp
+
+    # ---------- public API ----------
+    def append(self, meal):
+        self.append_many([meal])
+
+    def append_many(self, meals):
+        """Append rows under a single lock and write"""
+        if not meals:
+            return
+        data = b''.join(_encode_row(meal) for meal in meals)
+        with open(self.path, 'ab') as fh, flock(fh):
+            fh.seek(0, os.SEEK_END)
+            if fh.tell() == 0:
+                header = io.StringIO()
+                csv.DictWriter(header, fieldnames=FIELDNAMES).writeheader()
+                fh.write(header.getvalue().encode('utf-8'))
+            fh.write(data)
+
+    def _entries(self, user_id, dates=None, start=None, end=None):
+        """Index entries for a user, limited to `dates` and/or an inclusive date range"""
+        with self._lock:
+            self._sync()
+            by_date = self._index.get(user_id, {})
+            if dates is not None:
+                keys = [d for d in set(dates) if d in by_date]
+            else:
+                # Dates are ISO strings, so a range is a slice of the sorted list
+                sorted_dates = self._dates.get(user_id, [])
+                lo = bisect.bisect_left(sorted_dates, start) if start is not None else 0
+                hi = bisect.bisect_right(sorted_dates, end) if end is not None else len(sorted_dates)
+                keys = sorted_dates[lo:hi]
+            return [e for d in keys for e in by_date[d]], self._fieldnames
+
+    def find(self, user_id, dates=None, start=None, end=None):
+        """Meals for a user in file order, optionally limited to dates or a date range"""
+        entries, fieldnames = self._entries(user_id, dates, start, end)
+        entries.sort()
+        return list(self._read(entries, fieldnames))
+
+    def scan(self, user_id, start=None, end=None):
+        """Like find(), but yields meals one at a time (exports)"""
+        entries, fieldnames = self._entries(user_id, start=start, end=end)
+        entries.sort()
+        return self._read(entries, fieldnames)
+
+    def known_ids(self):
+        """Every meal id in the file (duplicate checks during imports)"""
+        with self._lock:
+            self._sync()
+            return {e[3] for dates in self._index.values() for entries in dates.values() for e in entries}
+
+    def page(self, user_id, dates=None, start=None, end=None, after=None, limit=None):
+        """Newest-first meals by (timestamp, id), strictly after the `after` key; only the page's rows are read"""
+        entries, fieldnames = self._entries(user_id, dates, start, end)
+        entries.sort(key=lambda e: (e[2], e[3]), reverse=True)
+        if after is not None:
+            entries = [e for e in entries if (e[2], e[3]) < after]
+        if limit is not None:
+            entries = entries[:limit]
+        return self._read(entries, fieldnames)
+
+    def iter_all(self):
+        """Every meal in file order (exports and rebuilds)"""
+        with self._lock:
+            self._sync()
+            entries = sorted(e for dates in self._index.values() for ee in dates.values() for e in ee)
+            fieldnames = self._fieldnames
+        return self._read(entries, fieldnames)
+
+    def _read(self, entries, fieldnames):
+        if not entries:
+            return
+        with open(self.path, 'rb') as fh:
+            for offset, length, _, _ in entries:
+                fh.seek(offset)
+                row = next(csv.reader(io.StringIO(fh.read(length).decode('utf-8'))))
+                yield row_to_meal(dict(zip(fieldnames, row)))
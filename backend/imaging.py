@@ -0,0 +1,83 @@
+import hashlib
+import io
+
+# PIL is imported inside the functions so importing this module (and app) stays cheap
+
+CONTENT_TYPES = {'JPEG': 'image/jpeg', 'WEBP': 'image/webp', 'PNG': 'image/png'}
+
+
+def content_hash(data: bytes):
+    """SHA-256 hex digest of the raw upload bytes"""
+    return hashlib.sha256(data).hexdigest()
+
+
+def dhash(image, hash_size=8):
+    """Difference hash of a PIL image as a 16-char hex string; stable across re-encoding and resizing"""
+    from PIL import Image
+    small = image.convert('L').resize((hash_size + 1, hash_size), Image.Resampling.BILINEAR)
+    # One byte per pixel in 'L' mode, row by row (getdata() is deprecated in Pillow 12)
+    pixels = small.tobytes()
+    bits = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            bits = (bits << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return f"{bits:0{hash_size * hash_size // 4}x}"
+
+
+def texture(image, hash_size=8):
+    """Spread (standard deviation) of the grey levels dhash() compares; near 0 for blank or flat images"""
+    from PIL import Image, ImageStat
+    small = image.convert('L').resize((hash_size + 1, hash_size), Image.Resampling.BILINEAR)
+    return ImageStat.Stat(small).stddev[0]
+
+
+def colour_signature(image, grid=2, levels=4):
+    """Mean colour of each cell of a grid x grid split, quantized to `levels` per channel, as hex"""
+    from PIL import Image
+    small = image.convert('RGB').resize((grid, grid), Image.Resampling.BOX)
+    return bytes(v * levels // 256 for v in small.tobytes()).hex()
+
+
+class InvalidImageError(ValueError):
+    pass
+
+
+def preprocess_image(src, max_edge=1280, fmt='JPEG', quality=85):
+    """Decode an upload (bytes or a seekable file) downscaled and EXIF-rotated; returns (image, encoded bytes)"""
+    from PIL import Image, ImageOps
+    fp = io.BytesIO(src) if isinstance(src, (bytes, bytearray)) else src
+    try:
+        # Structural check that reads the file but decodes no pixels
+        Image.open(fp).verify()
+        fp.seek(0)
+        image = Image.open(fp)
+        if image.format == 'JPEG':
+            # Let libjpeg decode at 1/2, 1/4 or 1/8 scale instead of full resolution
+            image.draft('RGB', (max_edge, max_edge))
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((max_edge, max_edge), Image.Resampling.LANCZOS)
+        if image.mode != 'RGB':
+            image = image.convert('RGB')
+    except (OSError, SyntaxError, ValueError, Image.DecompressionBombError) as e:
+        raise InvalidImageError(f'Unreadable image ({type(e).__name__})') from e
+    return image, encode_image(image, fmt, quality)
+
+
+def encode_image(image, fmt='JPEG', quality=85):
+    out = io.BytesIO()
+    if fmt == 'JPEG':
+        image.save(out, fmt, quality=quality, optimize=True, progressive=True)
+    else:
+        image.save(out, fmt, quality=quality)
+    return out.getvalue()
+
+
+def make_rendition(image, max_edge, fmt='JPEG', quality=80):
+    """Smaller copy of an already normalized image, encoded for serving"""
+    from PIL import Image
+    copy = image.copy()
+    copy.thumbnail((max_edge, max_edge), Image.Resampling.LANCZOS)
+    if copy.mode != 'RGB':
+        copy = copy.convert('RGB')
+    return encode_image(copy, fmt, quality)
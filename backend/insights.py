@@ -0,0 +1,263 @@
+"""Per-user weekly and monthly insight summaries for the dashboard panels."""
+import copy
+import threading
+import time
+from datetime import date, datetime, timedelta, timezone
+
+from pymongo import UpdateOne
+
+from rollups import NUTRITION_TOTAL_KEYS, bucket_start, meal_rollup, merge_rollup
+from sidecar import JsonFile
+
+# Summary period -> rollups bucket (weeks start Monday)
+INSIGHT_PERIODS = {'weekly': 'week', 'monthly': 'month'}
+
+# Numeric `advanced` fields averaged over the meals that have them: summary key -> path
+AVERAGED_INSIGHTS = {
+    'meal_health_score': ('meal_health_score',),
+    'glycemic_index': ('glycemic_index',),
+    'glycemic_load': ('glycemic_load',),
+    'antioxidant_orac': ('antioxidant_orac',),
+    'omega_3': ('fatty_acids', 'omega_3'),
+    'omega_6': ('fatty_acids', 'omega_6'),
+    'omega_3_to_6_ratio': ('fatty_acids', 'omega_3_to_6_ratio'),
+    'saturated_fat': ('fatty_acids', 'saturated_fat'),
+    'monounsaturated_fat': ('fatty_acids', 'monounsaturated_fat'),
+    'polyunsaturated_fat': ('fatty_acids', 'polyunsaturated_fat'),
+    'carbon_footprint_g_co2': ('environmental', 'carbon_footprint_g_co2'),
+    'water_usage_liters': ('environmental', 'water_usage_liters'),
+}
+HIGH_GLYCEMIC_LOAD = 20
+TOP_ALLERGENS = 5
+
+
+def period_bounds(day, period):
+    """(first, last) date of the week or calendar month containing `day`"""
+    start = bucket_start(day, INSIGHT_PERIODS[period])
+    if period == 'weekly':
+        return start, start + timedelta(days=6)
+    following = (start + timedelta(days=32)).replace(day=1)
+    return start, following - timedelta(days=1)
+
+
+def periods_touched(dates):
+    """{(period, first day ISO)} of every summary covering one of `dates` (ISO strings)"""
+    return {(period, period_bounds(date.fromisoformat(d), period)[0].isoformat())
+            for d in dates for period in INSIGHT_PERIODS}
+
+
+def _number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _lookup(advanced, path):
+    for key in path:
+        if not isinstance(advanced, dict):
+            return None
+        advanced = advanced.get(key)
+    return advanced
+
+
+def _tally(counts, labels, values):
+    """Count each distinct (case-insensitive) string in `values` once; the first spelling seen is kept"""
+    seen = set()
+    for value in values if isinstance(values, list) else ():
+        if not isinstance(value, str) or not value.strip():
+            continue
+        key = value.strip().lower()
+        if key in seen:
+            continue
+        seen.add(key)
+        counts[key] = counts.get(key, 0) + 1
+        labels.setdefault(key, value.strip())
+
+
+def _ranked(counts, labels):
+    # Most meals first, then alphabetically, so the order doesn't depend on how meals were read
+    return [(labels[k], n) for k, n in sorted(counts.items(), key=lambda item: (-item[1], item[0]))]
+
+
+def summarize_insights(meals):
+    """The summary of a period's decoded meals; fallback analyses count for nutrients, not insights"""
+    totals = {}
+    days = set()
+    analyzed = 0
+    sums, counts = {}, {}
+    high_load = 0
+    deficiencies, deficiency_labels = {}, {}
+    allergens, allergen_labels = {}, {}
+    for meal in meals:
+        nutrition = meal.get('nutrition') or {}
+        days.add(meal.get('date'))
+        merge_rollup(totals, meal_rollup(nutrition))
+        advanced = nutrition.get('advanced')
+        if nutrition.get('fallback') or not isinstance(advanced, dict) or not advanced:
+            continue
+        analyzed += 1
+        for key, path in AVERAGED_INSIGHTS.items():
+            value = _lookup(advanced, path)
+            if _number(value):
+                sums[key] = sums.get(key, 0) + value
+                counts[key] = counts.get(key, 0) + 1
+        if _number(advanced.get('glycemic_load')) and advanced['glycemic_load'] >= HIGH_GLYCEMIC_LOAD:
+            high_load += 1
+        _tally(deficiencies, deficiency_labels, advanced.get('deficiency_alerts'))
+        _tally(allergens, allergen_labels, advanced.get('potential_allergens'))
+
+    logged = len(days)
+    per_day = {key: round(totals.get(key, 0) / logged, 2) if logged else 0 for key in NUTRITION_TOTAL_KEYS}
+    for field in ('vitamins', 'minerals'):
+        per_day[field] = [{'name': v['name'], 'amount': round(v['amount'] / logged, 2), 'unit': v['unit']}
+                          for v in totals.get(field, {}).values()]
+    return {
+        'meals': totals.get('meals', 0),
+        'days_logged': logged,
+        'analyzed_meals': analyzed,
+        'per_meal_averages': {key: round(sums[key] / counts[key], 2) for key in AVERAGED_INSIGHTS if key in counts},
+        'per_day_averages': per_day,
+        'high_glycemic_load_meals': high_load,
+        'deficiencies': [{'alert': label, 'meals': n, 'frequency': round(n / analyzed, 3)}
+                         for label, n in _ranked(deficiencies, deficiency_labels)],
+        'top_allergens': [{'name': label, 'meals': n}
+                          for label, n in _ranked(allergens, allergen_labels)[:TOP_ALLERGENS]],
+    }
+
+
+# `version` goes up whenever a meal in the summary's period is saved and `built_version` is the
+# version it was computed at; a stale (or missing) summary is recomputed by InsightScheduler or
+# by the next read
+def is_fresh(doc):
+    return doc is not None and 'summary' in doc and doc.get('built_version') == doc.get('version', 0)
+
+
+def insight_response(doc):
+    """The /api/insights body for a stored summary"""
+    out = {k: doc[k] for k in ('user_id', 'period', 'start_date', 'end_date')}
+    out.update(doc['summary'])
+    out['updated_at'] = doc['updated_at']
+    return out
+
+
+class MongoInsightStore:
+    """insight_summaries collection, one document per (user_id, period, start_date)"""
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    @staticmethod
+    def _id(user_id, period, start):
+        return f'{user_id}:{period}:{start}'
+
+    def mark_stale(self, user_id, keys):
+        """Bump the version of the user's summaries at `keys` ({(period, start)})"""
+        self.collection.bulk_write([
+            UpdateOne({'_id': self._id(user_id, period, start)},
+                      {'$inc': {'version': 1},
+                       '$setOnInsert': {'user_id': user_id, 'period': period, 'start_date': start}},
+                      upsert=True)
+            for period, start in sorted(keys)
+        ], ordered=False)
+
+    def get(self, user_id, period, start):
+        return self.collection.find_one({'_id': self._id(user_id, period, start)}, {'_id': 0})
+
+    def put(self, user_id, period, start, end, summary, version):
+        """Store `summary`, computed at `version`; returns the stored document"""
+        fields = {'end_date': end, 'summary': summary, 'built_version': version,
+                  'updated_at': datetime.now(timezone.utc).isoformat()}
+        self.collection.update_one(
+            {'_id': self._id(user_id, period, start)},
+            {'$set': fields,
+             '$setOnInsert': {'user_id': user_id, 'period': period, 'start_date': start, 'version': version}},
+            upsert=True
+        )
+        return dict(fields, user_id=user_id, period=period, start_date=start)
+
+
+class FileInsightStore:
+    """Sidecar JSON file of summaries for CSV-only deployments: {user_id: {"period:start": summary}}"""
+
+    def __init__(self, path):
+        self.path = path
+        self.file = JsonFile(path)
+
+    def mark_stale(self, user_id, keys):
+        with self.file.locked():
+            data = copy.deepcopy(self.file.load())
+            docs = data.setdefault(user_id, {})
+            for period, start in keys:
+                doc = docs.setdefault(f'{period}:{start}', {'user_id': user_id, 'period': period, 'start_date': start})
+                doc['version'] = doc.get('version', 0) + 1
+            self.file.save(data)
+
+    def get(self, user_id, period, start):
+        doc = self.file.load().get(user_id, {}).get(f'{period}:{start}')
+        return copy.deepcopy(doc) if doc is not None else None
+
+    def put(self, user_id, period, start, end, summary, version):
+        with self.file.locked():
+            data = copy.deepcopy(self.file.load())
+            doc = data.setdefault(user_id, {}).setdefault(
+                f'{period}:{start}', {'user_id': user_id, 'period': period, 'start_date': start, 'version': version})
+            doc.update(end_date=end, summary=summary, built_version=version,
+                       updated_at=datetime.now(timezone.utc).isoformat())
+            self.file.save(data)
+            return copy.deepcopy(doc)
+
+
+class InsightScheduler:
+    """Refresh stale summaries in this process `delay` seconds after the upload that staled them"""
+
+    def __init__(self, refresh, delay=5.0):
+        self.refresh = refresh
+        self.delay = delay
+        self._pending = {}
+        self._cond = threading.Condition()
+        self._thread = None
+        self.metrics = {'scheduled': 0, 'refreshed': 0, 'failed': 0, 'run_seconds_total': 0.0}
+
+    def _ensure_worker(self):
+        # Started lazily so forking servers don't lose it
+        with self._cond:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._worker, daemon=True, name='insight-refresh')
+                self._thread.start()
+
+    def schedule(self, user_id, keys):
+        """Refresh the user's summaries at `keys` ({(period, start)}) after the delay"""
+        self._ensure_worker()
+        due = time.monotonic() + self.delay
+        with self._cond:
+            for period, start in keys:
+                if self._pending.setdefault((user_id, period, start), due) == due:
+                    self.metrics['scheduled'] += 1
+            self._cond.notify()
+
+    def snapshot(self):
+        with self._cond:
+            return dict(self.metrics, pending=len(self._pending))
+
+    def _take_due(self):
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                due = [key for key, at in self._pending.items() if at <= now]
+                if due:
+                    for key in due:
+                        del self._pending[key]
+                    return due
+                self._cond.wait(min(self._pending.values()) - now if self._pending else None)
+
+    def _worker(self):
+        while True:
+            for user_id, period, start in self._take_due():
+                started = time.monotonic()
+                try:
+                    self.refresh(user_id, period, start)
+                    outcome = 'refreshed'
+                except Exception as e:
+                    print(f"Failed to refresh {period} insights of {user_id} from {start}: {str(e)}")
+                    outcome = 'failed'
+                with self._cond:
+                    self.metrics[outcome] += 1
+                    self.metrics['run_seconds_total'] += time.monotonic() - started
@@ -0,0 +1,136 @@
+import queue
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+
+
+class QueueFullError(Exception):
+    pass
+
+
+class JobQueue:
+    """Bounded worker pool for background meal analysis; job state is mirrored to Mongo for other workers"""
+
+    def __init__(self, handler, workers=2, max_queue=32, collection=None, keep_seconds=3600):
+        self.handler = handler
+        self.workers = workers
+        self.collection = collection
+        self.keep_seconds = keep_seconds
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._threads = []
+        self.metrics = {
+            'submitted': 0, 'completed': 0, 'failed': 0, 'rejected': 0,
+            'wait_seconds_total': 0.0, 'run_seconds_total': 0.0, 'run_seconds_max': 0.0,
+        }
+
+    def _ensure_workers(self):
+        # Threads are started lazily so forking servers don't lose them
+        with self._lock:
+            self._threads = [t for t in self._threads if t.is_alive()]
+            while len(self._threads) < self.workers:
+                t = threading.Thread(target=self._worker, daemon=True, name=f"meal-job-{len(self._threads)}")
+                t.start()
+                self._threads.append(t)
+
+    def submit(self, user_id, payload):
+        """Queue a job and return its public state; raises QueueFullError on backpressure"""
+        self._ensure_workers()
+        job_id = str(uuid.uuid4())
+        job = {
+            'id': job_id,
+            'user_id': user_id,
+            'status': 'queued',
+            'created_at': datetime.now(timezone.utc).isoformat(),
+            'result': None,
+            'error': None,
+        }
+        entry = {'job': job, 'payload': payload, 'event': threading.Event(), 'queued_at': time.monotonic()}
+        with self._lock:
+            self._prune()
+            self._jobs[job_id] = entry
+        try:
+            self._queue.put_nowait(job_id)
+        except queue.Full:
+            with self._lock:
+                self._jobs.pop(job_id, None)
+                self.metrics['rejected'] += 1
+            raise QueueFullError('Upload queue is full')
+        with self._lock:
+            self.metrics['submitted'] += 1
+        self._persist(job)
+        return dict(job)
+
+    def get(self, job_id, wait=0):
+        """Return job state, blocking up to `wait` seconds for it to finish"""
+        with self._lock:
+            entry = self._jobs.get(job_id)
+        if entry is not None:
+            if wait and entry['job']['status'] in ('queued', 'running'):
+                entry['event'].wait(wait)
+            return dict(entry['job'])
+        if self.collection is None:
+            return None
+        deadline = time.monotonic() + wait
+        while True:
+            doc = self.collection.find_one({'id': job_id}, {'_id': 0})
+            if doc is None or doc['status'] not in ('queued', 'running') or time.monotonic() >= deadline:
+                return doc
+            time.sleep(0.25)
+
+    def snapshot(self):
+        with self._lock:
+            finished = self.metrics['completed'] + self.metrics['failed']
+            return dict(
+                self.metrics,
+                queue_depth=self._queue.qsize(),
+                queue_capacity=self._queue.maxsize,
+                workers=self.workers,
+                avg_wait_seconds=round(self.metrics['wait_seconds_total'] / finished, 4) if finished else 0,
+                avg_run_seconds=round(self.metrics['run_seconds_total'] / finished, 4) if finished else 0,
+            )
+
+    def _worker(self):
+        while True:
+            job_id = self._queue.get()
+            with self._lock:
+                entry = self._jobs.get(job_id)
+            if entry is None:
+                continue
+            job = entry['job']
+            started = time.monotonic()
+            job['status'] = 'running'
+            self._persist(job)
+            try:
+                job['result'] = self.handler(entry.pop('payload'))
+                job['status'] = 'done'
+            except Exception as e:
+                print(f"Upload job {job_id} failed: {str(e)}")
+                job['error'] = str(e)
+                job['status'] = 'failed'
+            finished = time.monotonic()
+            with self._lock:
+                self.metrics['completed' if job['status'] == 'done' else 'failed'] += 1
+                self.metrics['wait_seconds_total'] += started - entry['queued_at']
+                self.metrics['run_seconds_total'] += finished - started
+                self.metrics['run_seconds_max'] = max(self.metrics['run_seconds_max'], finished - started)
+            entry['finished_at'] = finished
+            job['finished_at'] = datetime.now(timezone.utc).isoformat()
+            self._persist(job)
+            entry['event'].set()
+
+    def _prune(self):
+        cutoff = time.monotonic() - self.keep_seconds
+        stale = [k for k, e in self._jobs.items() if e.get('finished_at', cutoff + 1) < cutoff]
+        for k in stale:
+            del self._jobs[k]
+
+    def _persist(self, job):
+        if self.collection is None:
+            return
+        try:
+            self.collection.replace_one({'id': job['id']}, dict(job), upsert=True)
+        except Exception as e:
+            print(f"Failed to persist upload job {job['id']}: {str(e)}")
@@ -0,0 +1,94 @@
+import csv
+import gzip
+import io
+import json
+import uuid
+import zlib
+from datetime import datetime
+
+from csv_store import row_to_meal
+from nutrition_schema import validate_nutrition
+
+IMPORT_FORMATS = ('ndjson', 'csv')
+
+
+def ndjson_lines(meals):
+    for meal in meals:
+        yield json.dumps(meal, default=str) + '\n'
+
+
+def gzip_chunks(chunks, level=6):
+    """Gzip a stream of str chunks incrementally (one member, standard gzip framing)"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode('utf-8'))
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def read_rows(fp, fmt='ndjson', gzipped=False):
+    """Raw rows from a binary file of NDJSON objects or meals.csv-style CSV"""
+    if gzipped:
+        fp = gzip.GzipFile(fileobj=fp)
+    text = io.TextIOWrapper(fp, encoding='utf-8', newline='' if fmt == 'csv' else None)
+    if fmt == 'csv':
+        # meals.csv layout: nutrition is the JSON text in `nutrition_json`
+        for row in csv.DictReader(text):
+            if 'nutrition_json' not in row:
+                yield row
+                continue
+            # Handed on as the row's error, so one bad row is counted as invalid instead of ending the import
+            try:
+                yield row_to_meal(row)
+            except KeyError as e:
+                yield ValueError(f'missing column {e}')
+            except (TypeError, ValueError) as e:
+                yield ValueError(str(e))
+        return
+    for number, line in enumerate(text, 1):
+        if line.strip():
+            try:
+                yield json.loads(line)
+            except ValueError:
+                yield ValueError(f'not valid JSON (line {number})')
+
+
+def meal_from_row(row, user_id=None):
+    """Validate an imported row into a meal document (owned by `user_id` if given); raises ValueError"""
+    if isinstance(row, Exception):
+        raise row
+    if not isinstance(row, dict):
+        raise ValueError('row is not an object')
+    owner = user_id or row.get('user_id')
+    try:
+        date = datetime.strptime(str(row.get('date') or ''), '%Y-%m-%d').date().isoformat()
+    except ValueError:
+        date = None
+    if not owner or not date:
+        raise ValueError('user_id and date (YYYY-MM-DD) are required')
+    nutrition = row.get('nutrition') or {}
+    if isinstance(nutrition, str):
+        nutrition = json.loads(nutrition)
+    if not isinstance(nutrition, dict):
+        raise ValueError('nutrition must be an object')
+    if nutrition:
+        # Checked like a model reply, so sums and rollups never meet a string amount or a missing unit
+        checked = validate_nutrition(nutrition)
+        if nutrition.get('fallback'):
+            checked['fallback'] = True
+        nutrition = checked
+    try:
+        calories = int(float(row.get('calories', nutrition.get('calories', 0)) or 0))
+    except (TypeError, ValueError):
+        raise ValueError('calories must be a number')
+    return {
+        'id': str(row.get('id') or uuid.uuid4()),
+        'user_id': str(owner),
+        'name': str(row.get('name') or nutrition.get('food_name') or ''),
+        'time': str(row.get('time') or ''),
+        'date': date,
+        'calories': calories,
+        'nutrition': nutrition,
+        'timestamp': str(row.get('timestamp') or f'{date}T00:00:00'),
+    }
@@ -0,0 +1,232 @@
+"""Compact storage schema for meal documents in Mongo (schema 2)."""
+import copy
+
+SCHEMA_VERSION = 2
+
+# Schema 1 (no `schema` field) stores the validated analysis verbatim under `nutrition`.
+# Schema 2 replaces it with `nu`:
+#   name, calories   top level as before; `nu.fn` / `nu.c` only when the analysis' food_name /
+#                    calories differ from them
+#   nu.sv, nu.cf     serving_size, confidence
+#   nu.p ... nu.ch   macronutrients and other_nutrients (COMPACT_FIELDS)
+#   nu.vt, nu.mn     vitamin / mineral amounts in NUTRIENT_DICTIONARIES order, null where missing
+#   nu.xv, nu.xm     [name, amount, unit] entries not in the dictionary (or not in its unit)
+#   nu.fl, nu.o      the fallback flag, any other analysis keys
+#   nu.ai            1: `advanced` is in meal_insights ({_id: meal id, user_id, advanced}); 0: empty
+# Decoding gives the analysis back as validated, except that vitamins and minerals come in
+# dictionary order, then the extras; an analysis that would not survive that is kept in schema 1.
+
+# (name, unit) per array slot. Slots are only ever appended, under a new schema
+# version, so stored arrays keep their meaning.
+NUTRIENT_DICTIONARIES = {
+    2: {
+        'vitamins': (('Vitamin A', 'μg'), ('Vitamin C', 'mg'), ('Vitamin D', 'μg'), ('Vitamin E', 'mg'),
+                     ('Vitamin K', 'μg'), ('Folate', 'μg'), ('B12', 'μg'), ('B6', 'mg')),
+        'minerals': (('Calcium', 'mg'), ('Iron', 'mg'), ('Magnesium', 'mg'), ('Phosphorus', 'mg'),
+                     ('Potassium', 'mg'), ('Zinc', 'mg'), ('Selenium', 'μg')),
+    },
+}
+
+# Analysis field -> (section, key in `nu`)
+COMPACT_FIELDS = {
+    'protein': ('macronutrients', 'p'),
+    'carbs': ('macronutrients', 'cb'),
+    'fat': ('macronutrients', 'ft'),
+    'fiber': ('macronutrients', 'fb'),
+    'sugar': ('macronutrients', 'sg'),
+    'sodium': ('other_nutrients', 'na'),
+    'cholesterol': ('other_nutrients', 'ch'),
+}
+MICRO_KEYS = {'vitamins': ('vt', 'xv'), 'minerals': ('mn', 'xm')}
+_KNOWN = {'food_name', 'serving_size', 'calories', 'macronutrients', 'micronutrients', 'other_nutrients',
+          'advanced', 'confidence', 'fallback'}
+
+# Fields a projection needs to decode `nutrition` from either schema
+NUTRITION_PROJECTION = {'schema': 1, 'nu': 1, 'nutrition': 1, 'name': 1, 'calories': 1}
+
+
+def _number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _same(a, b):
+    """Equal, with matching types all the way down (1 is not 1.0 or True in JSON)"""
+    if type(a) is not type(b):
+        return False
+    if isinstance(a, dict):
+        return a.keys() == b.keys() and all(_same(a[k], b[k]) for k in a)
+    if isinstance(a, list):
+        return len(a) == len(b) and all(_same(x, y) for x, y in zip(a, b))
+    return a == b
+
+
+def _encode_micro(items, dictionary):
+    slots = [None] * len(dictionary)
+    index = {entry: i for i, entry in enumerate(dictionary)}
+    extra = []
+    for item in items:
+        i = index.get((item.get('name'), item.get('unit')))
+        if i is not None and slots[i] is None and _number(item.get('amount')):
+            slots[i] = item['amount']
+        else:
+            extra.append([item.get('name'), item.get('amount'), item.get('unit')])
+    return slots, extra
+
+
+def _decode_micro(slots, extra, dictionary):
+    items = [{'name': name, 'amount': amount, 'unit': unit}
+             for (name, unit), amount in zip(dictionary, slots or ()) if amount is not None]
+    items.extend({'name': name, 'amount': amount, 'unit': unit} for name, amount, unit in extra or ())
+    return items
+
+
+def encode_meal(meal):
+    """(document, advanced) for storing `meal` in schema 2, or (schema 1 copy, None) if it can't round-trip"""
+    nutrition = meal.get('nutrition')
+    try:
+        doc, advanced = _encode(meal, nutrition)
+        round_trips = _same(decode_meal(doc, advanced)['nutrition'], _canonical(nutrition))
+    except (AttributeError, KeyError, TypeError, ValueError):
+        round_trips = False
+    if not round_trips:
+        return dict(meal), None
+    return doc, advanced
+
+
+def _encode(meal, nutrition):
+    dictionary = NUTRIENT_DICTIONARIES[SCHEMA_VERSION]
+    nu = {'sv': nutrition['serving_size'], 'cf': nutrition['confidence']}
+    if not _same(nutrition['food_name'], meal.get('name')):
+        nu['fn'] = nutrition['food_name']
+    if not _same(nutrition['calories'], meal.get('calories')):
+        nu['c'] = nutrition['calories']
+    for field, (section, key) in COMPACT_FIELDS.items():
+        nu[key] = nutrition[section][field]
+    for field, (slots_key, extra_key) in MICRO_KEYS.items():
+        slots, extra = _encode_micro(nutrition['micronutrients'][field], dictionary[field])
+        nu[slots_key] = slots
+        if extra:
+            nu[extra_key] = extra
+    if 'fallback' in nutrition:
+        nu['fl'] = nutrition['fallback']
+    other = {k: v for k, v in nutrition.items() if k not in _KNOWN}
+    if other:
+        nu['o'] = other
+    advanced = None
+    if 'advanced' in nutrition:
+        advanced = nutrition['advanced'] or None
+        nu['ai'] = 1 if advanced else 0
+    doc = {k: v for k, v in meal.items() if k != 'nutrition'}
+    doc['schema'] = SCHEMA_VERSION
+    doc['nu'] = nu
+    return doc, advanced
+
+
+def _canonical(nutrition):
+    """`nutrition` with vitamins and minerals in the order decoding produces"""
+    dictionary = NUTRIENT_DICTIONARIES[SCHEMA_VERSION]
+    out = dict(nutrition)
+    out['micronutrients'] = {field: _decode_micro(*_encode_micro(items, dictionary[field]), dictionary[field])
+                             for field, items in nutrition['micronutrients'].items()}
+    return out
+
+
+def decode_meal(doc, advanced=None):
+    """The meal with `nutrition` as the analysis, from a document in either schema"""
+    version = doc.get('schema')
+    if version is None:
+        return doc
+    dictionary = NUTRIENT_DICTIONARIES[version]
+    nu = doc.get('nu') or {}
+    nutrition = {
+        'food_name': nu.get('fn', doc.get('name')),
+        'serving_size': nu.get('sv'),
+        'calories': nu.get('c', doc.get('calories')),
+        'macronutrients': {},
+        'micronutrients': {field: _decode_micro(nu.get(slots_key), nu.get(extra_key), dictionary[field])
+                           for field, (slots_key, extra_key) in MICRO_KEYS.items()},
+        'other_nutrients': {},
+    }
+    for field, (section, key) in COMPACT_FIELDS.items():
+        nutrition[section][field] = nu.get(key)
+    if nu.get('ai') == 0:
+        nutrition['advanced'] = {}
+    elif nu.get('ai') == 1 and advanced is not None:
+        nutrition['advanced'] = copy.deepcopy(advanced)
+    nutrition['confidence'] = nu.get('cf')
+    if 'fl' in nu:
+        nutrition['fallback'] = nu['fl']
+    nutrition.update(nu.get('o') or {})
+    meal = {k: v for k, v in doc.items() if k not in ('schema', 'nu')}
+    meal['nutrition'] = nutrition
+    return meal
+
+
+def needs_insights(doc):
+    return doc.get('schema') is not None and (doc.get('nu') or {}).get('ai') == 1
+
+
+def insights_document(meal, advanced):
+    return {'_id': meal['id'], 'user_id': meal.get('user_id'), 'advanced': advanced}
+
+
+# ---------- aggregation expressions over both schemas ----------
+
+def _either(legacy, compact):
+    return {'$cond': [{'$eq': ['$schema', SCHEMA_VERSION]}, compact, legacy]}
+
+
+def total_expression(key, legacy_path):
+    """Aggregation expression for one NUTRITION_TOTAL_KEYS value of a meal in either schema"""
+    if key == 'calories':
+        return _either(legacy_path, {'$ifNull': ['$nu.c', '$calories']})
+    return _either(legacy_path, f'$nu.{COMPACT_FIELDS[key][1]}')
+
+
+def slot_accumulators(field):
+    """$group sums of each dictionary slot of `field` over schema 2 meals, and the first meal having it"""
+    path = f"$nu.{MICRO_KEYS[field][0]}"
+    accumulators = {}
+    for i in range(len(NUTRIENT_DICTIONARIES[SCHEMA_VERSION][field])):
+        value = {'$arrayElemAt': [path, i]}
+        accumulators[f'{field}_{i}'] = {'$sum': value}
+        accumulators[f'{field}_{i}_first'] = {'$min': {'$cond': [{'$isNumber': value}, '$_id', None]}}
+    return accumulators
+
+
+def extra_micronutrient_stages(field):
+    """Per-name sums of schema 2 meals' extra `field` entries, shaped like the schema 1 facet rows"""
+    path = f"$nu.{MICRO_KEYS[field][1]}"
+    return [
+        {'$unwind': {'path': path, 'includeArrayIndex': 'idx'}},
+        {'$group': {
+            '_id': {'$arrayElemAt': [path, 0]},
+            'amount': {'$sum': {'$arrayElemAt': [path, 1]}},
+            'unit': {'$first': {'$arrayElemAt': [path, 2]}},
+            'first_meal': {'$first': '$_id'},
+            'first_idx': {'$first': '$idx'}
+        }},
+    ]
+
+
+def merge_micronutrients(field, totals, legacy_rows, extra_rows):
+    """[{name, amount, unit}] in first-appearance order (by meal _id, then position in the decoded meal)"""
+    dictionary = NUTRIENT_DICTIONARIES[SCHEMA_VERSION][field]
+    rows = [(r['_id'], r['amount'], r['unit'], (r['first_meal'], r['first_idx'])) for r in legacy_rows]
+    for i, (name, unit) in enumerate(dictionary):
+        first = totals.get(f'{field}_{i}_first')
+        if first is not None:
+            rows.append((name, totals.get(f'{field}_{i}', 0), unit, (first, i)))
+    rows.extend((r['_id'], r['amount'], r['unit'], (r['first_meal'], len(dictionary) + r['first_idx']))
+                for r in extra_rows)
+    merged = {}
+    for name, amount, unit, first in rows:
+        if name not in merged:
+            merged[name] = [amount, unit, first]
+            continue
+        entry = merged[name]
+        entry[0] += amount
+        if first < entry[2]:
+            entry[1:] = [unit, first]
+    ordered = sorted(merged.items(), key=lambda item: item[1][2])
+    return [{'name': name, 'amount': amount, 'unit': unit} for name, (amount, unit, _) in ordered]
@@ -0,0 +1,166 @@
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import g, has_request_context
+from pymongo import monitoring
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values):
+    if not names:
+        return ''
+    return '{' + ','.join(f'{n}="{_escape(v)}"' for n, v in zip(names, values)) + '}'
+
+
+class Counter:
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lines.append(f'{self.name}{_labels(self.labelnames, labels)} {value}')
+        return lines
+
+
+class Gauge:
+    """Value(s) read from `fn` at scrape time: a number, or {label values tuple: number}"""
+
+    def __init__(self, name, help_text, fn, labelnames=(), kind='gauge'):
+        self.name = name
+        self.help = help_text
+        self.fn = fn
+        self.labelnames = tuple(labelnames)
+        self.kind = kind
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}']
+        values = self.fn()
+        if not self.labelnames:
+            lines.append(f'{self.name} {values}')
+        else:
+            for labels, value in sorted(values.items()):
+                lines.append(f'{self.name}{_labels(self.labelnames, labels)} {value}')
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}  # labels -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        names = self.labelnames + ('le',)
+        with self._lock:
+            for labels, series in sorted(self._series.items()):
+                for bound, count in zip(self.buckets, series):
+                    lines.append(f'{self.name}_bucket{_labels(names, labels + (bound,))} {count}')
+                lines.append(f'{self.name}_bucket{_labels(names, labels + ("+Inf",))} {series[-1]}')
+                lines.append(f'{self.name}_sum{_labels(self.labelnames, labels)} {series[-2]:.6f}')
+                lines.append(f'{self.name}_count{_labels(self.labelnames, labels)} {series[-1]}')
+        return lines
+
+
+class Registry:
+    """Just enough of the Prometheus text format for this app; one registry per worker process"""
+
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+REQUEST_SECONDS = registry.register(Histogram(
+    'ahaar_http_request_duration_seconds', 'Request latency by route', ('method', 'route', 'status')))
+STAGE_SECONDS = registry.register(Histogram(
+    'ahaar_stage_duration_seconds', 'Time spent in hot-path stages (image decode, model call, GridFS)', ('stage',)))
+MONGO_SECONDS = registry.register(Histogram(
+    'ahaar_mongo_command_duration_seconds', 'MongoDB command latency', ('command', 'outcome')))
+ANALYSIS_EVENTS = registry.register(Counter(
+    'ahaar_analysis_events_total', 'Model analysis outcomes (fallbacks, retries, parse failures...)', ('event',)))
+MODEL_QUEUE_SECONDS = registry.register(Histogram(
+    'ahaar_model_queue_wait_seconds', 'Time model calls waited for a concurrency slot and rate token', ('outcome',)))
+RATE_LIMITED = registry.register(Counter(
+    'ahaar_rate_limited_total', 'Requests rejected by the rate limiter', ('route',)))
+
+
+def record_timing(name, seconds):
+    """Add to the current request's Server-Timing entries (no-op outside a request)"""
+    if has_request_context():
+        timings = g.setdefault('server_timings', {})
+        timings[name] = timings.get(name, 0.0) + seconds
+
+
+@contextmanager
+def timed(stage):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.observe(elapsed, stage)
+        record_timing(stage, elapsed)
+
+
+def server_timing_header(timings, total=None):
+    parts = [f'{name};dur={seconds * 1000:.1f}' for name, seconds in timings.items()]
+    if total is not None:
+        parts.append(f'total;dur={total * 1000:.1f}')
+    return ', '.join(parts)
+
+
+class MongoTimingListener(monitoring.CommandListener):
+    """Feeds MONGO_SECONDS and the request's Server-Timing from pymongo command events"""
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        seconds = event.duration_micros / 1e6
+        MONGO_SECONDS.observe(seconds, event.command_name, 'ok')
+        record_timing('mongo', seconds)
+
+    def failed(self, event):
+        seconds = event.duration_micros / 1e6
+        MONGO_SECONDS.observe(seconds, event.command_name, 'error')
+        record_timing('mongo', seconds)
@@ -0,0 +1,179 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import asynccontextmanager, contextmanager
+
+
+class ModelBusyError(RuntimeError):
+    pass
+
+
+class ModelGate:
+    """Admission control for model calls: a per-worker concurrency cap and a rate shared by all workers"""
+
+    KEY = 'model-calls'
+
+    def __init__(self, max_concurrency=0, rate=None, strategy=None, timeout=30.0, on_wait=None):
+        self.rate = rate
+        self.strategy = strategy
+        self.timeout = timeout
+        self.on_wait = on_wait
+        self._slots = threading.BoundedSemaphore(max_concurrency) if max_concurrency > 0 else None
+        self._lock = threading.Lock()
+        self.stats = {'admitted': 0, 'timeouts': 0, 'waiting': 0, 'in_flight': 0}
+
+    def _bump(self, stat, amount=1):
+        with self._lock:
+            self.stats[stat] += amount
+
+    def _take_token(self, deadline):
+        while not self.strategy.hit(self.rate, self.KEY):
+            reset_at = self.strategy.get_window_stats(self.rate, self.KEY).reset_time
+            now = time.monotonic()
+            if now >= deadline:
+                return False
+            time.sleep(max(min(reset_at - time.time(), deadline - now), 0.01))
+        return True
+
+    def _admit(self, deadline):
+        if self._slots is not None and not self._slots.acquire(timeout=max(deadline - time.monotonic(), 0)):
+            return False
+        if self.rate is not None and self.strategy is not None and not self._take_token(deadline):
+            if self._slots is not None:
+                self._slots.release()
+            return False
+        return True
+
+    async def _take_token_async(self, deadline):
+        while not await asyncio.to_thread(self.strategy.hit, self.rate, self.KEY):
+            reset_at = self.strategy.get_window_stats(self.rate, self.KEY).reset_time
+            now = time.monotonic()
+            if now >= deadline:
+                return False
+            await asyncio.sleep(max(min(reset_at - time.time(), deadline - now), 0.01))
+        return True
+
+    async def _admit_async(self, deadline):
+        # Polls the same semaphore as the threads, so sync and async callers share the cap
+        if self._slots is not None:
+            delay = 0.002
+            while not self._slots.acquire(blocking=False):
+                if time.monotonic() >= deadline:
+                    return False
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 0.05)
+        if self.rate is not None and self.strategy is not None and not await self._take_token_async(deadline):
+            if self._slots is not None:
+                self._slots.release()
+            return False
+        return True
+
+    def _admitted(self, started, admitted):
+        waited = time.monotonic() - started
+        if self.on_wait is not None:
+            self.on_wait(waited, 'admitted' if admitted else 'timeout')
+        if not admitted:
+            self._bump('timeouts')
+            raise ModelBusyError(f'No model capacity within {self.timeout:g}s')
+        self._bump('admitted')
+        self._bump('in_flight')
+        return waited
+
+    def _release(self):
+        self._bump('in_flight', -1)
+        if self._slots is not None:
+            self._slots.release()
+
+    @contextmanager
+    def slot(self):
+        started = time.monotonic()
+        self._bump('waiting')
+        try:
+            admitted = self._admit(started + self.timeout)
+        finally:
+            self._bump('waiting', -1)
+        waited = self._admitted(started, admitted)
+        try:
+            yield waited
+        finally:
+            self._release()
+
+    @asynccontextmanager
+    async def async_slot(self):
+        """slot() for coroutines: waiting happens on the event loop, not on a thread"""
+        started = time.monotonic()
+        self._bump('waiting')
+        try:
+            admitted = await self._admit_async(started + self.timeout)
+        finally:
+            self._bump('waiting', -1)
+        waited = self._admitted(started, admitted)
+        try:
+            yield waited
+        finally:
+            self._release()
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.stats)
+
+
+class Coalescer:
+    """One call per key at a time: callers arriving while it runs wait for its result instead"""
+
+    def __init__(self):
+        self._calls = {}
+        self._async_calls = {}  # key -> asyncio.Future, for callers on the event loop
+        self._lock = threading.Lock()
+        self.coalesced = 0
+
+    def run(self, key, fn):
+        """fn()'s result and whether this caller shared another caller's call"""
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+            else:
+                self.coalesced += 1
+        if not leader:
+            return future.result(), True
+        try:
+            result = fn()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result, False
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+
+    async def run_async(self, key, fn):
+        """run() for coroutines: `fn` returns an awaitable; followers await the leader's future"""
+        future = self._async_calls.get(key)
+        if future is not None:
+            self.coalesced += 1
+            return await asyncio.shield(future), True
+        future = self._async_calls[key] = asyncio.get_running_loop().create_future()
+        try:
+            result = await fn()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            # Mark it retrieved so an exception nobody awaited doesn't get logged
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+            return result, False
+        finally:
+            self._async_calls.pop(key, None)
+
+    def in_flight(self):
+        with self._lock:
+            return len(self._calls) + len(self._async_calls)
@@ -0,0 +1,240 @@
+import copy
+import json
+import re
+from typing import List, TypedDict
+
+
+class NutrientAmount(TypedDict):
+    name: str
+    amount: float
+    unit: str
+
+
+class Macronutrients(TypedDict):
+    protein: float
+    carbs: float
+    fat: float
+    fiber: float
+    sugar: float
+
+
+class Micronutrients(TypedDict):
+    vitamins: List[NutrientAmount]
+    minerals: List[NutrientAmount]
+
+
+class OtherNutrients(TypedDict):
+    sodium: float
+    cholesterol: float
+
+
+class NutritionInfo(TypedDict, total=False):
+    """A validated analysis, as stored under a meal's `nutrition`"""
+    food_name: str
+    serving_size: str
+    calories: float
+    macronutrients: Macronutrients
+    micronutrients: Micronutrients
+    other_nutrients: OtherNutrients
+    advanced: dict
+    confidence: float
+    fallback: bool
+
+
+def _obj(properties, required=None):
+    schema = {'type': 'OBJECT', 'properties': properties}
+    if required:
+        schema['required'] = required
+    return schema
+
+
+_NUM = {'type': 'NUMBER'}
+_STR = {'type': 'STRING'}
+_STRS = {'type': 'ARRAY', 'items': _STR}
+_AMOUNTS = {'type': 'ARRAY', 'items': _obj({'name': _STR, 'amount': _NUM, 'unit': _STR}, ['name', 'amount', 'unit'])}
+
+# Gemini `response_schema` (OpenAPI subset) mirroring the structure the prompt asks for
+RESPONSE_SCHEMA = _obj({
+    'food_name': _STR,
+    'serving_size': _STR,
+    'calories': _NUM,
+    'macronutrients': _obj({k: _NUM for k in Macronutrients.__annotations__}, list(Macronutrients.__annotations__)),
+    'micronutrients': _obj({'vitamins': _AMOUNTS, 'minerals': _AMOUNTS}, ['vitamins', 'minerals']),
+    'other_nutrients': _obj({'sodium': _NUM, 'cholesterol': _NUM}, ['sodium', 'cholesterol']),
+    'advanced': _obj({
+        'glycemic_index': _NUM,
+        'glycemic_load': _NUM,
+        'amino_acid_profile': _obj({'leucine': _NUM, 'valine': _NUM, 'lysine': _NUM}),
+        'fatty_acids': _obj({k: _NUM for k in ('omega_3', 'omega_6', 'omega_3_to_6_ratio', 'saturated_fat',
+                                                 'monounsaturated_fat', 'polyunsaturated_fat')}),
+        'antioxidant_orac': _NUM,
+        'meal_health_score': _NUM,
+        'diet_compatibility': _STRS,
+        'potential_allergens': _STRS,
+        'deficiency_alerts': _STRS,
+        'excessive_intake_alerts': _STRS,
+        'workout_energy_match': _STR,
+        'burn_time_equivalents': _obj({'walking_minutes': _NUM, 'jogging_minutes': _NUM, 'cycling_minutes': _NUM}),
+        'environmental': _obj({
+            'carbon_footprint_g_co2': _NUM,
+            'water_usage_liters': _NUM,
+            'sourcing': _obj({'local': {'type': 'BOOLEAN'}, 'organic': {'type': 'BOOLEAN'}}),
+        }),
+        'historical': _obj({'meal_history_impact': _STR, 'trend_suggestions': _STRS, 'ai_suggestions': _STRS}),
+    }),
+    'confidence': _NUM,
+}, ['food_name', 'serving_size', 'calories', 'macronutrients', 'micronutrients', 'other_nutrients', 'confidence'])
+
+
+def _num(value, field, default=0):
+    if value is None:
+        return default
+    if isinstance(value, bool):
+        raise ValueError(f"'{field}' must be a number")
+    if isinstance(value, (int, float)):
+        return value
+    try:
+        number = float(str(value).strip())
+    except ValueError:
+        raise ValueError(f"'{field}' must be a number, got {value!r}")
+    return int(number) if number.is_integer() else number
+
+
+def _amounts(items, field):
+    out = []
+    for item in items or []:
+        # Drop malformed entries rather than rejecting the whole analysis
+        if not isinstance(item, dict) or not item.get('name'):
+            continue
+        try:
+            amount = _num(item.get('amount'), f'{field}.amount')
+        except ValueError:
+            continue
+        out.append({'name': str(item['name']), 'amount': amount, 'unit': str(item.get('unit') or '')})
+    return out
+
+
+def validate_nutrition(data) -> NutritionInfo:
+    """Check and normalize a parsed model reply; raises ValueError if it is unusable"""
+    if not isinstance(data, dict):
+        raise ValueError('Analysis is not a JSON object')
+    food_name = data.get('food_name')
+    if not isinstance(food_name, str) or not food_name.strip():
+        raise ValueError("'food_name' is missing")
+    if data.get('calories') is None:
+        raise ValueError("'calories' is missing")
+    calories = _num(data.get('calories'), 'calories')
+    if calories < 0:
+        raise ValueError("'calories' must not be negative")
+    macro = data.get('macronutrients') if isinstance(data.get('macronutrients'), dict) else {}
+    micro = data.get('micronutrients') if isinstance(data.get('micronutrients'), dict) else {}
+    other = data.get('other_nutrients') if isinstance(data.get('other_nutrients'), dict) else {}
+    return {
+        'food_name': food_name.strip(),
+        'serving_size': str(data.get('serving_size') or '1 serving'),
+        'calories': calories,
+        'macronutrients': {k: _num(macro.get(k), k) for k in Macronutrients.__annotations__},
+        'micronutrients': {
+            'vitamins': _amounts(micro.get('vitamins'), 'vitamins'),
+            'minerals': _amounts(micro.get('minerals'), 'minerals'),
+        },
+        'other_nutrients': {k: _num(other.get(k), k) for k in OtherNutrients.__annotations__},
+        'advanced': data.get('advanced') if isinstance(data.get('advanced'), dict) else {},
+        'confidence': _num(data.get('confidence'), 'confidence'),
+    }
+
+
+def parse_nutrition_response(text) -> NutritionInfo:
+    """Parse and validate a model reply (tolerates markdown fences around the JSON)"""
+    start_idx = text.find('{')
+    end_idx = text.rfind('}') + 1
+    if start_idx == -1 or end_idx == 0:
+        raise ValueError('No valid JSON found in response')
+    return validate_nutrition(json.loads(text[start_idx:end_idx]))
+
+
+_PARTIAL_FIELDS = {
+    'food_name': re.compile(r'"food_name"\s*:\s*"((?:[^"\\]|\\.)*)"'),
+    # A number is only complete once something follows it
+    'calories': re.compile(r'"calories"\s*:\s*(-?\d+(?:\.\d+)?)\s*[,}\n]'),
+}
+
+
+def scan_partial(text, seen):
+    """Top-level fields that became parseable in a partial reply and are not in `seen`"""
+    found = {}
+    for field, pattern in _PARTIAL_FIELDS.items():
+        if field in seen:
+            continue
+        match = pattern.search(text)
+        if match:
+            found[field] = json.loads(f'"{match.group(1)}"') if field == 'food_name' else _num(match.group(1), field)
+    return found
+
+
+FALLBACK_NUTRITION = {
+    "food_name": "Unknown Food",
+    "serving_size": "1 serving",
+    "calories": 300,
+    "macronutrients": {
+        "protein": 15,
+        "carbs": 30,
+        "fat": 10,
+        "fiber": 5,
+        "sugar": 8
+    },
+    "micronutrients": {
+        "vitamins": [
+            {"name": "Vitamin A", "amount": 100, "unit": "μg"},
+            {"name": "Vitamin C", "amount": 10, "unit": "mg"},
+            {"name": "Vitamin D", "amount": 2, "unit": "μg"},
+            {"name": "Vitamin E", "amount": 1, "unit": "mg"},
+            {"name": "Vitamin K", "amount": 10, "unit": "μg"},
+            {"name": "Folate", "amount": 40, "unit": "μg"},
+            {"name": "B12", "amount": 0.5, "unit": "μg"}
+        ],
+        "minerals": [
+            {"name": "Calcium", "amount": 100, "unit": "mg"},
+            {"name": "Iron", "amount": 2, "unit": "mg"},
+            {"name": "Magnesium", "amount": 50, "unit": "mg"},
+            {"name": "Phosphorus", "amount": 100, "unit": "mg"},
+            {"name": "Potassium", "amount": 400, "unit": "mg"},
+            {"name": "Zinc", "amount": 1, "unit": "mg"}
+        ]
+    },
+    "other_nutrients": {
+        "sodium": 200,
+        "cholesterol": 20
+    },
+    "advanced": {
+        "glycemic_index": 55,
+        "glycemic_load": 12,
+        "amino_acid_profile": {"leucine": 1200, "valine": 900, "lysine": 800},
+        "fatty_acids": {
+            "omega_3": 0.2,
+            "omega_6": 1.1,
+            "omega_3_to_6_ratio": 0.18,
+            "saturated_fat": 3,
+            "monounsaturated_fat": 4,
+            "polyunsaturated_fat": 2
+        },
+        "antioxidant_orac": 1500,
+        "meal_health_score": 6.5,
+        "diet_compatibility": ["balanced"],
+        "potential_allergens": [],
+        "deficiency_alerts": ["Low Vitamin D"],
+        "excessive_intake_alerts": [],
+        "workout_energy_match": "Suitable for a light 30-minute jog",
+        "burn_time_equivalents": {"walking_minutes": 60, "jogging_minutes": 30, "cycling_minutes": 25},
+        "environmental": {"carbon_footprint_g_co2": 800, "water_usage_liters": 200, "sourcing": {"local": False, "organic": False}},
+        "historical": {"meal_history_impact": "Occasional", "trend_suggestions": ["Increase greens"], "ai_suggestions": ["Add spinach for iron"]}
+    },
+    "confidence": 0
+}
+
+
+def fallback_nutrition() -> NutritionInfo:
+    """Placeholder used when the model gives no usable answer; flagged so it is never mistaken for data"""
+    nutrition = copy.deepcopy(FALLBACK_NUTRITION)
+    nutrition['fallback'] = True
+    return nutrition
@@ -0,0 +1,107 @@
+from datetime import datetime, timedelta
+
+from sidecar import JsonFile
+
+# A 64-bit dHash (16 hex chars) is split into 8 bands of 8 bits. Two hashes within
+# Hamming distance 7 differ in at most 7 bands, so they share at least one band
+# exactly: looking up the bands finds every match up to that distance.
+BANDS = 8
+
+
+def hamming(a, b):
+    """Number of differing bits between two hex hashes"""
+    return (int(a, 16) ^ int(b, 16)).bit_count()
+
+
+def phash_bands(phash):
+    width = len(phash) // BANDS
+    return [f"{i}:{phash[i * width:(i + 1) * width]}" for i in range(BANDS)]
+
+
+def _matches(candidates, phash, max_distance):
+    found = []
+    for c in candidates:
+        distance = hamming(phash, c['phash'])
+        if distance <= max_distance:
+            found.append(dict(c, distance=distance))
+    # Closest first, most recent among equals (sorts are stable)
+    found.sort(key=lambda c: c['timestamp'], reverse=True)
+    found.sort(key=lambda c: c['distance'])
+    return found
+
+
+class MongoPhashIndex:
+    """Reads `phash`/`phash_bands` stored on the meal documents themselves"""
+
+    def __init__(self, meals_col):
+        self.meals = meals_col
+
+    @staticmethod
+    def fields(phash):
+        return {'phash': phash, 'phash_bands': phash_bands(phash)}
+
+    def ensure_indexes(self):
+        self.meals.create_index([('user_id', 1), ('phash_bands', 1), ('timestamp', -1)], sparse=True)
+
+    def add(self, meal, phash):
+        # save_meals writes fields() into the meal document itself
+        pass
+
+    def find(self, user_id, phash, since, max_distance):
+        """Meals of `user_id` uploaded at or after `since` within `max_distance` bits"""
+        q = {'user_id': user_id, 'timestamp': {'$gte': since.isoformat()}, 'phash': {'$exists': True}}
+        if max_distance < BANDS:
+            q['phash_bands'] = {'$in': phash_bands(phash)}
+        projection = {'_id': 0, 'id': 1, 'date': 1, 'time': 1, 'name': 1, 'timestamp': 1, 'phash': 1}
+        return _matches(self.meals.find(q, projection), phash, max_distance)
+
+
+def _with_buckets(data):
+    """The file's contents and, per user, its entries grouped by band"""
+    buckets = {}
+    for user_id, entries in data.items():
+        user_buckets = buckets.setdefault(user_id, {})
+        for entry in entries:
+            for band in phash_bands(entry['phash']):
+                user_buckets.setdefault(band, []).append(entry)
+    return data, buckets
+
+
+class FilePhashIndex:
+    """Sidecar JSON of each user's hashes from the last `retention`, for CSV-only deployments"""
+
+    def __init__(self, path, retention=timedelta(hours=24)):
+        self.path = path
+        self.retention = retention
+        self.file = JsonFile(path, derive=_with_buckets)
+
+    @staticmethod
+    def fields(phash):
+        return {}
+
+    def ensure_indexes(self):
+        pass
+
+    def add(self, meal, phash):
+        cutoff = (datetime.now() - self.retention).isoformat()
+        entry = {'id': meal['id'], 'date': meal['date'], 'time': meal['time'], 'name': meal['name'],
+                 'timestamp': meal['timestamp'], 'phash': phash}
+        with self.file.locked():
+            data, _ = self.file.load()
+            data = dict(data)
+            data[meal['user_id']] = [e for e in data.get(meal['user_id'], []) if e['timestamp'] >= cutoff] + [entry]
+            self.file.save(data)
+
+    def find(self, user_id, phash, since, max_distance):
+        data, buckets = self.file.load()
+        if max_distance < BANDS:
+            user_buckets = buckets.get(user_id, {})
+            seen = {}
+            for band in phash_bands(phash):
+                for entry in user_buckets.get(band, ()):
+                    seen[entry['id']] = entry
+            candidates = seen.values()
+        else:
+            candidates = data.get(user_id, [])
+        since = since.isoformat()
+        return _matches([c for c in candidates if c['timestamp'] >= since], phash, max_distance)
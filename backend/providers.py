@@ -0,0 +1,146 @@
+import asyncio
+import json
+import os
+import random
+import threading
+import time
+
+from imaging import dhash
+
+
+class ProviderError(Exception):
+    pass
+
+
+class GeminiProvider:
+    """google-generativeai model; the SDK is configured on first use"""
+
+    name = 'gemini'
+
+    def __init__(self, model_name='gemini-1.5-flash', api_key=None):
+        self.model_name = model_name
+        self.api_key = api_key
+        self._model = None
+        self._lock = threading.Lock()
+
+    @property
+    def configured(self):
+        return bool(self.api_key)
+
+    def _get_model(self):
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    import google.generativeai as genai
+                    genai.configure(api_key=self.api_key)
+                    self._model = genai.GenerativeModel(self.model_name)
+        return self._model
+
+    def generate_content(self, parts, generation_config=None, stream=False):
+        return self._get_model().generate_content(parts, generation_config=generation_config, stream=stream)
+
+    async def generate_content_async(self, parts, generation_config=None):
+        return await self._get_model().generate_content_async(parts, generation_config=generation_config)
+
+
+class _Reply:
+    def __init__(self, text):
+        self.text = text
+
+
+FAKE_FOODS = ['Dal Tadka', 'Paneer Tikka', 'Masala Dosa', 'Veg Biryani', 'Chole Bhature', 'Idli Sambar',
+              'Rajma Chawal', 'Poha', 'Aloo Paratha', 'Fruit Salad']
+FAKE_VITAMINS = [('Vitamin A', 'μg'), ('Vitamin C', 'mg'), ('Vitamin D', 'μg'), ('Vitamin E', 'mg'),
+                 ('Vitamin K', 'μg'), ('Folate', 'μg'), ('B12', 'μg'), ('B6', 'mg')]
+FAKE_MINERALS = [('Calcium', 'mg'), ('Iron', 'mg'), ('Magnesium', 'mg'), ('Phosphorus', 'mg'),
+                 ('Potassium', 'mg'), ('Zinc', 'mg'), ('Selenium', 'μg')]
+FAKE_ALLERGENS = ['gluten', 'dairy', 'nuts', 'soy', 'egg']
+FAKE_ALERTS = ['Low Vitamin D', 'Low Iron', 'Low Fiber', 'Low Calcium', 'Low B12']
+
+
+def fake_nutrition(rng: random.Random):
+    """A plausible analysis; vitamin/mineral subsets and order vary like real model output"""
+    vitamins = rng.sample(FAKE_VITAMINS, rng.randint(0, len(FAKE_VITAMINS)))
+    minerals = rng.sample(FAKE_MINERALS, rng.randint(0, len(FAKE_MINERALS)))
+    return {
+        'food_name': rng.choice(FAKE_FOODS),
+        'serving_size': '1 plate',
+        'calories': rng.randint(80, 900),
+        'macronutrients': {
+            'protein': rng.randint(1, 45), 'carbs': rng.randint(5, 120), 'fat': round(rng.uniform(0, 40), 1),
+            'fiber': rng.randint(0, 15), 'sugar': rng.randint(0, 30)
+        },
+        'micronutrients': {
+            'vitamins': [{'name': n, 'amount': round(rng.uniform(0.1, 200), 2), 'unit': u} for n, u in vitamins],
+            'minerals': [{'name': n, 'amount': round(rng.uniform(0.1, 500), 2), 'unit': u} for n, u in minerals]
+        },
+        'other_nutrients': {'sodium': rng.randint(0, 1500), 'cholesterol': rng.randint(0, 200)},
+        'advanced': {
+            'glycemic_index': rng.randint(20, 95),
+            'glycemic_load': rng.randint(1, 40),
+            'fatty_acids': {'omega_3': round(rng.uniform(0, 2), 2), 'omega_6': round(rng.uniform(0, 8), 2),
+                            'saturated_fat': round(rng.uniform(0, 15), 1)},
+            'meal_health_score': round(rng.uniform(2, 10), 1),
+            'potential_allergens': rng.sample(FAKE_ALLERGENS, rng.randint(0, 2)),
+            'deficiency_alerts': rng.sample(FAKE_ALERTS, rng.randint(0, 2)),
+            'historical': {'ai_suggestions': ['Add leafy greens', 'Swap refined flour for whole grain']}
+        },
+        'confidence': rng.randint(40, 99)
+    }
+
+
+class FakeProvider:
+    """Local stand-in for Gemini (same image, same analysis) with seeded latency and failures"""
+
+    name = 'fake'
+    configured = True
+
+    def __init__(self, latency_ms=0, jitter_ms=0, failure_rate=0.0, seed=0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.failure_rate = failure_rate
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _draw(self):
+        """(delay in seconds, whether this call fails) for the next call"""
+        with self._lock:
+            delay = max(self.latency_ms + self._rng.uniform(-self.jitter_ms, self.jitter_ms), 0) / 1000
+            return delay, self._rng.random() < self.failure_rate
+
+    def generate_content(self, parts, generation_config=None, stream=False):
+        delay, fail = self._draw()
+        time.sleep(delay)
+        if fail:
+            raise ProviderError('Simulated model failure')
+        return self._reply(parts, stream)
+
+    async def generate_content_async(self, parts, generation_config=None):
+        delay, fail = self._draw()
+        await asyncio.sleep(delay)
+        if fail:
+            raise ProviderError('Simulated model failure')
+        return self._reply(parts, stream=False)
+
+    def _reply(self, parts, stream):
+        image = next((p for p in parts if not isinstance(p, str)), None)
+        seed = int(dhash(image), 16) if image is not None else 0
+        text = json.dumps(fake_nutrition(random.Random(seed)))
+        if stream:
+            return [_Reply(text[i:i + 64]) for i in range(0, len(text), 64)]
+        return _Reply(text)
+
+
+def make_provider(name=None):
+    """Provider named by MODEL_PROVIDER (gemini|fake); FAKE_MODEL_* env tunes the fake"""
+    name = (name or os.getenv('MODEL_PROVIDER', 'gemini')).lower()
+    if name == 'fake':
+        return FakeProvider(
+            latency_ms=float(os.getenv('FAKE_MODEL_LATENCY_MS', 0)),
+            jitter_ms=float(os.getenv('FAKE_MODEL_JITTER_MS', 0)),
+            failure_rate=float(os.getenv('FAKE_MODEL_FAILURE_RATE', 0)),
+            seed=int(os.getenv('FAKE_MODEL_SEED', 0)),
+        )
+    if name == 'gemini':
+        return GeminiProvider(os.getenv('GEMINI_MODEL', 'gemini-1.5-flash'), os.getenv('GEMINI_API_KEY'))
+    raise ValueError(f"Unknown MODEL_PROVIDER '{name}'")
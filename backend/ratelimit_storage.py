@@ -0,0 +1,63 @@
+import os
+import threading
+import time
+
+from limits.storage import Storage
+
+from sidecar import file_lock, read_json, write_json
+
+
+class FileStorage(Storage):
+    """Rate-limit counters in one JSON file shared by the host's workers (`file:///path/limits.json`)"""
+
+    STORAGE_SCHEME = ['file']
+
+    def __init__(self, uri=None, wrap_exceptions=False, **options):
+        super().__init__(uri, wrap_exceptions=wrap_exceptions, **options)
+        self.path = uri[len('file://'):]
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+
+    @property
+    def base_exceptions(self):
+        return (OSError, ValueError)
+
+    def _locked(self):
+        return file_lock(self.path, self._lock)
+
+    def _load(self):
+        """{key: [count, expires_at]} without expired keys"""
+        now = time.time()
+        return {k: v for k, v in read_json(self.path, {}).items() if v[1] > now}
+
+    def _save(self, data):
+        write_json(self.path, data)
+
+    def incr(self, key, expiry, amount=1):
+        with self._locked():
+            data = self._load()
+            count, expires_at = data.get(key, (0, time.time() + expiry))
+            data[key] = [count + amount, expires_at]
+            self._save(data)
+            return count + amount
+
+    def get(self, key):
+        return self._load().get(key, (0, 0))[0]
+
+    def get_expiry(self, key):
+        return self._load().get(key, (0, time.time()))[1]
+
+    def check(self):
+        return os.access(os.path.dirname(os.path.abspath(self.path)), os.W_OK)
+
+    def reset(self):
+        with self._locked():
+            count = len(self._load())
+            self._save({})
+            return count
+
+    def clear(self, key):
+        with self._locked():
+            data = self._load()
+            data.pop(key, None)
+            self._save(data)
@@ -0,0 +1,175 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+from sidecar import file_lock, read_json, write_json
+
+
+class MemoryBackend:
+    """Entries and version counters in this process; `ttl` bounds how long other processes' writes go unseen"""
+
+    name = 'memory'
+
+    def __init__(self, max_entries=1024, max_bytes=32 * 1024 * 1024, ttl=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> entry dict
+        self._bytes = 0
+        self._versions = {}            # user_id -> {date: counter}
+        self._lock = threading.Lock()
+
+    def versions(self, user_id):
+        with self._lock:
+            return dict(self._versions.get(user_id, {}))
+
+    def bump(self, user_id, dates):
+        with self._lock:
+            days = self._versions.setdefault(user_id, {})
+            for date in dates:
+                days[date] = days.get(date, 0) + 1
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry['expires_at'] is not None and entry['expires_at'] < time.monotonic():
+                del self._entries[key]
+                self._bytes -= len(entry['body'])
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key, entry):
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= len(old['body'])
+            self._entries[key] = dict(entry, expires_at=time.monotonic() + self.ttl if self.ttl else None)
+            self._bytes += len(entry['body'])
+            while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+                _, dropped = self._entries.popitem(last=False)
+                self._bytes -= len(dropped['body'])
+
+
+class MongoBackend:
+    """Shared by every worker: `response_cache` entries (TTL-expired) and `response_versions` counters"""
+
+    name = 'mongo'
+
+    def __init__(self, db, ttl):
+        self.entries = db['response_cache']
+        self.version_docs = db['response_versions']
+        self.ttl = ttl
+
+    def ensure_indexes(self):
+        self.entries.create_index('created_at', expireAfterSeconds=int(self.ttl))
+
+    def versions(self, user_id):
+        doc = self.version_docs.find_one({'_id': user_id})
+        return doc.get('dates', {}) if doc else {}
+
+    def bump(self, user_id, dates):
+        self.version_docs.update_one(
+            {'_id': user_id}, {'$inc': {f'dates.{date}': 1 for date in set(dates)}}, upsert=True)
+
+    def get(self, key):
+        doc = self.entries.find_one({'_id': key})
+        if not doc:
+            return None
+        return {'stamp': doc['stamp'], 'etag': doc['etag'], 'mimetype': doc['mimetype'], 'body': bytes(doc['body'])}
+
+    def put(self, key, entry):
+        self.entries.replace_one(
+            {'_id': key}, dict(entry, _id=key, created_at=datetime.now(timezone.utc)), upsert=True)
+
+
+class FileBackend:
+    """Local stand-in for the shared store: a directory every worker on the host can see"""
+
+    name = 'file'
+
+    def __init__(self, path, ttl):
+        self.path = path
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        os.makedirs(os.path.join(path, 'versions'), exist_ok=True)
+
+    def _file(self, *parts):
+        return os.path.join(self.path, *parts[:-1], hashlib.sha1(parts[-1].encode('utf-8')).hexdigest() + '.json')
+
+    def versions(self, user_id):
+        return read_json(self._file('versions', user_id)) or {}
+
+    def bump(self, user_id, dates):
+        path = self._file('versions', user_id)
+        with file_lock(path, self._lock):
+            days = read_json(path) or {}
+            for date in set(dates):
+                days[date] = days.get(date, 0) + 1
+            write_json(path, days)
+
+    def get(self, key):
+        doc = read_json(self._file(key))
+        if not doc or doc['expires_at'] < time.time():
+            return None
+        return {'stamp': doc['stamp'], 'etag': doc['etag'], 'mimetype': doc['mimetype'],
+                'body': doc['body'].encode('utf-8')}
+
+    def put(self, key, entry):
+        write_json(self._file(key), dict(entry, body=entry['body'].decode('utf-8'), expires_at=time.time() + self.ttl))
+
+
+class ResponseCache:
+    """Per-user cache of rendered JSON responses, served while the user's version stamp for the range holds"""
+
+    def __init__(self, backend, max_body=1024 * 1024):
+        self.backend = backend
+        self.max_body = max_body
+        self.stats = {'hits': 0, 'misses': 0, 'bumps': 0, 'errors': 0}
+
+    @staticmethod
+    def key(user_id, view, params):
+        digest = hashlib.sha1(json.dumps([view, params], sort_keys=True, default=str).encode('utf-8')).hexdigest()
+        return f"{user_id}:{digest}"
+
+    def stamp(self, user_id, start=None, end=None):
+        """Version of a user's data in the inclusive date range (open ends = all dates)"""
+        versions = self.backend.versions(user_id)
+        return sum(v for d, v in versions.items() if (start is None or d >= start) and (end is None or d <= end))
+
+    def get(self, key, stamp):
+        try:
+            entry = self.backend.get(key)
+        except Exception as e:
+            print(f"Response cache read failed: {str(e)}")
+            self.stats['errors'] += 1
+            entry = None
+        if entry is None or entry['stamp'] != stamp:
+            self.stats['misses'] += 1
+            return None
+        self.stats['hits'] += 1
+        return entry
+
+    def put(self, key, stamp, body, mimetype):
+        entry = {'stamp': stamp, 'etag': hashlib.blake2b(body, digest_size=16).hexdigest(), 'mimetype': mimetype,
+                 'body': body}
+        if len(body) <= self.max_body:
+            try:
+                self.backend.put(key, entry)
+            except Exception as e:
+                print(f"Response cache write failed: {str(e)}")
+                self.stats['errors'] += 1
+        return entry
+
+    def bump(self, user_id, dates):
+        self.stats['bumps'] += 1
+        self.backend.bump(user_id, dates)
+
+    def snapshot(self):
+        return {'backend': self.backend.name, **self.stats}
@@ -0,0 +1,189 @@
+import copy
+from datetime import date, datetime, timedelta, timezone
+
+from sidecar import JsonFile
+
+NUTRITION_TOTAL_KEYS = ('calories', 'protein', 'carbs', 'fat', 'fiber', 'sugar', 'sodium', 'cholesterol')
+
+
+def _key(name):
+    # Nutrient names become Mongo field names, which may not contain '.' or start with '$'
+    return name.replace('.', '_').replace('$', '_')
+
+
+def meal_rollup(nutrition):
+    """The amounts a single meal adds to its day's rollup"""
+    nutrition = nutrition or {}
+    macro = nutrition.get('macronutrients', {})
+    other = nutrition.get('other_nutrients', {})
+    micro = nutrition.get('micronutrients', {})
+    delta = {
+        'meals': 1,
+        'calories': nutrition.get('calories', 0),
+        'protein': macro.get('protein', 0),
+        'carbs': macro.get('carbs', 0),
+        'fat': macro.get('fat', 0),
+        'fiber': macro.get('fiber', 0),
+        'sugar': macro.get('sugar', 0),
+        'sodium': other.get('sodium', 0),
+        'cholesterol': other.get('cholesterol', 0),
+        'vitamins': {},
+        'minerals': {},
+    }
+    for field in ('vitamins', 'minerals'):
+        for item in micro.get(field, []):
+            entry = delta[field].setdefault(_key(item['name']), {'name': item['name'], 'unit': item['unit'], 'amount': 0})
+            entry['amount'] += item['amount']
+    return delta
+
+
+def merge_rollup(target, delta):
+    """Add `delta` into `target` in place"""
+    target['meals'] = target.get('meals', 0) + delta.get('meals', 0)
+    for key in NUTRITION_TOTAL_KEYS:
+        target[key] = target.get(key, 0) + delta.get(key, 0)
+    for field in ('vitamins', 'minerals'):
+        bucket = target.setdefault(field, {})
+        for key, item in delta.get(field, {}).items():
+            if key in bucket:
+                bucket[key]['amount'] += item['amount']
+            else:
+                bucket[key] = dict(item)
+    return target
+
+
+def totals_from_rollups(rollups):
+    """Collapse daily rollups into the totals part of the /api/nutrition response"""
+    merged = {}
+    for rollup in sorted(rollups, key=lambda r: r['date']):
+        merge_rollup(merged, rollup)
+    result = {key: merged.get(key, 0) for key in NUTRITION_TOTAL_KEYS}
+    for field in ('vitamins', 'minerals'):
+        result[field] = [{'name': v['name'], 'amount': v['amount'], 'unit': v['unit']}
+                         for v in merged.get(field, {}).values()]
+    return result
+
+
+def build_rollups(meals):
+    """Group raw meals into {(user_id, date): rollup}"""
+    rollups = {}
+    for meal in meals:
+        key = (meal.get('user_id'), meal.get('date'))
+        rollup = rollups.setdefault(key, {'user_id': key[0], 'date': key[1]})
+        merge_rollup(rollup, meal_rollup(meal.get('nutrition')))
+    return rollups
+
+
+SERIES_BUCKETS = ('day', 'week', 'month')
+SERIES_METRICS = ('meals',) + NUTRITION_TOTAL_KEYS
+
+
+def bucket_start(day, bucket):
+    """First date of the day / week (Monday) / month bucket containing `day`"""
+    if bucket == 'week':
+        return day - timedelta(days=day.weekday())
+    if bucket == 'month':
+        return day.replace(day=1)
+    return day
+
+
+def bucket_starts(start, end, bucket):
+    """ISO start dates of every bucket overlapping [start, end]"""
+    starts = []
+    current = bucket_start(start, bucket)
+    while current <= end:
+        starts.append(current.isoformat())
+        if bucket == 'month':
+            current = current.replace(year=current.year + current.month // 12, month=current.month % 12 + 1)
+        else:
+            current += timedelta(days=7 if bucket == 'week' else 1)
+    return starts
+
+
+def series_from_daily(daily, start, end, bucket, metrics):
+    """Fold per-day sums ({'date', metric: value}) into columns aligned with bucket_starts(), 0 when empty"""
+    starts = bucket_starts(start, end, bucket)
+    index = {d: i for i, d in enumerate(starts)}
+    columns = {m: [0] * len(starts) for m in metrics}
+    for row in daily:
+        day = date.fromisoformat(row['date'])
+        if not start <= day <= end:
+            continue
+        i = index[bucket_start(day, bucket).isoformat()]
+        for m in metrics:
+            columns[m][i] += row.get(m) or 0
+    for values in columns.values():
+        values[:] = [round(v, 2) if isinstance(v, float) else v for v in values]
+    return starts, columns
+
+
+class MongoRollupStore:
+    """daily_rollups collection, one document per (user_id, date)"""
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    def ensure_indexes(self):
+        self.collection.create_index([('user_id', 1), ('date', 1)], unique=True)
+
+    def add_meal(self, user_id, date, nutrition):
+        delta = meal_rollup(nutrition)
+        inc = {key: delta[key] for key in ('meals',) + NUTRITION_TOTAL_KEYS}
+        fields = {}
+        for field in ('vitamins', 'minerals'):
+            for key, item in delta[field].items():
+                inc[f'{field}.{key}.amount'] = item['amount']
+                fields[f'{field}.{key}.name'] = item['name']
+                fields[f'{field}.{key}.unit'] = item['unit']
+        fields['updated_at'] = datetime.now(timezone.utc)
+        self.collection.update_one(
+            {'_id': f'{user_id}:{date}'},
+            {'$inc': inc, '$set': fields, '$setOnInsert': {'user_id': user_id, 'date': date}},
+            upsert=True
+        )
+
+    def get(self, user_id, start, end):
+        """Rollups for a user's dates in [start, end] (ISO strings, inclusive)"""
+        q = {'user_id': user_id, 'date': {'$gte': start, '$lte': end}}
+        return list(self.collection.find(q, {'_id': 0, 'updated_at': 0}))
+
+    def rebuild(self, meals, user_id=None):
+        """Replace rollups (all users, or one) with ones recomputed from `meals`"""
+        rollups = build_rollups(meals)
+        self.collection.delete_many({'user_id': user_id} if user_id else {})
+        now = datetime.now(timezone.utc)
+        docs = [dict(r, _id=f"{r['user_id']}:{r['date']}", updated_at=now) for r in rollups.values()]
+        if docs:
+            self.collection.insert_many(docs, ordered=False)
+        return len(docs)
+
+
+class FileRollupStore:
+    """Sidecar JSON file of rollups for CSV-only deployments: {user_id: {date: rollup}}"""
+
+    def __init__(self, path):
+        self.path = path
+        self.file = JsonFile(path)
+
+    def add_meal(self, user_id, date, nutrition):
+        with self.file.locked():
+            data = copy.deepcopy(self.file.load())
+            day = data.setdefault(user_id, {}).setdefault(date, {'user_id': user_id, 'date': date})
+            merge_rollup(day, meal_rollup(nutrition))
+            self.file.save(data)
+
+    def get(self, user_id, start, end):
+        """Rollups for a user's dates in [start, end] (ISO strings, inclusive)"""
+        days = self.file.load().get(user_id, {})
+        return [day for d, day in days.items() if start <= d <= end]
+
+    def rebuild(self, meals, user_id=None):
+        rollups = build_rollups(meals)
+        with self.file.locked():
+            data = {} if user_id is None else copy.deepcopy(self.file.load())
+            if user_id is not None:
+                data.pop(user_id, None)
+            for (uid, date), rollup in rollups.items():
+                data.setdefault(uid, {})[date] = rollup
+            self.file.save(data)
+        return len(rollups)
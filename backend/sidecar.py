@@ -0,0 +1,86 @@
+"""JSON files shared by the workers on one host: the file-backed stores used without Mongo."""
+import json
+import os
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows dev boxes: fall back to the in-process lock only
+    fcntl = None
+
+
+@contextmanager
+def flock(fh, exclusive=True):
+    """flock() an open file for the duration (a no-op without fcntl)"""
+    if fcntl is None:
+        yield
+        return
+    fcntl.flock(fh, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+    try:
+        yield
+    finally:
+        fcntl.flock(fh, fcntl.LOCK_UN)
+
+
+@contextmanager
+def file_lock(path, thread_lock):
+    """Hold `thread_lock` in this process and an exclusive flock on `path`.lock across processes"""
+    with thread_lock:
+        if fcntl is None:
+            yield
+            return
+        with open(path + '.lock', 'a') as fh, flock(fh):
+            yield
+
+
+def read_json(path, default=None):
+    """The parsed file, or `default` when it is missing or unreadable"""
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return default
+
+
+def write_json(path, data):
+    """Replace the file in one step, so readers see the old or the new document, never a partial one"""
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(data, f)
+    os.replace(tmp, path)
+
+
+class JsonFile:
+    """One JSON document: locked read-modify-write, and a parsed copy reused until the file changes"""
+
+    def __init__(self, path, derive=None, cache=True):
+        self.path = path
+        # Applied to the parsed contents (the missing file reads as {}); load() returns its result
+        self.derive = derive or (lambda data: data)
+        self.cache = cache
+        self._lock = threading.Lock()
+        self._cached = None  # ((inode, mtime, size), derived contents)
+
+    def locked(self):
+        return file_lock(self.path, self._lock)
+
+    def load(self):
+        """Derived contents of the file; treat them as read-only (copy before changing)"""
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return self.derive({})
+        stamp = (st.st_ino, st.st_mtime_ns, st.st_size)
+        if self.cache and self._cached is not None and self._cached[0] == stamp:
+            return self._cached[1]
+        data = read_json(self.path)
+        if data is None:
+            return self.derive({})
+        value = self.derive(data)
+        if self.cache:
+            self._cached = (stamp, value)
+        return value
+
+    def save(self, data):
+        write_json(self.path, data)
@@ -0,0 +1,74 @@
+"""Shared fixtures: the app module on an empty CSV store or an in-memory mongomock database.
+
+    cd backend && pip install -r requirements-dev.txt && python -m pytest -q
+"""
+import io
+import os
+import random
+import sys
+import tempfile
+from datetime import timedelta
+
+import pytest
+from PIL import Image
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+sys.path.insert(0, os.path.join(BACKEND_DIR, 'benchmarks'))
+
+# Read when app is imported: no real Mongo or model, sidecar files out of the source tree
+os.environ.pop('MONGO_URI', None)
+os.environ['DATA_DIR'] = tempfile.mkdtemp(prefix='ahaar-tests-')
+os.environ['MODEL_PROVIDER'] = 'fake'
+os.environ['INSIGHTS_BACKGROUND_REFRESH'] = '0'
+
+import app as ahaar  # noqa: E402
+from analysis_cache import AnalysisCache  # noqa: E402
+from insights import FileInsightStore  # noqa: E402
+from mongomock_store import use_mongomock  # noqa: E402
+from phash_index import FilePhashIndex  # noqa: E402
+from response_cache import MemoryBackend, ResponseCache  # noqa: E402
+from rollups import FileRollupStore  # noqa: E402
+
+# Module-level handles a fixture rebinds; monkeypatch puts the originals back after each test
+STORE_HANDLES = ('mongo_client', 'db', 'users_col', 'meals_col', 'insights_col', 'fs', 'analysis_cache',
+                 'rollup_store', 'phash_index', 'insight_store', 'response_cache', 'csv_store', 'MEALS_CSV',
+                 'MEAL_SCHEMA_VERSION', 'users_index_ready')
+
+
+@pytest.fixture(params=['csv', 'mongo'])
+def store(request, tmp_path, monkeypatch):
+    """The app module with empty stores: meals.csv and sidecars under tmp_path, or mongomock"""
+    for name in STORE_HANDLES:
+        monkeypatch.setattr(ahaar, name, getattr(ahaar, name))
+    monkeypatch.setattr(ahaar.upload_jobs, 'collection', ahaar.upload_jobs.collection)
+    monkeypatch.setattr(ahaar.limiter, 'enabled', False)
+    ahaar.MEALS_CSV = str(tmp_path / 'meals.csv')
+    ahaar.csv_store = ahaar.CsvMealStore(ahaar.MEALS_CSV)
+    ahaar.analysis_cache = AnalysisCache(path=str(tmp_path / 'analysis_cache'))
+    ahaar.rollup_store = FileRollupStore(str(tmp_path / 'daily_rollups.json'))
+    ahaar.phash_index = FilePhashIndex(str(tmp_path / 'phash_index.json'), timedelta(hours=1))
+    ahaar.insight_store = FileInsightStore(str(tmp_path / 'insight_summaries.json'))
+    ahaar.response_cache = ResponseCache(MemoryBackend())
+    if request.param == 'mongo':
+        use_mongomock(ahaar)
+        ahaar.ensure_indexes()
+    return ahaar
+
+
+@pytest.fixture
+def client(store):
+    return store.app.test_client()
+
+
+@pytest.fixture
+def jpeg():
+    """Factory for JPEG bytes of a small photo-like image (4x4 blocks of colour); seeds give unrelated images"""
+    def make(seed=0, size=64):
+        rng = random.Random(seed)
+        cells = Image.frombytes('RGB', (4, 4), bytes(rng.randrange(256) for _ in range(4 * 4 * 3)))
+        image = cells.resize((size, size), Image.Resampling.NEAREST)
+        out = io.BytesIO()
+        image.save(out, 'JPEG')
+        return out.getvalue()
+    return make
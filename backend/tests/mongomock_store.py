@@ -0,0 +1,54 @@
+"""Swap the app's Mongo handles for mongomock (`pip install -r requirements-dev.txt`); also used by benchmarks/."""
+
+
+def _accept_bulk_sort():
+    # pymongo 4.11+ passes `sort` to the bulk builder for ReplaceOne/UpdateOne, which
+    # mongomock's BulkOperationBuilder does not take yet; it is always None for our writes
+    import inspect
+    from mongomock.collection import BulkOperationBuilder
+
+    for name in ('add_replace', 'add_update', 'add_delete'):
+        method = getattr(BulkOperationBuilder, name)
+        if 'sort' in inspect.signature(method).parameters:
+            continue
+
+        def accept_sort(self, *args, _method=method, sort=None, **kwargs):
+            return _method(self, *args, **kwargs)
+        setattr(BulkOperationBuilder, name, accept_sort)
+
+
+def use_mongomock(app):
+    """Point every module-level Mongo handle of the app at a fresh in-memory mongomock database.
+
+    Rebinds what app.py builds when MONGO_URI is set, so no store is left on
+    the CSV or sidecar-file backends.
+    """
+    import gridfs
+    import mongomock
+    import mongomock.gridfs
+    from analysis_cache import AnalysisCache
+    from insights import MongoInsightStore
+    from phash_index import MongoPhashIndex
+    from response_cache import FileBackend, MongoBackend
+    from rollups import MongoRollupStore
+
+    mongomock.gridfs.enable_gridfs_integration()
+    _accept_bulk_sort()
+    client = mongomock.MongoClient()
+    db = client[app.MONGO_DB_NAME]
+    app.mongo_client = client
+    app.db = db
+    app.users_col = db['users']
+    app.meals_col = db['meals']
+    app.insights_col = db['meal_insights']
+    app.fs = gridfs.GridFS(db)
+    cache = app.analysis_cache
+    app.analysis_cache = AnalysisCache(collection=db['analysis_cache'], ttl=cache.ttl,
+                                       max_entries=cache.max_entries, max_bytes=cache.max_bytes)
+    app.rollup_store = MongoRollupStore(db['daily_rollups'])
+    app.phash_index = MongoPhashIndex(app.meals_col)
+    app.insight_store = MongoInsightStore(db['insight_summaries'])
+    app.upload_jobs.collection = db['upload_jobs']
+    if app.response_cache is not None and isinstance(app.response_cache.backend, FileBackend):
+        app.response_cache.backend = MongoBackend(db, app.RESPONSE_CACHE_TTL)
+    return db
@@ -0,0 +1,38 @@
+import io
+
+from PIL import Image
+
+from imaging import preprocess_image
+
+
+def analyze(store, data):
+    image, image_bytes = preprocess_image(data)
+    return store.analyze_food_image(image, image_bytes)
+
+
+def encode(image, quality=85):
+    out = io.BytesIO()
+    image.save(out, 'JPEG', quality=quality)
+    return out.getvalue()
+
+
+def test_reencoded_photo_reuses_the_analysis(store, jpeg):
+    first = analyze(store, jpeg(3))
+    calls = store.analysis_stats['model_calls']
+    # A resized, re-encoded copy: new bytes, same perceptual key
+    again = analyze(store, encode(Image.open(io.BytesIO(jpeg(3))).resize((128, 128)), quality=75))
+    assert store.analysis_stats['model_calls'] == calls
+    assert again == first
+
+
+def test_flat_images_only_match_by_content(store):
+    white, black = encode(Image.new('RGB', (64, 64), 'white')), encode(Image.new('RGB', (64, 64), 'black'))
+    image, image_bytes = preprocess_image(white)
+    assert [k.split(':')[0] for k in store.analysis_cache_keys(image, image_bytes)] == ['sha']
+
+    calls = store.analysis_stats['model_calls']
+    analyze(store, white)
+    analyze(store, black)
+    assert store.analysis_stats['model_calls'] == calls + 2
+    analyze(store, white)
+    assert store.analysis_stats['model_calls'] == calls + 2
@@ -0,0 +1,70 @@
+import asyncio
+import io
+
+import pytest
+from flask import got_request_exception
+from werkzeug.datastructures import FileStorage
+from werkzeug.test import encode_multipart
+
+from asgi_native import NativeApp
+
+
+def call(native, method, path, body=b'', headers=()):
+    """Run one request through the ASGI app: (status, body)"""
+    sent = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': body, 'more_body': False}
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {'type': 'http', 'method': method, 'path': path, 'raw_path': path.encode(), 'query_string': b'',
+             'headers': [(k.encode('latin-1'), v.encode('latin-1')) for k, v in headers],
+             'client': ('127.0.0.1', 50000), 'server': ('testserver', 80), 'scheme': 'http', 'root_path': '',
+             'http_version': '1.1'}
+    asyncio.run(native(scope, receive, send))
+    return sent[0]['status'], b''.join(m.get('body', b'') for m in sent[1:])
+
+
+def test_unhandled_error_in_native_route_is_a_500(store, monkeypatch):
+    native = NativeApp(store.app)
+    monkeypatch.setattr(native, '_handles', lambda name, scope, params: True)
+
+    async def meals(**params):
+        raise RuntimeError('boom')
+
+    monkeypatch.setattr(native, 'meals', meals)
+    raised, torn_down = [], []
+
+    def on_exception(sender, exception, **extra):
+        raised.append(exception)
+
+    monkeypatch.setattr(store.app, 'teardown_request_funcs', {None: [torn_down.append]})
+    got_request_exception.connect(on_exception, store.app)
+    try:
+        status, body = call(native, 'GET', '/api/meals/u1')
+    finally:
+        got_request_exception.disconnect(on_exception, store.app)
+    assert status == 500 and b'Internal Server Error' in body
+    assert [str(e) for e in raised] == ['boom']
+    assert [str(e) for e in torn_down] == ['boom']
+
+
+def test_native_uploads_share_the_upload_rate_limit(store, monkeypatch, jpeg):
+    if store.meals_col is not None:
+        pytest.skip('the native Mongo path needs a server for AsyncMongoClient')
+    monkeypatch.setattr(store.limiter, 'enabled', True)
+    store.limiter.reset()
+    native = NativeApp(store.app)
+    statuses = []
+    for _ in range(6):
+        boundary, body = encode_multipart({
+            'password': store.UPLOAD_PASSWORD,
+            'user_id': 'u1',
+            'image': FileStorage(io.BytesIO(jpeg()), 'meal.jpg', content_type='image/jpeg'),
+        })
+        status, _ = call(native, 'POST', '/api/upload-meal', body, [
+            ('content-type', f'multipart/form-data; boundary={boundary}'), ('content-length', str(len(body)))])
+        statuses.append(status)
+    assert statuses == [200] * 5 + [429]
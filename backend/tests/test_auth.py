@@ -0,0 +1,26 @@
+import pytest
+
+
+def test_duplicate_signup_is_409_without_init_db(store, client):
+    if store.users_col is None:
+        pytest.skip('accounts need Mongo')
+    store.users_col.drop_indexes()
+    user = {'email': 'a@example.com', 'password': 'pw', 'name': 'A'}
+    first = client.post('/api/auth/signup', json=user)
+    assert first.status_code == 200
+    again = client.post('/api/auth/signup', json=dict(user, email='A@example.com '))
+    assert again.status_code == 409
+    assert store.users_col.count_documents({}) == 1
+
+    login = client.post('/api/auth/login', json={'email': 'a@example.com', 'password': 'pw'})
+    assert login.status_code == 200 and login.get_json()['user']['id'] == first.get_json()['user']['id']
+    assert client.post('/api/auth/login', json={'email': 'a@example.com', 'password': 'no'}).status_code == 401
+
+
+def test_init_db_drops_the_superseded_meals_index(store):
+    if store.meals_col is None:
+        pytest.skip('indexes are Mongo only')
+    store.meals_col.create_index([('user_id', 1), ('timestamp', -1)])
+    store.ensure_indexes()
+    indexes = store.meals_col.index_information()
+    assert 'user_id_1_timestamp_-1' not in indexes and 'user_id_1_timestamp_-1_id_-1' in indexes
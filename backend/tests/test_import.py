@@ -0,0 +1,78 @@
+import csv
+import io
+import json
+
+from csv_store import FIELDNAMES
+from meal_io import read_rows
+from synthetic import make_meals
+
+
+def csv_export(rows):
+    out = io.StringIO()
+    writer = csv.DictWriter(out, fieldnames=FIELDNAMES)
+    writer.writeheader()
+    writer.writerows(rows)
+    return out.getvalue().encode('utf-8')
+
+
+def csv_row(meal, **overrides):
+    row = {k: meal[k] for k in FIELDNAMES if k != 'nutrition_json'}
+    row['nutrition_json'] = json.dumps(meal['nutrition'])
+    row.update(overrides)
+    return row
+
+
+def test_read_rows_hands_bad_csv_rows_on_as_errors():
+    good, bad = make_meals('u1', 1, 2, seed=1)
+    data = csv_export([csv_row(good), csv_row(bad, calories='abc')])
+    rows = list(read_rows(io.BytesIO(data), 'csv'))
+    assert rows[0]['id'] == good['id']
+    assert isinstance(rows[1], ValueError) and 'abc' in str(rows[1])
+
+
+def test_import_counts_bad_csv_rows_as_invalid(store, client):
+    meals = make_meals('u1', 2, 2, seed=3)
+    rows = [csv_row(meals[0]), csv_row(meals[1], calories='abc'),
+            csv_row(meals[2], nutrition_json='{not json'), csv_row(meals[3])]
+    resp = client.post('/api/meals/import', data={
+        'password': store.UPLOAD_PASSWORD,
+        'file': (io.BytesIO(csv_export(rows)), 'meals.csv'),
+    })
+    assert resp.status_code == 200
+    stats = resp.get_json()
+    assert (stats['read'], stats['inserted'], stats['invalid'], stats['success']) == (4, 2, 2, False)
+    assert [e.split(':')[0] for e in stats['errors']] == ['row 2', 'row 3']
+
+    listed = client.get('/api/meals/u1?start_date=2000-01-01&end_date=2100-01-01').get_json()['meals']
+    assert sorted(m['id'] for m in listed) == sorted([meals[0]['id'], meals[3]['id']])
+    # Derived data was still updated for the rows that went in
+    rollups = store.rollup_store.get('u1', '2000-01-01', '2100-01-01')
+    assert sum(r['meals'] for r in rollups) == 2
+
+
+def test_import_checks_dates_and_nutrition_before_inserting(store, client):
+    good, slashed, unitless, stringly = make_meals('u1', 1, 4, seed=4)
+    slashed['date'] = slashed['date'].replace('-', '/')
+    unitless['nutrition']['micronutrients']['vitamins'] = [{'name': 'Vitamin C', 'amount': 12}]
+    stringly['nutrition']['calories'] = '100'
+    stringly['nutrition']['macronutrients']['protein'] = '7.5'
+    body = ''.join(json.dumps(m) + '\n' for m in (good, slashed, unitless, stringly)).encode('utf-8')
+    resp = client.post('/api/meals/import', data={
+        'password': store.UPLOAD_PASSWORD,
+        'file': (io.BytesIO(body), 'meals.ndjson'),
+    })
+    assert resp.status_code == 200
+    stats = resp.get_json()
+    assert (stats['read'], stats['inserted'], stats['invalid']) == (4, 3, 1)
+    assert stats['errors'] == ['row 2: user_id and date (YYYY-MM-DD) are required']
+
+    date = good['date']
+    totals = client.get(f'/api/nutrition/u1/daily?date={date}')
+    assert totals.status_code == 200, totals.get_data()
+    meals = {m['id']: m['nutrition'] for m in totals.get_json()['meals']}
+    assert set(meals) == {good['id'], unitless['id'], stringly['id']}
+    assert meals[unitless['id']]['micronutrients']['vitamins'][0]['unit'] == ''
+    assert (meals[stringly['id']]['calories'], meals[stringly['id']]['macronutrients']['protein']) == (100, 7.5)
+    rollups = store.rollup_store.get('u1', date, date)
+    assert [r['meals'] for r in rollups] == [3]
+    assert totals.get_json()['calories'] == sum(meals[i]['calories'] for i in meals)
@@ -0,0 +1,51 @@
+import io
+import threading
+import time
+
+from insights import InsightScheduler, is_fresh
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, 'timed out'
+        time.sleep(0.005)
+
+
+def test_burst_of_uploads_refreshes_each_summary_once():
+    calls = []
+    scheduler = InsightScheduler(lambda *key: calls.append(key), delay=0.05)
+    keys = {('weekly', '2026-03-02'), ('monthly', '2026-03-01')}
+    scheduler.schedule('u1', keys)
+    scheduler.schedule('u1', keys)
+    wait_for(lambda: scheduler.snapshot()['refreshed'] == 2)
+    assert sorted(calls) == sorted(('u1',) + key for key in keys)
+    assert scheduler.snapshot()['scheduled'] == 2 and scheduler.snapshot()['pending'] == 0
+
+
+def test_failed_refresh_is_counted_and_the_worker_goes_on():
+    done = threading.Event()
+
+    def refresh(user_id, period, start):
+        if user_id == 'broken':
+            raise ValueError('bad meal')
+        done.set()
+
+    scheduler = InsightScheduler(refresh, delay=0)
+    scheduler.schedule('broken', {('weekly', '2026-03-02')})
+    wait_for(lambda: scheduler.snapshot()['failed'] == 1)
+    scheduler.schedule('u1', {('weekly', '2026-03-02')})
+    assert done.wait(5)
+    wait_for(lambda: scheduler.snapshot()['refreshed'] == 1)
+
+
+def test_upload_refreshes_its_summaries_in_the_background(store, client, monkeypatch, jpeg):
+    monkeypatch.setattr(store, 'INSIGHTS_BACKGROUND_REFRESH', True)
+    monkeypatch.setattr(store, 'insight_scheduler', InsightScheduler(store.refresh_insights, delay=0))
+    client.post('/api/upload-meal', data={'password': store.UPLOAD_PASSWORD, 'user_id': 'u1', 'date': '2026-03-04',
+                                          'image': (io.BytesIO(jpeg(1)), 'meal.jpg')})
+    wait_for(lambda: store.insight_scheduler.snapshot()['refreshed'] == 2)
+    assert is_fresh(store.insight_store.get('u1', 'weekly', '2026-03-02'))
+    assert is_fresh(store.insight_store.get('u1', 'monthly', '2026-03-01'))
+    body = client.get('/api/insights/u1/weekly?date=2026-03-04').get_json()
+    assert (body['start_date'], body['end_date'], body['meals']) == ('2026-03-02', '2026-03-08', 1)
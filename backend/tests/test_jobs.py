@@ -0,0 +1,41 @@
+import io
+
+from jobs import JobQueue
+
+
+def post_async(client, store, data):
+    return client.post('/api/upload-meal?async=1', data={
+        'password': store.UPLOAD_PASSWORD, 'user_id': 'u1', 'image': (io.BytesIO(data), 'meal.jpg')})
+
+
+def test_async_upload_is_analyzed_by_a_worker(store, client, jpeg):
+    resp = post_async(client, store, jpeg(1))
+    assert resp.status_code == 202 and resp.get_json()['status'] == 'queued'
+    job = client.get(resp.get_json()['status_url'] + '?wait=5').get_json()
+    assert job['status'] == 'done' and not job['fallback']
+    meals = client.get('/api/meals/u1').get_json()['meals']
+    assert [m['id'] for m in meals] == [job['meal']['id']]
+
+
+def test_failed_job_reports_its_error(store, client, monkeypatch, jpeg):
+    def save_meals(analyzed):
+        raise OSError('disk full')
+    monkeypatch.setattr(store, 'save_meals', save_meals)
+    resp = post_async(client, store, jpeg(1))
+    assert resp.status_code == 202
+    job = client.get(resp.get_json()['status_url'] + '?wait=5').get_json()
+    assert job == {'id': resp.get_json()['job_id'], 'status': 'failed', 'error': 'disk full'}
+    assert client.get('/api/meals/u1').get_json()['meals'] == []
+
+
+def test_full_queue_is_503(store, client, monkeypatch, jpeg):
+    # No workers: the one queued job stays put and the next submit finds the queue full
+    monkeypatch.setattr(store, 'upload_jobs', JobQueue(store.process_meal_upload, workers=0, max_queue=1))
+    assert post_async(client, store, jpeg(1)).status_code == 202
+    resp = post_async(client, store, jpeg(2))
+    assert resp.status_code == 503 and resp.headers['Retry-After'] == '5'
+    assert store.upload_jobs.snapshot()['rejected'] == 1
+
+
+def test_unknown_job_is_404(store, client):
+    assert client.get('/api/jobs/no-such-job').status_code == 404
@@ -0,0 +1,41 @@
+import io
+
+UPLOADS_OK = 'ahaar_http_request_duration_seconds_count{method="POST",route="/api/upload-meal",status="200"}'
+UPLOADS_LIMITED = 'ahaar_http_request_duration_seconds_count{method="POST",route="/api/upload-meal",status="429"}'
+RATE_LIMITED = 'ahaar_rate_limited_total{route="/api/upload-meal"}'
+MODEL_CALLS = 'ahaar_stage_duration_seconds_count{stage="model_call"}'
+
+
+def scrape(client):
+    """{series: value} from /api/metrics (the registry is per process, so tests compare differences)"""
+    resp = client.get('/api/metrics')
+    assert resp.status_code == 200 and resp.mimetype == 'text/plain'
+    return {series: float(value) for series, value in
+            (line.rsplit(' ', 1) for line in resp.get_data(as_text=True).splitlines() if not line.startswith('#'))}
+
+
+def post_upload(client, store, data):
+    return client.post('/api/upload-meal', data={
+        'password': store.UPLOAD_PASSWORD, 'user_id': 'u1', 'image': (io.BytesIO(data), 'meal.jpg')})
+
+
+def test_upload_is_timed_by_route_and_stage(store, client, monkeypatch, jpeg):
+    monkeypatch.setattr(store, 'SERVER_TIMING', True)
+    before = scrape(client)
+    resp = post_upload(client, store, jpeg(1))
+    assert resp.status_code == 200
+    assert 'model_call;dur=' in resp.headers['Server-Timing'] and 'total;dur=' in resp.headers['Server-Timing']
+    after = scrape(client)
+    assert after[UPLOADS_OK] - before.get(UPLOADS_OK, 0) == 1
+    assert after[MODEL_CALLS] - before.get(MODEL_CALLS, 0) == 1
+
+
+def test_rate_limited_upload_is_counted(store, client, monkeypatch, jpeg):
+    monkeypatch.setattr(store.limiter, 'enabled', True)
+    store.limiter.reset()
+    before = scrape(client)
+    statuses = [post_upload(client, store, jpeg(seed)).status_code for seed in range(6)]
+    assert statuses == [200] * 5 + [429]
+    after = scrape(client)
+    assert after[RATE_LIMITED] - before.get(RATE_LIMITED, 0) == 1
+    assert after[UPLOADS_LIMITED] - before.get(UPLOADS_LIMITED, 0) == 1
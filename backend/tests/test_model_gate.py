@@ -0,0 +1,116 @@
+import asyncio
+import io
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from limits import parse
+from limits.storage import MemoryStorage
+from limits.strategies import FixedWindowRateLimiter
+
+from model_gate import Coalescer, ModelBusyError, ModelGate
+
+
+def post_upload(client, store, data, **form):
+    return client.post('/api/upload-meal', data=dict(
+        {'password': store.UPLOAD_PASSWORD, 'user_id': 'u1', 'image': (io.BytesIO(data), 'meal.jpg')}, **form))
+
+
+def test_upload_is_503_without_model_capacity(store, client, monkeypatch, jpeg):
+    gate = ModelGate(max_concurrency=1, timeout=0.05)
+    monkeypatch.setattr(store, 'model_gate', gate)
+    fallbacks = store.analysis_stats['fallbacks']
+    with gate.slot():
+        resp = post_upload(client, store, jpeg(1))
+    assert resp.status_code == 503 and resp.headers['Retry-After'] == '5'
+    assert store.analysis_stats['fallbacks'] == fallbacks
+    assert client.get('/api/meals/u1').get_json()['meals'] == []
+
+    # With the slot free again the same upload goes through
+    resp = post_upload(client, store, jpeg(1))
+    assert resp.status_code == 200 and not resp.get_json()['fallback']
+    assert len(client.get('/api/meals/u1').get_json()['meals']) == 1
+
+
+def test_gate_caps_concurrent_calls():
+    gate = ModelGate(max_concurrency=2, timeout=0.05)
+    with gate.slot(), gate.slot():
+        assert gate.snapshot()['in_flight'] == 2
+        with pytest.raises(ModelBusyError):
+            with gate.slot():
+                pass
+    with gate.slot():
+        pass
+    assert gate.snapshot() == {'admitted': 3, 'timeouts': 1, 'waiting': 0, 'in_flight': 0}
+
+
+def test_async_callers_share_the_cap():
+    gate = ModelGate(max_concurrency=1, timeout=0.05)
+
+    async def call():
+        async with gate.async_slot():
+            return True
+
+    with gate.slot():
+        with pytest.raises(ModelBusyError):
+            asyncio.run(call())
+    assert asyncio.run(call())
+
+
+def test_gate_rate_is_taken_from_the_shared_storage():
+    storage = MemoryStorage()
+    gates = [ModelGate(rate=parse('2 per minute'), strategy=FixedWindowRateLimiter(storage), timeout=0.05)
+             for _ in range(2)]
+    # Two gates (two workers) on one storage: the rate is for both together
+    with gates[0].slot(), gates[1].slot():
+        pass
+    with pytest.raises(ModelBusyError):
+        with gates[1].slot():
+            pass
+
+
+def test_concurrent_calls_for_one_key_share_the_result():
+    coalescer = Coalescer()
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def analyze():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return {'food_name': 'Dal'}
+
+    with ThreadPoolExecutor(2) as pool:
+        leader = pool.submit(coalescer.run, 'img', analyze)
+        started.wait(5)
+        follower = pool.submit(coalescer.run, 'img', analyze)
+        while coalescer.coalesced == 0:
+            time.sleep(0.001)
+        release.set()
+        assert leader.result() == ({'food_name': 'Dal'}, False)
+        assert follower.result() == ({'food_name': 'Dal'}, True)
+    assert len(calls) == 1 and coalescer.in_flight() == 0
+
+
+def test_followers_get_the_leaders_error():
+    coalescer = Coalescer()
+    started, release = threading.Event(), threading.Event()
+
+    def analyze():
+        started.set()
+        release.wait(5)
+        raise ModelBusyError('No model capacity within 0.05s')
+
+    with ThreadPoolExecutor(2) as pool:
+        leader = pool.submit(coalescer.run, 'img', analyze)
+        started.wait(5)
+        follower = pool.submit(coalescer.run, 'img', analyze)
+        while coalescer.coalesced == 0:
+            time.sleep(0.001)
+        release.set()
+        for future in (leader, follower):
+            with pytest.raises(ModelBusyError):
+                future.result()
+    # The failure is not remembered: the next call runs again
+    assert coalescer.run('img', lambda: 1) == (1, False)
@@ -0,0 +1,29 @@
+import io
+
+
+def post_upload(client, store, data, **form):
+    return client.post('/api/upload-meal', data=dict(
+        {'password': store.UPLOAD_PASSWORD, 'user_id': 'u1', 'image': (io.BytesIO(data), 'meal.jpg')}, **form))
+
+
+def test_reupload_reuses_the_earlier_meal(store, client, jpeg):
+    first = post_upload(client, store, jpeg(1)).get_json()['meal']
+    body = post_upload(client, store, jpeg(1), on_duplicate='reuse').get_json()
+    assert body['reused'] and body['meal']['duplicate_of'] == first['id']
+    assert body['meal']['id'] != first['id'] and body['nutrition'] == first['nutrition']
+    assert len(client.get('/api/meals/u1').get_json()['meals']) == 2
+
+
+def test_reupload_is_409_when_rejecting_duplicates(store, client, jpeg):
+    first = post_upload(client, store, jpeg(1)).get_json()['meal']
+    resp = post_upload(client, store, jpeg(1), on_duplicate='reject')
+    assert resp.status_code == 409
+    assert [m['id'] for m in resp.get_json()['near_duplicates']] == [first['id']]
+    # Another user's meal and an unrelated photo are not duplicates
+    assert post_upload(client, store, jpeg(1), on_duplicate='reject', user_id='u2').status_code == 200
+    assert post_upload(client, store, jpeg(2), on_duplicate='reject').status_code == 200
+    assert len(client.get('/api/meals/u1').get_json()['meals']) == 2
+
+
+def test_unknown_duplicate_policy_is_400(store, client, jpeg):
+    assert post_upload(client, store, jpeg(1), on_duplicate='merge').status_code == 400
@@ -0,0 +1,124 @@
+"""Reads of stored meals in either storage schema (meal_schema.py) match the Python reference.
+
+The same assertions as benchmarks/check_nutrition_parity.py, through the API,
+for meals.csv and for Mongo documents in schema 1, schema 2 or a mix of both.
+"""
+import json
+from datetime import datetime
+
+import pytest
+
+from meal_schema import encode_meal, insights_document
+from synthetic import make_meals
+
+END = datetime(2025, 3, 31)
+WINDOWS = {
+    'daily': '?date=2025-03-31',
+    'weekly': '?start_date=2025-03-25&end_date=2025-03-31',
+    'monthly': '?start_date=2025-03-01&end_date=2025-03-31',
+}
+
+
+def history():
+    return make_meals('u1', 40, 3, end=END, seed=1) + make_meals('u2', 10, 1, end=END, seed=2)
+
+
+def seed(store, meals, schema):
+    """Store `meals` as `schema` ('1', '2' or 'mixed', alternating) and build their rollups"""
+    if store.meals_col is None:
+        if schema != '1':
+            pytest.skip('meals.csv has a single schema')
+        store.csv_store.append_many(meals)
+    else:
+        docs, insights = [], []
+        for i, meal in enumerate(meals):
+            doc, advanced = dict(meal), None
+            if schema == '2' or (schema == 'mixed' and i % 2):
+                doc, advanced = encode_meal(meal)
+            docs.append(doc)
+            if advanced is not None:
+                insights.append(insights_document(doc, advanced))
+        store.meals_col.insert_many(docs)
+        store.save_insights(insights)
+    store.rebuild_rollups()
+
+
+def canonical(value):
+    """`value` with vitamin/mineral lists in name order: schema 2 returns them in dictionary order"""
+    if isinstance(value, dict):
+        return {k: sorted((canonical(v) for v in item), key=lambda v: v['name'])
+                if k in ('vitamins', 'minerals') else canonical(item) for k, item in value.items()}
+    if isinstance(value, list):
+        return [canonical(v) for v in value]
+    if isinstance(value, float):
+        return round(value, 6)
+    return value
+
+
+def window_dates(query):
+    params = dict(p.split('=') for p in query[1:].split('&'))
+    return params.get('start_date', params.get('date')), params.get('end_date', params.get('date'))
+
+
+@pytest.mark.parametrize('schema', ['1', '2', 'mixed'])
+@pytest.mark.parametrize('use_rollups', [False, True])
+def test_nutrition_totals_match_python(store, client, monkeypatch, schema, use_rollups):
+    meals = history()
+    seed(store, meals, schema)
+    monkeypatch.setattr(store, 'USE_DAILY_ROLLUPS', use_rollups)
+    for period, query in WINDOWS.items():
+        resp = client.get(f'/api/nutrition/u1/{period}{query}')
+        assert resp.status_code == 200, resp.get_data()
+        first, last = window_dates(query)
+        expected = store.aggregate_nutrition(meals, 'u1', first, last)
+        assert expected['meals'], period
+        assert canonical(resp.get_json()) == canonical(expected), period
+
+
+@pytest.mark.parametrize('schema', ['1', '2', 'mixed'])
+def test_meals_and_export_read_back_as_stored(store, client, schema):
+    meals = history()
+    seed(store, meals, schema)
+    stored = {m['id']: m for m in meals if m['user_id'] == 'u1'}
+
+    listed = client.get('/api/meals/u1?start_date=2000-01-01&end_date=2100-01-01&fields=id,nutrition').get_json()
+    assert canonical({m['id']: m['nutrition'] for m in listed['meals']}) == \
+        canonical({i: m['nutrition'] for i, m in stored.items()})
+
+    exported = [json.loads(line) for line in client.get('/api/meals/u1/export').get_data().splitlines()]
+    assert [m['id'] for m in exported] == [m['id'] for m in meals if m['user_id'] == 'u1']
+    assert canonical(exported) == canonical([stored[m['id']] for m in exported])
+
+
+def test_migration_keeps_responses_and_reverts(store, client):
+    if store.meals_col is None:
+        pytest.skip('meals.csv has a single schema')
+    meals = history()
+    seed(store, meals, '1')
+    urls = [f'/api/nutrition/u1/{period}{query}' for period, query in WINDOWS.items()]
+    urls.append('/api/meals/u1?fields=id,nutrition&limit=50')
+    before = {url: canonical(client.get(url).get_json()) for url in urls}
+
+    stats = store.migrate_meals(2, batch_size=25)
+    assert stats['migrated'] == len(meals) and stats['bytes_after'] < stats['bytes_before']
+    assert store.meals_col.count_documents({'schema': 2}) == len(meals)
+    assert store.migrate_meals(2)['migrated'] == 0
+    assert {url: canonical(client.get(url).get_json()) for url in urls} == before
+
+    store.migrate_meals(1)
+    restored = {d['id']: d for d in store.meals_col.find({}, {'_id': 0})}
+    # Lossless except vitamin/mineral order, which stays in dictionary order
+    assert canonical(restored) == canonical({m['id']: m for m in meals})
+    assert store.insights_col.count_documents({}) == 0
+
+
+def test_date_range_is_inclusive_and_capped(store, client):
+    meals = history()
+    seed(store, meals, '1')
+    body = client.get('/api/nutrition/u1/weekly?start_date=2025-03-25&end_date=2025-03-31').get_json()
+    inside = [m for m in meals if m['user_id'] == 'u1' and '2025-03-25' <= m['date'] <= '2025-03-31']
+    assert {m['date'] for m in inside} >= {'2025-03-25', '2025-03-31'}
+    assert sorted(m['id'] for m in body['meals']) == sorted(m['id'] for m in inside)
+
+    resp = client.get('/api/nutrition/u1/monthly?start_date=2024-01-01&end_date=2025-03-31')
+    assert resp.status_code == 400 and '/api/nutrition/u1/series' in resp.get_json()['error']
@@ -0,0 +1,34 @@
+import json
+import time
+
+from response_cache import MemoryBackend, ResponseCache
+from synthetic import make_meals
+
+
+def test_memory_entries_expire():
+    cache = ResponseCache(MemoryBackend(ttl=0.05))
+    key = cache.key('u1', 'meals', {})
+    cache.put(key, 0, b'{}', 'application/json')
+    assert cache.get(key, 0) is not None
+    time.sleep(0.1)
+    assert cache.get(key, 0) is None
+    assert cache.backend._bytes == 0
+
+
+def test_large_meals_page_streams_uncached(store, client):
+    meals = make_meals('u1', 10, 3)
+    if store.meals_col is not None:
+        store.meals_col.insert_many([dict(m) for m in meals])
+    else:
+        store.csv_store.append_many(meals)
+    full = client.get('/api/meals/u1?fields=id,nutrition')
+    assert len(json.loads(full.get_data())['meals']) == len(meals)
+
+    store.response_cache = ResponseCache(MemoryBackend(), max_body=len(full.get_data()) // 2)
+    resp = client.get('/api/meals/u1?fields=id,nutrition')
+    assert resp.is_streamed and 'ETag' not in resp.headers
+    assert resp.get_data() == full.get_data()
+    assert store.response_cache.backend._entries == {}
+
+    small = client.get('/api/meals/u1?fields=id&limit=2')
+    assert small.headers.get('ETag') and len(store.response_cache.backend._entries) == 1
@@ -0,0 +1,30 @@
+import io
+import json
+
+
+def stream_upload(client, store, data):
+    resp = client.post('/api/upload-meal?stream=1', data={
+        'password': store.UPLOAD_PASSWORD, 'user_id': 'u1', 'image': (io.BytesIO(data), 'meal.jpg')})
+    assert resp.status_code == 200 and resp.mimetype == 'text/event-stream'
+    events = []
+    for block in resp.get_data(as_text=True).split('\n\n'):
+        lines = dict(line.split(': ', 1) for line in block.splitlines() if not line.startswith(':'))
+        if lines:
+            events.append((lines['event'], json.loads(lines['data'])))
+    return events
+
+
+def test_stream_sends_partial_fields_then_the_meal(store, client, jpeg):
+    events = stream_upload(client, store, jpeg(1))
+    names = [name for name, _ in events]
+    assert names[-1] == 'meal' and set(names[:-1]) == {'partial'}
+    meal = events[-1][1]['meal']
+    partial = {k: v for _, fields in events[:-1] for k, v in fields.items()}
+    assert partial == {'food_name': meal['name'], 'calories': meal['calories']}
+    assert [m['id'] for m in client.get('/api/meals/u1').get_json()['meals']] == [meal['id']]
+
+
+def test_stream_ends_with_an_error_event(store, client):
+    events = stream_upload(client, store, b'not an image')
+    assert len(events) == 1 and events[0][0] == 'error' and 'Unreadable image' in events[0][1]['error']
+    assert client.get('/api/meals/u1').get_json()['meals'] == []
@@ -0,0 +1,40 @@
+import io
+import time
+
+import jwt
+
+from token_cache import ClaimsCache
+
+
+def test_entries_expire_with_the_token_and_are_bounded():
+    cache = ClaimsCache(max_entries=2)
+    now = time.time()
+    cache.put('a', {'user_id': 'a', 'exp': now + 60})
+    cache.put('expired', {'user_id': 'x', 'exp': now - 1})
+    cache.put('no-exp', {'user_id': 'n'})
+    assert cache.get('a') == {'user_id': 'a', 'exp': now + 60}
+    assert cache.get('expired') is None and cache.get('no-exp') is None
+    cache.put('b', {'user_id': 'b', 'exp': now + 60})
+    cache.put('c', {'user_id': 'c', 'exp': now + 60})
+    assert cache.snapshot() == {'entries': 2, 'hits': 1, 'misses': 2, 'evictions': 1}
+
+
+def post_upload(client, data, token):
+    return client.post('/api/upload-meal', headers={'Authorization': f'Bearer {token}'},
+                       data={'image': (io.BytesIO(data), 'meal.jpg')})
+
+
+def test_repeat_requests_reuse_verified_claims(store, client, monkeypatch, jpeg):
+    monkeypatch.setattr(store, 'claims_cache', ClaimsCache())
+    token = store.create_token('u7', 'u7@example.com')
+    for seed in (1, 2):
+        resp = post_upload(client, jpeg(seed), token)
+        assert resp.status_code == 200 and resp.get_json()['meal']['user_id'] == 'u7'
+    assert store.claims_cache.snapshot() == {'entries': 1, 'hits': 1, 'misses': 1, 'evictions': 0}
+
+
+def test_forged_token_is_rejected_and_not_cached(store, client, monkeypatch, jpeg):
+    monkeypatch.setattr(store, 'claims_cache', ClaimsCache())
+    forged = jwt.encode({'user_id': 'u7', 'exp': time.time() + 60}, 'not-the-secret', algorithm='HS256')
+    assert post_upload(client, jpeg(1), forged).status_code == 401
+    assert store.claims_cache.snapshot()['entries'] == 0
@@ -0,0 +1,67 @@
+import io
+
+import pytest
+from pymongo.errors import BulkWriteError
+
+
+def images(jpeg, count, first_seed=0):
+    return [(io.BytesIO(jpeg(first_seed + i)), f'meal{i}.jpg') for i in range(count)]
+
+
+def upload_batch(client, store, files, **form):
+    return client.post('/api/upload-meals', data=dict(
+        {'password': store.UPLOAD_PASSWORD, 'user_id': 'u1', 'image': files}, **form))
+
+
+def test_largest_batch_fits_the_upload_rate_limit(store, client, monkeypatch, jpeg):
+    monkeypatch.setattr(store.limiter, 'enabled', True)
+    store.limiter.reset()
+    assert store.MAX_BATCH_IMAGES == 5
+
+    resp = upload_batch(client, store, images(jpeg, store.MAX_BATCH_IMAGES + 1))
+    assert resp.status_code == 400 and 'At most 5 images' in resp.get_json()['error']
+    # The rejected batch charged nothing: a full one still fits the window, and then the window is spent
+    resp = upload_batch(client, store, images(jpeg, store.MAX_BATCH_IMAGES))
+    assert resp.status_code == 200 and resp.get_json()['uploaded'] == 5
+    assert upload_batch(client, store, images(jpeg, 1, 10)).status_code == 429
+
+
+def test_batch_saves_every_image_with_its_own_date(store, client, jpeg):
+    resp = upload_batch(client, store, images(jpeg, 3), date=['2026-03-01', '2026-03-02', '2026-03-03'])
+    body = resp.get_json()
+    assert resp.status_code == 200 and body['success'] and (body['uploaded'], body['failed']) == (3, 0)
+    assert [r['index'] for r in body['results']] == [0, 1, 2]
+    assert [r['meal']['date'] for r in body['results']] == ['2026-03-01', '2026-03-02', '2026-03-03']
+    meals = client.get('/api/meals/u1').get_json()['meals']
+    assert sorted(m['id'] for m in meals) == sorted(r['meal']['id'] for r in body['results'])
+
+
+def test_unreadable_image_fails_alone_in_a_batch(store, client, jpeg):
+    files = images(jpeg, 2) + [(io.BytesIO(b'not an image'), 'broken.jpg')]
+    body = upload_batch(client, store, files).get_json()
+    assert not body['success'] and (body['uploaded'], body['failed']) == (2, 1)
+    broken = body['results'][2]
+    assert broken['filename'] == 'broken.jpg' and not broken['success'] and 'Unreadable image' in broken['error']
+    assert len(client.get('/api/meals/u1').get_json()['meals']) == 2
+
+
+def test_images_of_meals_the_insert_rejected_are_removed(store, client, monkeypatch, jpeg):
+    if store.meals_col is None:
+        pytest.skip('images are stored in GridFS with Mongo only')
+    earlier = upload_batch(client, store, images(jpeg, 1, 7)).get_json()['results'][0]['meal']
+    insert_many = store.meals_col.insert_many
+
+    def reject_all_but_first(docs, ordered=True):
+        insert_many(docs[:1], ordered=ordered)
+        raise BulkWriteError({'writeErrors': [{'index': i, 'errmsg': 'E11000 duplicate key'}
+                                              for i in range(1, len(docs))]})
+    monkeypatch.setattr(store.meals_col, 'insert_many', reject_all_but_first)
+
+    # The last image reuses the earlier meal's file, which must survive its failed insert
+    body = upload_batch(client, store, images(jpeg, 2) + images(jpeg, 1, 7), on_duplicate='reuse').get_json()
+    assert [r['success'] for r in body['results']] == [True, False, False]
+    assert body['results'][2]['error'] == 'E11000 duplicate key'
+    saved = store.meals_col.find({}, {'image.file_id': 1, '_id': 0})
+    stored = {str(f['_id']) for f in store.db['fs.files'].find({}, {'_id': 1})}
+    assert stored == {m['image']['file_id'] for m in saved}
+    assert earlier['id'] in {m['id'] for m in client.get('/api/meals/u1').get_json()['meals']}